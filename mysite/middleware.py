@@ -0,0 +1,201 @@
+"""
+Per-request instrumentation.
+
+ServerTimingMiddleware counts the SQL statements a request runs and how long
+they take, times template rendering and the view, and reports the numbers in
+a ``Server-Timing`` response header so they show up in the browser's network
+panel.  Requests over ``REQUEST_QUERY_BUDGET`` queries or
+``REQUEST_TIME_BUDGET_MS`` milliseconds are logged with the statements they
+ran most often, which is usually enough to spot an N+1 query.
+
+ProfilingMiddleware runs a single staff request under cProfile when it is
+asked for with ``?_profile=1`` or an ``X-Profile: 1`` header, and saves the
+profile and the request's SQL with where each statement came from (see
+``mysite.profiling``).  Staff find the saved profiles at ``/admin/profiles/``.
+
+Both middlewares run natively under both WSGI and ASGI, so they never force
+async views back onto a worker thread.
+"""
+import cProfile
+import logging
+import re
+import time
+from collections import Counter
+from contextlib import ExitStack
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.db import connections
+
+from . import profiling
+
+logger = logging.getLogger(__name__)
+
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r'\b\d+(?:\.\d+)?\b')
+_IN_LIST = re.compile(r'\bIN \((?:\s*(?:%s|\?)\s*,?)+\)', re.IGNORECASE)
+_SPACE = re.compile(r'\s+')
+
+
+def fingerprint(sql):
+    """Reduce a SQL statement to its shape, so repeats with different values count as one."""
+    sql = _STRING.sub('?', sql)
+    sql = _NUMBER.sub('?', sql)
+    sql = _IN_LIST.sub('IN (...)', sql)
+    return _SPACE.sub(' ', sql).strip()
+
+
+class RequestMetrics:
+    """Timings collected for one request; also used as a database execute wrapper."""
+
+    def __init__(self):
+        self.queries = 0
+        self.sql_seconds = 0.0
+        self.template_seconds = 0.0
+        self.statements = Counter()
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.sql_seconds += time.perf_counter() - start
+            self.queries += 1
+            self.statements[fingerprint(sql)] += 1
+
+
+class ServerTimingMiddleware:
+    """Add a Server-Timing header and log requests that exceed the query or latency budget."""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        metrics = RequestMetrics()
+        request.metrics = metrics
+        start = time.perf_counter()
+        with ExitStack() as stack:
+            self.wrap_connections(stack, metrics)
+            response = self.get_response(request)
+        return self.report(request, response, metrics, start)
+
+    async def __acall__(self, request):
+        metrics = RequestMetrics()
+        request.metrics = metrics
+        start = time.perf_counter()
+        stack = ExitStack()
+        # Connections belong to the thread that the async ORM runs queries on,
+        # which is the one thread-sensitive sync_to_async uses for this request.
+        await sync_to_async(self.wrap_connections)(stack, metrics)
+        try:
+            response = await self.get_response(request)
+        finally:
+            await sync_to_async(stack.close)()
+        return self.report(request, response, metrics, start)
+
+    @staticmethod
+    def wrap_connections(stack, metrics):
+        for connection in connections.all():
+            stack.enter_context(connection.execute_wrapper(metrics))
+
+    def report(self, request, response, metrics, start):
+        total_ms = (time.perf_counter() - start) * 1000
+        template_ms = metrics.template_seconds * 1000
+
+        response['Server-Timing'] = ', '.join([
+            f'db;dur={metrics.sql_seconds * 1000:.1f};desc="{metrics.queries} queries"',
+            f'tpl;dur={template_ms:.1f}',
+            f'view;dur={total_ms - template_ms:.1f}',
+            f'total;dur={total_ms:.1f}',
+        ])
+        if metrics.queries > settings.REQUEST_QUERY_BUDGET or total_ms > settings.REQUEST_TIME_BUDGET_MS:
+            top = '\n'.join(f'  {count} x {sql}' for sql, count in metrics.statements.most_common(5))
+            logger.warning('%s %s took %.0f ms and ran %d queries (budget: %d ms, %d queries)\n%s',
+                           request.method, request.path, total_ms, metrics.queries,
+                           settings.REQUEST_TIME_BUDGET_MS, settings.REQUEST_QUERY_BUDGET, top)
+        return response
+
+    def process_template_response(self, request, response):
+        """Time the deferred render of a TemplateResponse; ``render()`` in a view counts as view time."""
+        render = response.render
+        metrics = request.metrics
+
+        def timed_render():
+            start = time.perf_counter()
+            try:
+                return render()
+            finally:
+                metrics.template_seconds += time.perf_counter() - start
+
+        response.render = timed_render
+        return response
+
+
+class ProfilingMiddleware:
+    """
+    Profile staff requests that ask for it and save the result to ``PROFILE_DIR``.
+
+    The response carries the id of the saved profile in an ``X-Profile-Id``
+    header.  Under ASGI only code running on the event loop is profiled;
+    sync code that async views hand to worker threads is not, although its
+    SQL is still recorded.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    @staticmethod
+    def requested(request):
+        asked = request.GET.get('_profile') == '1' or request.headers.get('X-Profile') == '1'
+        return asked and settings.PROFILE_KEEP > 0
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if not (self.requested(request) and request.user.is_staff):
+            return self.get_response(request)
+        recorder = profiling.SQLRecorder()
+        profiler = cProfile.Profile()
+        start = time.perf_counter()
+        with ExitStack() as stack:
+            ServerTimingMiddleware.wrap_connections(stack, recorder)
+            profiler.enable()
+            try:
+                response = self.get_response(request)
+            finally:
+                profiler.disable()
+        return self.save(request, response, profiler, recorder, start)
+
+    async def __acall__(self, request):
+        if not (self.requested(request) and (await request.auser()).is_staff):
+            return await self.get_response(request)
+        recorder = profiling.SQLRecorder()
+        profiler = cProfile.Profile()
+        start = time.perf_counter()
+        stack = ExitStack()
+        await sync_to_async(ServerTimingMiddleware.wrap_connections)(stack, recorder)
+        profiler.enable()
+        try:
+            response = await self.get_response(request)
+        finally:
+            profiler.disable()
+            await sync_to_async(stack.close)()
+        return await sync_to_async(self.save)(request, response, profiler, recorder, start)
+
+    @staticmethod
+    def save(request, response, profiler, recorder, start):
+        profile_id = profiling.save(request, response, profiler, recorder, time.perf_counter() - start)
+        response['X-Profile-Id'] = profile_id
+        return response
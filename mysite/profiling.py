@@ -0,0 +1,147 @@
+"""
+Storage for request profiles taken by ProfilingMiddleware.
+
+Each profile is a pair of files in ``PROFILE_DIR``: ``<id>.prof``, the raw
+cProfile data that ``python -m pstats`` or snakeviz can open, and
+``<id>.json`` with the request, its timing and every SQL statement it ran
+along with where it came from.  Only the newest ``PROFILE_KEEP`` profiles
+are kept.
+"""
+import io
+import json
+import os
+import pstats
+import re
+import sys
+import sysconfig
+import time
+
+from django.conf import settings
+
+PROFILE_ID = re.compile(r'^[\w-]+$')
+
+# Frames from these are library or instrumentation code, not where a query came from.
+_LIBRARY_DIRS = tuple({sysconfig.get_paths()[name] for name in ('stdlib', 'purelib', 'platlib')})
+_OWN_FILES = {__file__, os.path.join(os.path.dirname(__file__), 'middleware.py')}
+
+
+def origin(limit=8):
+    """
+    Return where the current SQL statement came from, outermost first.
+
+    Frames in project code are listed as ``path:line in function``; template
+    nodes being rendered are listed as ``template_name:line``, so a query run
+    by a ``{% for %}`` over a queryset points at the template line.
+    """
+    base = str(settings.BASE_DIR) + os.sep
+    frames = []
+    frame = sys._getframe(1)
+    while frame is not None:
+        filename = frame.f_code.co_filename
+        if frame.f_code.co_name == 'render_annotated' and 'self' in frame.f_locals:
+            node = frame.f_locals['self']
+            template = getattr(getattr(node, 'origin', None), 'template_name', None)
+            token = getattr(node, 'token', None)
+            if template and token is not None:
+                entry = f'{template}:{token.lineno}'
+                if not frames or frames[-1] != entry:
+                    frames.append(entry)
+        elif filename.startswith(base) and not filename.startswith(_LIBRARY_DIRS) and filename not in _OWN_FILES:
+            frames.append(f'{os.path.relpath(filename, base)}:{frame.f_lineno} in {frame.f_code.co_name}')
+        frame = frame.f_back
+    return list(reversed(frames[:limit]))
+
+
+class SQLRecorder:
+    """Database execute wrapper that records each statement with its duration and origin."""
+
+    def __init__(self):
+        self.queries = []
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries.append({
+                'sql': sql,
+                'ms': round((time.perf_counter() - start) * 1000, 3),
+                'stack': origin(),
+            })
+
+
+def save(request, response, profiler, recorder, seconds):
+    """
+    Write a request's profile and SQL log, then drop the oldest profiles over ``PROFILE_KEEP``.
+
+    Returns:
+        str: The profile id.
+    """
+    directory = settings.PROFILE_DIR
+    os.makedirs(directory, exist_ok=True)
+    # Ids sort by time, so retention and listing only need the names.
+    now = time.time_ns()
+    profile_id = f'{time.strftime("%Y%m%d-%H%M%S", time.localtime(now // 10**9))}-{now % 10**9:09d}'
+    profiler.dump_stats(os.path.join(directory, f'{profile_id}.prof'))
+    with open(os.path.join(directory, f'{profile_id}.json'), 'w') as fh:
+        json.dump({
+            'id': profile_id,
+            'method': request.method,
+            'path': request.get_full_path(),
+            'user': request.user.get_username(),
+            'status': response.status_code,
+            'ms': round(seconds * 1000, 1),
+            'sql_ms': round(sum(query['ms'] for query in recorder.queries), 1),
+            'queries': recorder.queries,
+        }, fh)
+    prune(settings.PROFILE_KEEP)
+    return profile_id
+
+
+def prune(keep):
+    """Delete all but the newest ``keep`` profiles."""
+    for profile_id in ids()[keep:]:
+        for suffix in ('.json', '.prof'):
+            try:
+                os.remove(os.path.join(settings.PROFILE_DIR, profile_id + suffix))
+            except FileNotFoundError:
+                pass
+
+
+def ids():
+    """Return the stored profile ids, newest first."""
+    try:
+        names = os.listdir(settings.PROFILE_DIR)
+    except FileNotFoundError:
+        return []
+    return sorted((name[:-5] for name in names if name.endswith('.json')), reverse=True)
+
+
+def load(profile_id):
+    """Return a stored profile's metadata and SQL log, or None if there is no such profile."""
+    if not PROFILE_ID.match(profile_id):
+        return None
+    try:
+        with open(os.path.join(settings.PROFILE_DIR, f'{profile_id}.json')) as fh:
+            return json.load(fh)
+    except FileNotFoundError:
+        return None
+
+
+def recent():
+    """Return the metadata of the stored profiles, newest first, without their SQL."""
+    profiles = []
+    for profile_id in ids():
+        profile = load(profile_id)
+        if profile is not None:
+            profile['query_count'] = len(profile.pop('queries'))
+            profiles.append(profile)
+    return profiles
+
+
+def stats_text(profile_id, sort='cumulative', limit=40):
+    """Return the top of a profile's pstats report as text."""
+    stream = io.StringIO()
+    stats = pstats.Stats(os.path.join(settings.PROFILE_DIR, f'{profile_id}.prof'), stream=stream)
+    stats.strip_dirs().sort_stats(sort).print_stats(limit)
+    return stream.getvalue()
@@ -10,7 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/dev/ref/settings/
 """
 import os
-from decouple import config
+from decouple import Csv, config
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -23,9 +23,9 @@ BASE_DIR = Path(__file__).resolve().parent.parent
 SECRET_KEY = config('SECRET_KEY', default='fake-secret-key')
 
 # SECURITY WARNING: don't run with debug turned on in production!
-DEBUG = True
+DEBUG = config('DEBUG', default=True, cast=bool)
 
-ALLOWED_HOSTS = []
+ALLOWED_HOSTS = config('ALLOWED_HOSTS', default='', cast=Csv())
 
 # Application definition
 
@@ -40,6 +40,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'mysite.middleware.ServerTimingMiddleware',
+    'polls.routers.PinPrimaryMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -47,8 +49,18 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'mysite.middleware.ProfilingMiddleware',
 ]
 
+# Requests over either budget are logged by ServerTimingMiddleware with their most frequent SQL.
+REQUEST_QUERY_BUDGET = config('REQUEST_QUERY_BUDGET', default=20, cast=int)
+REQUEST_TIME_BUDGET_MS = config('REQUEST_TIME_BUDGET_MS', default=500, cast=int)
+
+# Staff requests with ?_profile=1 or an "X-Profile: 1" header are profiled by
+# ProfilingMiddleware into PROFILE_DIR, keeping the newest PROFILE_KEEP (0 turns it off).
+PROFILE_DIR = config('PROFILE_DIR', default=str(BASE_DIR / 'profiles'))
+PROFILE_KEEP = config('PROFILE_KEEP', default=50, cast=int)
+
 ROOT_URLCONF = 'mysite.urls'
 
 TEMPLATES = [
@@ -67,24 +79,160 @@ TEMPLATES = [
     },
 ]
 
+if not DEBUG:
+    # Parse each template once per process in production.
+    TEMPLATES[0]['APP_DIRS'] = False
+    TEMPLATES[0]['OPTIONS']['loaders'] = [
+        ('django.template.loaders.cached.Loader', [
+            'django.template.loaders.filesystem.Loader',
+            'django.template.loaders.app_directories.Loader',
+        ]),
+    ]
+
 WSGI_APPLICATION = 'mysite.wsgi.application'
 
 # Database
 # https://docs.djangoproject.com/en/dev/ref/settings/#databases
 
+# Transactions take the write lock at BEGIN, so concurrent voters wait up to
+# "timeout" seconds for their turn instead of failing with "database is locked"
+# when a vote's read is upgraded to a write.
 DATABASES = {
     'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
+        'ENGINE': 'mysite.sqlite_backend',
         'NAME': BASE_DIR / 'db.sqlite3',
+        'OPTIONS': {
+            'timeout': 20,
+            'transaction_mode': 'IMMEDIATE',
+        },
+    }
+}
+
+# SQLITE_PROFILE=production further tunes SQLite for many concurrent voters: WAL
+# journal, a busy timeout, and connections kept open between requests.
+SQLITE_PROFILE = config('SQLITE_PROFILE', default='default')
+if SQLITE_PROFILE == 'production':
+    DATABASES['default'].update({
+        'CONN_MAX_AGE': config('CONN_MAX_AGE', default=600, cast=int),
+        'CONN_HEALTH_CHECKS': True,
+        'OPTIONS': {
+            **DATABASES['default']['OPTIONS'],
+            'pragmas': {
+                'journal_mode': 'WAL',
+                'synchronous': 'NORMAL',
+                'busy_timeout': 20000,
+                'cache_size': -64000,  # KiB, i.e. 64 MB
+                'mmap_size': 268435456,
+                'temp_store': 'MEMORY',
+            },
+        },
+    })
+
+# Read replicas: a comma-separated list of database files that hold copies of the
+# primary (refreshed by the sync_replicas command). Poll pages and APIs read from
+# them; writes, and a user's requests right after a write, use the primary.
+DATABASE_REPLICAS = config('DATABASE_REPLICAS', default='', cast=Csv())
+POLLS_READ_REPLICAS = []
+for index, name in enumerate(DATABASE_REPLICAS):
+    DATABASES[f'replica{index}'] = {**DATABASES['default'], 'NAME': name, 'TEST': {'MIRROR': 'default'}}
+    POLLS_READ_REPLICAS.append(f'replica{index}')
+DATABASE_ROUTERS = ['polls.routers.PrimaryReplicaRouter']
+
+# Seconds a user keeps reading from the primary after submitting a form.
+POLLS_REPLICA_PIN_SECONDS = config('POLLS_REPLICA_PIN_SECONDS', default=5, cast=int)
+
+# Cache
+# https://docs.djangoproject.com/en/dev/topics/cache/
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'ku-polls',
+        'OPTIONS': {'MAX_ENTRIES': 10000},
     }
 }
 
+# Whether every process sees the same cache. Caching sessions and users is only
+# safe then: with a per-process cache, a logout or password change in one worker
+# leaves the other workers' cached copies valid.
+SHARED_CACHE = CACHES['default']['BACKEND'] not in (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+
+# With a shared cache, sessions are read from the cache and written through to
+# the database, so they survive cache evictions and restarts.
+SESSION_ENGINE = config('SESSION_ENGINE', default='django.contrib.sessions.backends.cached_db' if SHARED_CACHE
+                        else 'django.contrib.sessions.backends.db')
+
+# Seconds a computed poll result tally stays in the cache.
+POLLS_RESULTS_CACHE_TIMEOUT = config('POLLS_RESULTS_CACHE_TIMEOUT', default=300, cast=int)
+
+# Seconds the cached poll schedule (which polls are open) is trusted before it is
+# re-read; bounds how long edits made by other processes, such as create_polls,
+# take to show when the cache is not shared between processes.
+POLLS_SCHEDULE_CACHE_TIMEOUT = config('POLLS_SCHEDULE_CACHE_TIMEOUT', default=30, cast=int)
+
+# Seconds a user's "already voted" lookups stay in the cache; voting clears them sooner.
+POLLS_VOTED_CACHE_TIMEOUT = config('POLLS_VOTED_CACHE_TIMEOUT', default=300, cast=int)
+
+# Live results pages get at most one update per interval (seconds) per question,
+# and a keep-alive comment after KEEPALIVE seconds without one.
+POLLS_LIVE_RESULTS_INTERVAL = config('POLLS_LIVE_RESULTS_INTERVAL', default=1.0, cast=float)
+POLLS_LIVE_RESULTS_KEEPALIVE = config('POLLS_LIVE_RESULTS_KEEPALIVE', default=15.0, cast=float)
+
+# Serve the detail, results and vote pages with async views; only worth it under ASGI.
+POLLS_ASYNC_VIEWS = config('POLLS_ASYNC_VIEWS', default=False, cast=bool)
+
+# Write-behind vote ingestion: queue votes and write them in batches.
+# DURABILITY is 'memory' (lost if the process dies) or 'cache' (kept in CACHES).
+# A FLUSH_INTERVAL of 0 disables the background flusher.
+POLLS_VOTE_BUFFER = {
+    'ENABLED': config('POLLS_VOTE_BUFFER', default=False, cast=bool),
+    'DURABILITY': config('POLLS_VOTE_BUFFER_DURABILITY', default='memory'),
+    'MAX_SIZE': config('POLLS_VOTE_BUFFER_MAX_SIZE', default=10000, cast=int),
+    'BATCH_SIZE': config('POLLS_VOTE_BUFFER_BATCH_SIZE', default=500, cast=int),
+    'FLUSH_INTERVAL': config('POLLS_VOTE_BUFFER_FLUSH_INTERVAL', default=1.0, cast=float),
+}
+
+# compact_rollups folds minute vote buckets older than POLLS_ROLLUP_MINUTE_HOURS
+# into hour buckets, and hour buckets older than POLLS_ROLLUP_HOUR_DAYS into days.
+POLLS_ROLLUP_MINUTE_HOURS = config('POLLS_ROLLUP_MINUTE_HOURS', default=48, cast=int)
+POLLS_ROLLUP_HOUR_DAYS = config('POLLS_ROLLUP_HOUR_DAYS', default=30, cast=int)
+
+# A vote counts half as much towards a poll's "trending now" score after this many hours.
+POLLS_TRENDING_HALF_LIFE_HOURS = config('POLLS_TRENDING_HALF_LIFE_HOURS', default=6.0, cast=float)
+
+# Seconds the leaderboard rankings are cached before the next read rebuilds them
+# from the vote counters and rollup buckets; votes never update them directly.
+POLLS_LEADERBOARD_REFRESH = config('POLLS_LEADERBOARD_REFRESH', default=60, cast=int)
+
+# Token-bucket rate limits: a user may make BURST requests at once and RATE more
+# per minute after that. Each client address gets IP_FACTOR times as much, since
+# many users can share one. A RATE of 0 turns a limit off.
+POLLS_RATE_LIMITS = {
+    'vote': {
+        'RATE': config('POLLS_VOTE_RATE', default=30, cast=float),
+        'BURST': config('POLLS_VOTE_BURST', default=10, cast=int),
+    },
+    'signup': {
+        'RATE': config('POLLS_SIGNUP_RATE', default=2, cast=float),
+        'BURST': config('POLLS_SIGNUP_BURST', default=5, cast=int),
+    },
+}
+POLLS_RATE_LIMIT_IP_FACTOR = config('POLLS_RATE_LIMIT_IP_FACTOR', default=20, cast=int)
+
 # Password validation
 # https://docs.djangoproject.com/en/dev/ref/settings/#auth-password-validators
 AUTHENTICATION_BACKENDS = [
-    # username & password authentication
-    'django.contrib.auth.backends.ModelBackend',
+    # username & password authentication, with the logged-in user cached between requests
+    # when the cache is shared
+    'polls.auth.CachedModelBackend' if SHARED_CACHE else 'django.contrib.auth.backends.ModelBackend',
 ]
+
+# Seconds the logged-in user stays cached with a shared cache; saving the user or
+# logging out clears it sooner.
+POLLS_USER_CACHE_TIMEOUT = config('POLLS_USER_CACHE_TIMEOUT', default=300, cast=int)
 AUTH_PASSWORD_VALIDATORS = [
     {
         'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator',
@@ -0,0 +1,43 @@
+"""
+SQLite backend tuned for many concurrent voters.
+
+It behaves like Django's own SQLite backend and understands two extra
+``OPTIONS``:
+
+``pragmas``
+    A dict of PRAGMA settings applied to every new connection, such as
+    ``{'journal_mode': 'WAL', 'synchronous': 'NORMAL'}``.
+
+``transaction_mode``
+    ``'DEFERRED'``, ``'IMMEDIATE'`` or ``'EXCLUSIVE'``: the kind of BEGIN that
+    ``transaction.atomic()`` issues.  ``'IMMEDIATE'`` takes the write lock at
+    the start of the transaction, so a writer waits its turn under
+    ``busy_timeout`` instead of failing with "database is locked" when it
+    tries to upgrade a read lock.  Django 5.1 supports this option natively;
+    this backend provides it on earlier versions too.
+"""
+from django.db.backends.sqlite3 import base
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+
+    def get_connection_params(self):
+        params = super().get_connection_params()
+        self.pragmas = params.pop('pragmas', {})
+        if 'transaction_mode' in params:
+            # Django < 5.1 passes unknown OPTIONS straight to sqlite3.connect().
+            self.transaction_mode = params.pop('transaction_mode')
+        return params
+
+    def get_new_connection(self, conn_params):
+        conn = super().get_new_connection(conn_params)
+        for name, value in self.pragmas.items():
+            conn.execute(f'PRAGMA {name} = {value}')
+        return conn
+
+    def _start_transaction_under_autocommit(self):
+        mode = getattr(self, 'transaction_mode', None)
+        if mode:
+            self.cursor().execute(f'BEGIN {mode}')
+        else:
+            super()._start_transaction_under_autocommit()
@@ -15,6 +15,8 @@ urlpatterns = [
     path('login/', auth_views.LoginView.as_view(), name='login'),
     path('signup/', views.signup, name='signup'),
     path('accounts/', include('django.contrib.auth.urls')),
+    path('admin/profiles/', admin.site.admin_view(views.profiles), name='profiles'),
+    path('admin/profiles/<str:profile_id>/', admin.site.admin_view(views.profile_detail), name='profile_detail'),
     path('admin/', admin.site.urls),
 ]
 
@@ -1,8 +1,18 @@
+import os
+
 from django.contrib.auth.forms import UserCreationForm
+from django.conf import settings
+from django.contrib import admin
 from django.contrib.auth import login
+from django.http import FileResponse, Http404
 from django.shortcuts import render, redirect
 
+from polls.ratelimit import rate_limit
+
+from . import profiling
 
+
+@rate_limit('signup')
 def signup(request):
     if request.method == 'POST':
         form = UserCreationForm(request.POST)
@@ -13,3 +23,32 @@ def signup(request):
     else:
         form = UserCreationForm()
     return render(request, 'registration/signup.html', {'form': form})
+
+
+def profiles(request):
+    """List the saved request profiles, newest first."""
+    return render(request, 'admin/profiles.html', {
+        **admin.site.each_context(request),
+        'title': 'Request profiles',
+        'profiles': profiling.recent(),
+    })
+
+
+def profile_detail(request, profile_id):
+    """Show a profile's slowest functions and its SQL, or download it with ``?download=1``."""
+    profile = profiling.load(profile_id)
+    if profile is None:
+        raise Http404('No such profile.')
+    if request.GET.get('download') == '1':
+        path = os.path.join(settings.PROFILE_DIR, f'{profile_id}.prof')
+        return FileResponse(open(path, 'rb'), as_attachment=True, filename=f'{profile_id}.prof')
+    sort = request.GET.get('sort', 'cumulative')
+    if sort not in ('cumulative', 'tottime', 'ncalls'):
+        sort = 'cumulative'
+    return render(request, 'admin/profile_detail.html', {
+        **admin.site.each_context(request),
+        'title': f'{profile["method"]} {profile["path"]}',
+        'profile': profile,
+        'sort': sort,
+        'stats': profiling.stats_text(profile_id, sort),
+    })
@@ -1,11 +1,81 @@
-from django.contrib import admin
+import io
 
-from .models import Choice, Question
+from django import forms
+from django.contrib import admin, messages
+from django.core.exceptions import PermissionDenied, ValidationError
+from django.core.paginator import Paginator
+from django.db import connections
+from django.db.models import Count
+from django.shortcuts import redirect
+from django.template.response import TemplateResponse
+from django.urls import path
+from django.utils.functional import cached_property
+
+from . import authoring, voting
+from .models import Choice, Question, Vote
+
+
+def estimated_count(model, using='default'):
+    """
+    Return a cheap estimate of the number of rows in a model's table, or None.
+
+    PostgreSQL and MySQL keep row estimates in their catalogs; on SQLite the
+    largest rowid is an upper bound read straight from the table's b-tree.
+    """
+    connection = connections[using]
+    table = model._meta.db_table
+    queries = {
+        'postgresql': ('SELECT reltuples::bigint FROM pg_class WHERE relname = %s', [table]),
+        'mysql': ('SELECT table_rows FROM information_schema.tables '
+                  'WHERE table_schema = DATABASE() AND table_name = %s', [table]),
+        'sqlite': (f'SELECT MAX(rowid) FROM {connection.ops.quote_name(table)}', []),
+    }
+    if connection.vendor not in queries:
+        return None
+    with connection.cursor() as cursor:
+        cursor.execute(*queries[connection.vendor])
+        row = cursor.fetchone()
+    return int(row[0]) if row and row[0] is not None and row[0] >= 0 else None
+
+
+class EstimatedCountPaginator(Paginator):
+    """Paginator that estimates the size of large unfiltered tables instead of running COUNT(*)."""
+
+    # Below this many rows an exact count is cheap enough.
+    exact_below = 100000
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        if not queryset.query.where:
+            estimate = estimated_count(queryset.model, queryset.db)
+            if estimate is not None and estimate >= self.exact_below:
+                return estimate
+        return super().count
 
 
 class ChoiceInline(admin.TabularInline):
     model = Choice
     extra = 3
+    fields = ['choice_text', 'votes']
+    # The stored counter, so the inline runs no per-choice COUNT.
+    readonly_fields = ['votes']
+
+
+class PollUploadForm(forms.Form):
+    file = forms.FileField(help_text='A .csv or .json file of polls.')
+
+    def clean_file(self):
+        upload = self.cleaned_data['file']
+        file_format = authoring.guess_format(upload.name)
+        if file_format is None:
+            raise ValidationError('Upload a .csv or .json file.')
+        text = io.TextIOWrapper(upload.file, encoding='utf-8-sig', newline='')
+        try:
+            self.polls = authoring.validate(authoring.read(text, file_format))
+        except UnicodeDecodeError:
+            raise ValidationError('The file is not UTF-8 text.')
+        return upload
 
 
 class QuestionAdmin(admin.ModelAdmin):
@@ -14,9 +84,70 @@ class QuestionAdmin(admin.ModelAdmin):
         ('Date information', {'fields': ['pub_date', 'end_date'], 'classes': ['collapse']}),
     ]
     inlines = [ChoiceInline]
-    list_display = ('question_text', 'pub_date', 'end_date', 'was_published_recently')
+    list_display = ('question_text', 'pub_date', 'end_date', 'was_published_recently', 'choice_count', 'total_votes')
     list_filter = ['pub_date']
     search_fields = ['question_text']
 
+    def get_queryset(self, request):
+        return super().get_queryset(request).annotate(num_choices=Count('choice'))
+
+    @admin.display(ordering='num_choices', description='Choices')
+    def choice_count(self, question):
+        return question.num_choices
+
+    def get_urls(self):
+        upload = path('upload/', self.admin_site.admin_view(self.upload_view), name='polls_question_upload')
+        return [upload, *super().get_urls()]
+
+    def upload_view(self, request):
+        """Create a file of polls in one batch, or show every problem with it."""
+        if not self.has_add_permission(request):
+            raise PermissionDenied
+        form = PollUploadForm(request.POST or None, request.FILES or None)
+        if request.method == 'POST' and form.is_valid():
+            questions = authoring.create(form.polls)
+            self.message_user(request, f'Created {len(questions)} poll(s).', messages.SUCCESS)
+            return redirect('admin:polls_question_changelist')
+        return TemplateResponse(request, 'admin/polls/question/upload.html', {
+            **self.admin_site.each_context(request),
+            'title': 'Upload polls',
+            'opts': self.model._meta,
+            'form': form,
+        })
+
+
+class VoteAdmin(admin.ModelAdmin):
+    """
+    Votes, listed without a query per row or a full COUNT of the table.
+
+    Votes are saved and deleted through the vote path, so the counters,
+    rollups and caches stay in step with admin edits.
+    """
+    list_display = ('user', 'question', 'choice', 'created_at', 'updated_at')
+    list_select_related = ('user', 'question', 'choice')
+    raw_id_fields = ('user', 'choice')
+    fields = ('user', 'choice', 'question', 'created_at', 'updated_at')
+    readonly_fields = ('question', 'created_at', 'updated_at')
+    search_fields = ['user__username']
+    ordering = ['-pk']
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+    def save_model(self, request, obj, form, change):
+        if change:
+            original = Vote.objects.get(pk=obj.pk)
+            if (original.user_id, original.question_id) != (obj.user_id, obj.choice.question_id):
+                voting.retract_votes(Vote.objects.filter(pk=obj.pk))
+        voting.cast_vote(obj.user, obj.choice)
+        saved = Vote.objects.get(user=obj.user, question_id=obj.choice.question_id)
+        obj.pk, obj.question_id = saved.pk, saved.question_id
+
+    def delete_model(self, request, obj):
+        voting.retract_votes(Vote.objects.filter(pk=obj.pk))
+
+    def delete_queryset(self, request, queryset):
+        voting.retract_votes(queryset)
+
 
 admin.site.register(Question, QuestionAdmin)
+admin.site.register(Vote, VoteAdmin)
@@ -0,0 +1,84 @@
+"""
+Archival of closed polls into result snapshots.
+
+A closed question's results can no longer change, so ``archive()`` stores
+its tally once as a ResultSnapshot and ``tallies.get_results()`` reads
+that row instead of counting Vote rows: an archived results page costs one
+query however many votes the poll had.  Optionally the question's votes are then
+written to a gzip-compressed JSON Lines file and deleted, shrinking the
+Vote table that the vote path and the tallies of open polls work on.
+
+The stored counters, rollup buckets and leaderboard entries of an archived
+question are left as they are, and ``reconcile_votes`` and
+``rollups.rebuild()`` skip archived questions so they never recount them
+from votes that have moved out.  Pages stop marking which choice a user
+picked once their votes have moved and their cached lookups expire.
+
+An archived question is closed for good: ``schedule`` never lists it as
+open or upcoming, so moving its ``end_date`` into the future does not let
+anyone vote on results that can no longer change.
+"""
+import datetime
+import gzip
+import json
+import os
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.utils import timezone
+
+from . import schedule, tallies
+from .models import Question, ResultSnapshot, Vote
+
+ARCHIVE_COLUMNS = ('id', 'question_id', 'choice_id', 'user_id', 'created_at', 'updated_at')
+
+
+def candidates(closed_for=7, now=None):
+    """Return the questions closed for at least ``closed_for`` days that have no snapshot yet."""
+    cutoff = (now or timezone.now()) - datetime.timedelta(days=closed_for)
+    return Question.objects.closed(cutoff).filter(snapshot__isnull=True).order_by('pk')
+
+
+def archive_path(directory, question_id):
+    return os.path.join(directory, f'question-{question_id}-votes.jsonl.gz')
+
+
+def write_votes(question_id, path, chunk_size=2000):
+    """
+    Write a question's votes to a gzip-compressed JSON Lines file.
+
+    The file is written under a temporary name and renamed when complete,
+    so a partial file is never mistaken for an archive.
+
+    Returns:
+        int: The number of votes written.
+    """
+    values = (Vote.objects.filter(question_id=question_id).order_by('pk')
+              .values_list(*ARCHIVE_COLUMNS).iterator(chunk_size=chunk_size))
+    written = 0
+    partial = path + '.part'
+    with gzip.open(partial, 'wt', encoding='utf-8') as fh:
+        for row in values:
+            fh.write(json.dumps(dict(zip(ARCHIVE_COLUMNS, row)), cls=DjangoJSONEncoder) + '\n')
+            written += 1
+    os.replace(partial, path)
+    return written
+
+
+def archive(question_id, directory=None):
+    """
+    Snapshot the results of a closed question, and move its votes to ``directory`` if given.
+
+    Returns:
+        ResultSnapshot: The new snapshot.
+    """
+    with transaction.atomic():
+        snapshot = ResultSnapshot(question_id=question_id, results=tallies.tally(question_id))
+        if directory:
+            snapshot.archive_file = archive_path(directory, question_id)
+            write_votes(question_id, snapshot.archive_file)
+            Vote.objects.filter(question_id=question_id).delete()
+        snapshot.save()
+        transaction.on_commit(lambda: tallies.invalidate(question_id))
+        transaction.on_commit(schedule.invalidate)
+    return snapshot
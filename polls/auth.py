@@ -0,0 +1,38 @@
+"""
+Authentication backend that caches the user loaded for each request.
+
+AuthenticationMiddleware resolves ``request.user`` through the backend's
+``get_user()`` on every request.  CachedModelBackend keeps the User in the
+cache for ``POLLS_USER_CACHE_TIMEOUT`` seconds, so with cache-backed
+sessions an authenticated page view needs neither the session row nor the
+``auth_user`` row from the database.  Saving or deleting a user (which
+includes changing the password) and logging out drop the cached copy;
+changes made with ``QuerySet.update()`` show up when the entry expires.
+
+Those invalidations only reach other processes through a shared cache, so
+settings only enable this backend, and cached sessions, when ``CACHES``
+is not a per-process cache.
+"""
+from django.conf import settings
+from django.contrib.auth.backends import ModelBackend
+from django.core.cache import cache
+
+USER_KEY = 'polls:user:{}'
+
+
+class CachedModelBackend(ModelBackend):
+    """ModelBackend whose get_user() is served from the cache."""
+
+    def get_user(self, user_id):
+        key = USER_KEY.format(user_id)
+        user = cache.get(key)
+        if user is None:
+            user = super().get_user(user_id)
+            if user is not None:
+                cache.set(key, user, settings.POLLS_USER_CACHE_TIMEOUT)
+        return user
+
+
+def forget_user(user_id):
+    """Drop a user's cached copy, e.g. after it was saved or the user logged out."""
+    cache.delete(USER_KEY.format(user_id))
@@ -0,0 +1,185 @@
+"""
+Bulk poll authoring: create many questions with their choices at once.
+
+Polls come from JSON, a list of objects with ``question_text``,
+``pub_date``, an optional ``end_date`` and a ``choices`` list, or from CSV
+with ``question_text``, ``pub_date`` and ``end_date`` columns and one
+``choice_1``, ``choice_2``, ... column per choice.  Dates are ISO 8601; a
+date without a time means midnight, and times without an offset are in
+``TIME_ZONE``.  A blank ``pub_date`` publishes the poll immediately.
+
+Every row is checked before anything is written, and all problems are
+reported together.  Questions and then choices are inserted with
+``bulk_create`` in one transaction, so either the whole file is created or
+none of it is.  ``bulk_create`` sends no signals, so ``create()`` moves on
+the content versions and the schedule itself once the transaction commits.
+That reaches other processes only through a shared cache; otherwise, as
+when ``create_polls`` runs beside a server using ``LocMemCache``, the new
+polls open there once its schedule expires, within
+``POLLS_SCHEDULE_CACHE_TIMEOUT`` seconds.
+"""
+import csv
+import datetime
+import json
+import re
+
+from django.core.exceptions import ValidationError
+from django.db import connection, transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+
+from . import content, schedule
+from .models import Choice, Question
+
+FORMATS = ('csv', 'json')
+CHOICE_COLUMN = re.compile(r'^choice_?(\d+)$')
+MIN_CHOICES = 2
+
+TEXT_LENGTH = Question._meta.get_field('question_text').max_length
+CHOICE_LENGTH = Choice._meta.get_field('choice_text').max_length
+
+
+def guess_format(filename):
+    """Return the format of a file from its extension, or None."""
+    extension = filename.rsplit('.', 1)[-1].lower()
+    return extension if extension in FORMATS else None
+
+
+def read(fh, file_format):
+    """
+    Read raw poll records from a text file.
+
+    Returns:
+        list: One dict per poll with ``question_text``, ``pub_date``,
+        ``end_date`` and a ``choices`` list, not yet validated.
+    """
+    if file_format == 'json':
+        try:
+            records = json.load(fh)
+        except ValueError as error:
+            raise ValidationError(f'Invalid JSON: {error}')
+        if not isinstance(records, list) or not all(isinstance(record, dict) for record in records):
+            raise ValidationError('Expected a JSON array of poll objects.')
+        return records
+    records = []
+    for row in csv.DictReader(fh):
+        numbered = sorted((int(match.group(1)), value) for name, value in row.items()
+                          if name and (match := CHOICE_COLUMN.match(name.strip())))
+        records.append({
+            'question_text': row.get('question_text'),
+            'pub_date': row.get('pub_date'),
+            'end_date': row.get('end_date'),
+            'choices': [value for _, value in numbered if value and value.strip()],
+        })
+    return records
+
+
+def parse_moment(value):
+    """Return an aware datetime for an ISO date or date-time string, or None if it is blank."""
+    if value is None or (isinstance(value, str) and not value.strip()):
+        return None
+    if not isinstance(value, str):
+        raise ValueError
+    value = value.strip()
+    moment = parse_datetime(value)
+    if moment is None:
+        day = parse_date(value)
+        if day is None:
+            raise ValueError
+        moment = datetime.datetime.combine(day, datetime.time())
+    if timezone.is_naive(moment):
+        moment = timezone.make_aware(moment)
+    return moment
+
+
+def validate(records, now=None):
+    """
+    Check every record and return the polls to create.
+
+    Raises:
+        ValidationError: Listing every problem found, each prefixed with the poll's number.
+
+    Returns:
+        list: Dicts with ``question_text``, ``pub_date``, ``end_date`` and ``choices``.
+    """
+    now = now or timezone.now()
+    polls = []
+    errors = []
+    if not records:
+        raise ValidationError('The file contains no polls.')
+    for number, record in enumerate(records, start=1):
+        problems = []
+        text = record.get('question_text')
+        text = text.strip() if isinstance(text, str) else ''
+        if not text:
+            problems.append('question_text is required')
+        elif len(text) > TEXT_LENGTH:
+            problems.append(f'question_text is longer than {TEXT_LENGTH} characters')
+
+        dates = {}
+        for name in ('pub_date', 'end_date'):
+            try:
+                dates[name] = parse_moment(record.get(name))
+            except (ValueError, TypeError):
+                problems.append(f'{name} "{record.get(name)}" is not an ISO 8601 date')
+        pub_date = dates.get('pub_date') or now
+        end_date = dates.get('end_date')
+        if end_date is not None and end_date < pub_date:
+            problems.append('end_date is before pub_date')
+
+        choices = record.get('choices')
+        if not isinstance(choices, list) or not all(isinstance(choice, str) for choice in choices):
+            problems.append('choices must be a list of strings')
+            choices = []
+        choices = [choice.strip() for choice in choices if choice.strip()]
+        if len(choices) < MIN_CHOICES:
+            problems.append(f'a poll needs at least {MIN_CHOICES} choices')
+        if len(set(choices)) != len(choices):
+            problems.append('choices are repeated')
+        if any(len(choice) > CHOICE_LENGTH for choice in choices):
+            problems.append(f'a choice is longer than {CHOICE_LENGTH} characters')
+
+        if problems:
+            errors.extend(f'Poll {number}: {problem}.' for problem in problems)
+        else:
+            polls.append({'question_text': text, 'pub_date': pub_date, 'end_date': end_date, 'choices': choices})
+    if errors:
+        raise ValidationError(errors)
+    return polls
+
+
+def create(polls, batch_size=500):
+    """
+    Insert validated polls and their choices in one transaction.
+
+    Returns:
+        list: The new questions.
+    """
+    questions = [Question(question_text=poll['question_text'], pub_date=poll['pub_date'],
+                          end_date=poll['end_date']) for poll in polls]
+    with transaction.atomic():
+        if connection.features.can_return_rows_from_bulk_insert:
+            Question.objects.bulk_create(questions, batch_size=batch_size)
+        else:
+            # Choices need the new question ids, which this database can't return from a bulk insert.
+            for question in questions:
+                question.save()
+        Choice.objects.bulk_create(
+            [Choice(question=question, choice_text=text)
+             for question, poll in zip(questions, polls) for text in poll['choices']],
+            batch_size=batch_size,
+        )
+        question_ids = [question.pk for question in questions]
+        transaction.on_commit(lambda: _created(question_ids))
+    return questions
+
+
+def _created(question_ids):
+    for question_id in question_ids:
+        content.changed(question_id)
+    schedule.invalidate()
+
+
+def load(fh, file_format, batch_size=500):
+    """Read, validate and create the polls in a file; nothing is created if any poll is invalid."""
+    return create(validate(read(fh, file_format)), batch_size=batch_size)
@@ -0,0 +1,253 @@
+"""
+Write-behind vote ingestion.
+
+When ``POLLS_VOTE_BUFFER['ENABLED']`` is set, the vote view queues votes here
+instead of writing them immediately.  A background thread flushes the queue
+in batches with :func:`polls.voting.record_votes`, turning thousands of small
+write transactions into a few large ones.  Only the latest vote for each
+(user, question) pair is kept, so a user changing their mind before a flush
+costs nothing extra.
+
+``DURABILITY`` picks where queued votes live:
+
+* ``'memory'`` keeps them in the process.  Votes not yet flushed are lost if
+  the process dies without running its exit handler.
+* ``'cache'`` keeps them in Django's cache.  With a shared cache backend they
+  survive a worker restart and can be drained by ``manage.py drain_vote_buffer``
+  from another process; flushes from different processes take turns.
+"""
+import atexit
+import logging
+import threading
+import time
+import uuid
+from contextlib import contextmanager, nullcontext
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import close_old_connections
+
+from . import voting
+
+logger = logging.getLogger(__name__)
+
+
+class MemoryStore:
+    """Queued votes held in an insertion-ordered dict."""
+
+    def __init__(self):
+        self._votes = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._votes)
+
+    def put(self, key, choice_id):
+        with self._lock:
+            # Re-inserting moves the key to the end, so a changed vote waits its turn again.
+            self._votes.pop(key, None)
+            self._votes[key] = choice_id
+
+    def peek(self, limit):
+        """Return up to ``limit`` of the oldest votes and a receipt for :meth:`ack`."""
+        with self._lock:
+            votes = {}
+            for key, choice_id in self._votes.items():
+                if len(votes) >= limit:
+                    break
+                votes[key] = choice_id
+        return votes, votes
+
+    def ack(self, receipt):
+        """Forget flushed votes, unless the user voted again while they were being written."""
+        with self._lock:
+            for key, choice_id in receipt.items():
+                if self._votes.get(key) == choice_id:
+                    del self._votes[key]
+
+    def flushing(self):
+        """Flushes of a process's own memory need no lock beyond VoteBuffer's."""
+        return nullcontext()
+
+
+class CacheStore:
+    """
+    Queued votes held in the cache as a sequence of numbered entries.
+
+    ``put()`` takes a number from ``TAIL`` and then writes the entry, so a
+    flush can find a number whose entry is not written yet.  ``peek()``
+    stops at such a gap and leaves it and everything after it for the next
+    flush, which keeps votes in order; a gap still open after
+    ``gap_timeout`` seconds belongs to a writer that died, and is skipped.
+    Only one process flushes at a time, under a lock taken with
+    ``cache.add()``, and ``HEAD`` only moves forwards.
+    """
+
+    HEAD_KEY = 'polls:vote-buffer:head'
+    TAIL_KEY = 'polls:vote-buffer:tail'
+    ENTRY_KEY = 'polls:vote-buffer:{}'
+    GAP_KEY = 'polls:vote-buffer:gap'
+    LOCK_KEY = 'polls:vote-buffer:lock'
+
+    def __init__(self, gap_timeout=30, lock_timeout=60, lock_wait=10):
+        self.gap_timeout = gap_timeout
+        self.lock_timeout = lock_timeout
+        self.lock_wait = lock_wait
+
+    def __len__(self):
+        counters = cache.get_many([self.HEAD_KEY, self.TAIL_KEY])
+        return counters.get(self.TAIL_KEY, 0) - counters.get(self.HEAD_KEY, 0)
+
+    def put(self, key, choice_id):
+        cache.add(self.TAIL_KEY, 0, None)
+        seq = cache.incr(self.TAIL_KEY)
+        cache.set(self.ENTRY_KEY.format(seq), (*key, choice_id), None)
+
+    @contextmanager
+    def flushing(self):
+        """Hold the cache-wide flush lock, waiting up to ``lock_wait`` seconds for another flusher."""
+        token = uuid.uuid4().hex
+        deadline = time.monotonic() + self.lock_wait
+        while not cache.add(self.LOCK_KEY, token, self.lock_timeout):
+            if time.monotonic() >= deadline:
+                raise TimeoutError('Another process is flushing the vote buffer.')
+            time.sleep(0.05)
+        try:
+            yield
+        finally:
+            if cache.get(self.LOCK_KEY) == token:
+                cache.delete(self.LOCK_KEY)
+
+    def peek(self, limit):
+        counters = cache.get_many([self.HEAD_KEY, self.TAIL_KEY])
+        head = counters.get(self.HEAD_KEY, 0)
+        last = min(counters.get(self.TAIL_KEY, 0), head + limit)
+        entry_keys = [self.ENTRY_KEY.format(seq) for seq in range(head + 1, last + 1)]
+        entries = cache.get_many(entry_keys)
+        votes = {}
+        taken = []
+        for seq, entry_key in enumerate(entry_keys, start=head + 1):
+            if entry_key not in entries and not self._abandoned(seq):
+                last = seq - 1
+                break
+            taken.append(entry_key)
+            if entry_key in entries:
+                user_id, question_id, choice_id = entries[entry_key]
+                votes[(user_id, question_id)] = choice_id
+        return votes, (taken, last)
+
+    def _abandoned(self, seq):
+        """Return True if entry ``seq`` has been missing for longer than ``gap_timeout``."""
+        now = time.time()
+        gap = cache.get(self.GAP_KEY)
+        if gap is None or gap[0] != seq:
+            cache.set(self.GAP_KEY, (seq, now), None)
+            return False
+        if now - gap[1] < self.gap_timeout:
+            return False
+        logger.warning('Vote buffer entry %d was never written; skipping it', seq)
+        return True
+
+    def ack(self, receipt):
+        entry_keys, last = receipt
+        cache.delete_many(entry_keys)
+        if last > cache.get(self.HEAD_KEY, 0):
+            cache.set(self.HEAD_KEY, last, None)
+
+
+class VoteBuffer:
+    """
+    A bounded queue of votes flushed to the database in batches.
+
+    Attributes:
+        max_size (int): Queue length at which ``submit`` flushes synchronously instead of waiting.
+        batch_size (int): Most votes written per transaction.
+        flush_interval (float): Seconds between background flushes; 0 disables the background thread.
+    """
+
+    def __init__(self, store, max_size=10000, batch_size=500, flush_interval=1.0):
+        self.store = store
+        self.max_size = max_size
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread = None
+
+    def __len__(self):
+        return len(self.store)
+
+    def submit(self, user_id, question_id, choice_id):
+        """Queue a vote, replacing any queued vote by the same user on the same question."""
+        self.store.put((user_id, question_id), choice_id)
+        pending = len(self.store)
+        if pending >= self.max_size:
+            # Back-pressure: the caller pays for the write rather than growing the queue.
+            try:
+                self.flush()
+            except TimeoutError:
+                # Another process holds the flush lock and is draining the shared queue.
+                self._wakeup.set()
+        elif pending >= self.batch_size:
+            self._wakeup.set()
+        if self.flush_interval and self._thread is None:
+            self._start()
+
+    def flush(self):
+        """
+        Write every queued vote to the database.
+
+        Returns:
+            int: The number of votes that were new or changed.
+        """
+        written = 0
+        with self._flush_lock, self.store.flushing():
+            while True:
+                votes, receipt = self.store.peek(self.batch_size)
+                if votes:
+                    written += voting.record_votes(votes, batch_size=self.batch_size)
+                # Also acknowledges abandoned entries skipped by a batch with no votes.
+                self.store.ack(receipt)
+                if not votes:
+                    break
+        return written
+
+    def _start(self):
+        with self._flush_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='vote-buffer-flusher', daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            try:
+                self.flush()
+            except TimeoutError:
+                # Another process is flushing the shared queue; try again next interval.
+                pass
+            except Exception:
+                logger.exception('Flushing the vote buffer failed; %d votes remain queued', len(self.store))
+            finally:
+                close_old_connections()
+
+
+_buffer = None
+_buffer_lock = threading.Lock()
+
+
+def get_buffer():
+    """Return the process-wide vote buffer configured by ``POLLS_VOTE_BUFFER``."""
+    global _buffer
+    if _buffer is None:
+        with _buffer_lock:
+            if _buffer is None:
+                options = settings.POLLS_VOTE_BUFFER
+                store = CacheStore() if options['DURABILITY'] == 'cache' else MemoryStore()
+                _buffer = VoteBuffer(store,
+                                     max_size=options['MAX_SIZE'],
+                                     batch_size=options['BATCH_SIZE'],
+                                     flush_interval=options['FLUSH_INTERVAL'])
+                atexit.register(_buffer.flush)
+    return _buffer
@@ -0,0 +1,40 @@
+"""
+Content versions for cached poll page fragments.
+
+Templates cache the poll list rows and choice lists under keys that include a
+version number from here.  Saving or deleting a Question or Choice (including
+through the admin) moves the versions on, so edited polls are re-rendered and
+stale fragments simply expire.  As in :mod:`polls.tallies`, versions are
+clock-based so an evicted version never reappears with an old number.
+"""
+import time
+
+from django.core.cache import cache
+
+LIST_KEY = 'polls:content:list'
+QUESTION_KEY = 'polls:content:{}'
+
+
+def _get_version(key):
+    version = cache.get(key)
+    if version is None:
+        version = time.time_ns()
+        if not cache.add(key, version, None):
+            version = cache.get(key, version)
+    return version
+
+
+def list_version():
+    """Return the version of the poll list, which changes when any question or choice changes."""
+    return _get_version(LIST_KEY)
+
+
+def question_version(question_id):
+    """Return the version of one question's text and choices."""
+    return _get_version(QUESTION_KEY.format(question_id))
+
+
+def changed(question_id):
+    """Record that a question or one of its choices was edited."""
+    version = time.time_ns()
+    cache.set_many({QUESTION_KEY.format(question_id): version, LIST_KEY: version}, None)
@@ -0,0 +1,84 @@
+"""
+Streaming exports of votes and per-choice results.
+
+Rows come straight from ``values_list(...).iterator(chunk_size=...)``, so no
+model instances are built and at most one chunk of rows is held at a time;
+the CSV and JSONL encoders are generators as well.  Handing their output to
+a ``StreamingHttpResponse`` or writing it to a file line by line exports a
+million votes in the same memory as a hundred.
+
+Under ASGI, Django reads a sync streaming iterator into a list before
+sending it, so ``aiterate()`` wraps the lines in an async generator that
+reads one chunk at a time in the worker thread that owns the connection.
+"""
+import csv
+import json
+from itertools import islice
+
+from asgiref.sync import sync_to_async
+
+from .models import Choice, Vote
+
+FORMATS = ('csv', 'jsonl')
+VOTE_COLUMNS = ('question_id', 'choice_id', 'choice_text', 'user_id', 'username')
+SUMMARY_COLUMNS = ('question_id', 'question_text', 'choice_id', 'choice_text', 'votes')
+
+
+def rows(question_ids=None, summary=False, chunk_size=2000):
+    """
+    Return the column names and an iterator over the export rows.
+
+    Args:
+        question_ids (list): Questions to export, or None for every question.
+        summary (bool): One row per choice with its vote count instead of one row per vote.
+        chunk_size (int): Rows fetched from the database at a time.
+
+    Returns:
+        tuple: The column names and an iterator of value tuples.
+    """
+    if summary:
+        # The stored counters, which stay put when archive_polls moves a question's votes out.
+        queryset = (Choice.objects.order_by('question_id', 'pk')
+                    .values_list('question_id', 'question__question_text', 'pk', 'choice_text', 'votes'))
+        columns = SUMMARY_COLUMNS
+    else:
+        queryset = (Vote.objects.order_by('question_id', 'pk')
+                    .values_list('question_id', 'choice_id', 'choice__choice_text', 'user_id', 'user__username'))
+        columns = VOTE_COLUMNS
+    if question_ids is not None:
+        queryset = queryset.filter(question_id__in=question_ids)
+    return columns, queryset.iterator(chunk_size=chunk_size)
+
+
+class _Line:
+    """A file-like object whose ``write`` returns the text instead of storing it."""
+
+    def write(self, value):
+        return value
+
+
+def as_csv(columns, values):
+    """Yield CSV lines, starting with the header."""
+    writer = csv.writer(_Line())
+    yield writer.writerow(columns)
+    for row in values:
+        yield writer.writerow(row)
+
+
+def as_jsonl(columns, values):
+    """Yield one JSON object per line."""
+    for row in values:
+        yield json.dumps(dict(zip(columns, row))) + '\n'
+
+
+def encode(file_format, columns, values):
+    """Return a generator of lines for ``file_format``, one of FORMATS."""
+    return as_csv(columns, values) if file_format == 'csv' else as_jsonl(columns, values)
+
+
+async def aiterate(lines, chunk_size=500):
+    """Yield the text of ``lines`` in chunks of ``chunk_size`` lines, each read with ``sync_to_async``."""
+    lines = iter(lines)
+    read = sync_to_async(lambda: ''.join(islice(lines, chunk_size)))
+    while chunk := await read():
+        yield chunk
@@ -0,0 +1,127 @@
+"""
+The participation leaderboard: most active polls overall and trending now.
+
+Each question has a vote total and a decayed recent-activity score in which
+a vote's weight halves every ``POLLS_TRENDING_HALF_LIFE_HOURS``.  Scores use
+forward decay: a vote cast at time t adds exp(rate * (t - EPOCH)) instead of
+decaying every score as time passes, so a bucket of votes keeps its weight
+and scores can be summed from the vote rollup buckets.  Scores are kept as
+logarithms so they never overflow, and are scaled back to "decayed votes"
+when read.
+
+The vote path maintains the inputs incrementally in the database, in the
+vote's own transaction: ``Question.total_votes`` and the rollup buckets.
+The rankings are sorted lists built from them, never from the Vote table,
+and cached for ``POLLS_LEADERBOARD_REFRESH`` seconds; the first read after
+that rebuilds them.  Votes therefore never read or rewrite the board, so
+concurrent workers cannot overwrite each other's updates, and a lost cache
+entry costs a leaderboard request a rebuild rather than a vote.  The totals
+shown are read live with the question text; only the order and the
+trending scores can be up to ``POLLS_LEADERBOARD_REFRESH`` seconds old.
+"""
+import datetime
+import math
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Sum
+from django.utils import timezone
+
+from .models import Question, VoteRollup
+
+BOARD_KEY = 'polls:leaderboard'
+EPOCH = datetime.datetime(2020, 1, 1, tzinfo=datetime.timezone.utc)
+RANKINGS = ('total', 'trending')
+
+
+def _rate():
+    """Decay rate per second."""
+    return math.log(2) / (settings.POLLS_TRENDING_HALF_LIFE_HOURS * 3600)
+
+
+def _log_weight(moment, votes=1):
+    return math.log(votes) + _rate() * (moment - EPOCH).total_seconds()
+
+
+def _log_add(a, b):
+    """Return log(exp(a) + exp(b)) without overflow; ``a`` may be None for an empty score."""
+    if a is None:
+        return b
+    high, low = max(a, b), min(a, b)
+    return high + math.log1p(math.exp(low - high))
+
+
+class Board:
+    """
+    Vote totals and log scores per question, with a sorted ranking of each.
+
+    Attributes:
+        totals (dict): Maps question id to its number of votes.
+        scores (dict): Maps question id to the log of its forward-decayed score.
+    """
+
+    def __init__(self, totals=None, scores=None):
+        self.totals = dict(totals or {})
+        self.scores = dict(scores or {})
+        self.by_total = sorted((-total, pk) for pk, total in self.totals.items() if total > 0)
+        self.by_score = sorted((-score, pk) for pk, score in self.scores.items())
+
+    def top(self, ranking='total', limit=10):
+        """Return the ids of the first ``limit`` questions of a ranking."""
+        entries = self.by_total if ranking == 'total' else self.by_score
+        return [pk for _, pk in entries[:limit]]
+
+
+def build():
+    """Compute the board from the vote counters and the rollup buckets."""
+    totals = Question.objects.filter(total_votes__gt=0).values_list('pk', 'total_votes')
+    scores = {}
+    # Net votes per question per bucket; changed votes cancel out between choices.
+    buckets = (VoteRollup.objects.values_list('question_id', 'bucket')
+               .annotate(votes=Sum('votes'))
+               .filter(votes__gt=0)
+               .order_by())
+    for question_id, bucket, votes in buckets.iterator():
+        scores[question_id] = _log_add(scores.get(question_id), _log_weight(bucket, votes))
+    return Board(totals, scores)
+
+
+def get_board():
+    """Return the cached board, rebuilding it if it is missing or has expired."""
+    board = cache.get(BOARD_KEY)
+    if board is None:
+        board = rebuild()
+    return board
+
+
+def rebuild():
+    """Recompute the board and store it in the cache for ``POLLS_LEADERBOARD_REFRESH`` seconds."""
+    board = build()
+    cache.set(BOARD_KEY, board, settings.POLLS_LEADERBOARD_REFRESH)
+    return board
+
+
+def forget(question_id):
+    """Drop the board after a question is deleted, so the next read ranks without it."""
+    cache.delete(BOARD_KEY)
+
+
+def top(ranking='total', limit=10, now=None):
+    """
+    Return the leading questions of a ranking, in one query for their text and current total.
+
+    Returns:
+        list: Dicts with ``question_id``, ``question_text``, ``total_votes``
+        and ``trending_score`` (votes weighted by how recent they are).
+    """
+    board = get_board()
+    ids = board.top(ranking, limit)
+    found = {pk: (text, total) for pk, text, total in
+             Question.objects.filter(pk__in=ids).values_list('pk', 'question_text', 'total_votes')}
+    offset = _rate() * ((now or timezone.now()) - EPOCH).total_seconds()
+    return [{
+        'question_id': pk,
+        'question_text': found[pk][0],
+        'total_votes': found[pk][1],
+        'trending_score': round(math.exp(board.scores[pk] - offset), 3) if pk in board.scores else 0.0,
+    } for pk in ids if pk in found]
@@ -0,0 +1,100 @@
+"""
+Live poll results for browsers connected over Server-Sent Events.
+
+Every open results page subscribes to the process-wide ``broadcaster``.  When
+a vote is recorded the vote path calls :meth:`ResultsBroadcaster.notify`, and
+the broadcaster loads the new tally once and hands that same payload to every
+subscriber of the question.  Bursts of votes are coalesced so each question
+publishes at most once per ``POLLS_LIVE_RESULTS_INTERVAL`` seconds, however
+many pages are listening.
+
+Subscriptions live on the ASGI server's event loop, so the stream endpoint
+needs the ASGI entry point in ``mysite/asgi.py``.  Notifications reach only
+the subscribers in the same process.
+"""
+import asyncio
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+
+from . import tallies
+
+
+class Subscription:
+    """One listener's queue of result updates; only the newest update is kept."""
+
+    def __init__(self, broadcaster, question_id):
+        self.broadcaster = broadcaster
+        self.question_id = question_id
+        self.queue = asyncio.Queue(maxsize=1)
+
+    async def get(self):
+        """Wait for the next result update."""
+        return await self.queue.get()
+
+    def put(self, payload):
+        if self.queue.full():
+            # A slow reader only needs the latest tally, not every one in between.
+            self.queue.get_nowait()
+        self.queue.put_nowait(payload)
+
+    def close(self):
+        self.broadcaster.unsubscribe(self)
+
+
+class ResultsBroadcaster:
+    """In-process pub/sub that fans one tally out to every subscriber of a question."""
+
+    def __init__(self, load=tallies.get_results, interval=None):
+        self.load = load
+        self._interval = interval
+        self._loop = None
+        self._subscribers = {}
+        self._scheduled = set()
+        self._last_published = {}
+
+    @property
+    def interval(self):
+        return settings.POLLS_LIVE_RESULTS_INTERVAL if self._interval is None else self._interval
+
+    def subscribe(self, question_id):
+        """Start listening for a question's updates.  Must be called on the event loop."""
+        self._loop = asyncio.get_running_loop()
+        subscription = Subscription(self, question_id)
+        self._subscribers.setdefault(question_id, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        subscribers = self._subscribers.get(subscription.question_id)
+        if subscribers is not None:
+            subscribers.discard(subscription)
+            if not subscribers:
+                del self._subscribers[subscription.question_id]
+                self._last_published.pop(subscription.question_id, None)
+
+    def notify(self, question_id):
+        """Tell subscribers that a question's results changed.  Safe to call from any thread."""
+        loop = self._loop
+        if loop is None or question_id not in self._subscribers or loop.is_closed():
+            return
+        loop.call_soon_threadsafe(self._schedule, question_id)
+
+    def _schedule(self, question_id):
+        if question_id in self._scheduled:
+            return
+        self._scheduled.add(question_id)
+        next_slot = self._last_published.get(question_id, 0) + self.interval
+        delay = max(0.0, next_slot - self._loop.time())
+        self._loop.create_task(self._publish(question_id, delay))
+
+    async def _publish(self, question_id, delay):
+        await asyncio.sleep(delay)
+        # Votes that arrive while the tally loads schedule the next publish.
+        self._scheduled.discard(question_id)
+        self._last_published[question_id] = self._loop.time()
+        payload = await sync_to_async(self.load)(question_id)
+        for subscription in list(self._subscribers.get(question_id, ())):
+            subscription.put(payload)
+
+
+broadcaster = ResultsBroadcaster()
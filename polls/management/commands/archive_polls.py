@@ -0,0 +1,32 @@
+import os
+
+from django.core.management.base import BaseCommand
+
+from polls import archive
+
+
+class Command(BaseCommand):
+    """Snapshot the results of long-closed polls, optionally moving their votes to files."""
+
+    help = ('Store the final results of questions closed for at least --closed-for days, so their results '
+            'pages no longer count votes. With --move-votes, also write each question\'s votes to a gzip '
+            'JSONL file in that directory and delete them from the database. Run it periodically, e.g. daily.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--closed-for', type=int, default=7,
+                            help='Only archive questions closed for at least this many days (default: 7).')
+        parser.add_argument('--move-votes', metavar='DIRECTORY',
+                            help='Move the votes of archived questions into files in this directory.')
+        parser.add_argument('--dry-run', action='store_true', help='List the questions without archiving them.')
+
+    def handle(self, *args, **options):
+        directory = options['move_votes']
+        if directory and not options['dry_run']:
+            os.makedirs(directory, exist_ok=True)
+        archived = 0
+        for question in archive.candidates(options['closed_for']).only('pk', 'question_text', 'total_votes'):
+            self.stdout.write(f'Question {question.pk}: {question.question_text} ({question.total_votes} votes)')
+            if not options['dry_run']:
+                archive.archive(question.pk, directory)
+                archived += 1
+        self.stdout.write(self.style.SUCCESS(f'Archived {archived} question(s).'))
@@ -0,0 +1,64 @@
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+# (label, POLLS_ASYNC_VIEWS, extra bench_polls arguments)
+MODES = (
+    ('sync/wsgi', 'False', []),
+    ('async/asgi', 'True', ['--asgi']),
+)
+
+
+class Command(BaseCommand):
+    """Compare the sync views under WSGI with the async views under ASGI."""
+
+    help = ('Run bench_polls against the sync views through the WSGI handler and against the async '
+            'views through the ASGI handler, each in its own process, and report them side by side.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--concurrency', type=int, default=64, help='Concurrent clients.')
+        parser.add_argument('--requests', type=int, default=1000, help='Requests per view and mode.')
+        parser.add_argument('--views', default='detail,results,vote')
+        parser.add_argument('--votes', type=int, default=10000, help='Votes already in the dataset.')
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--output', help='Also write the combined JSON report to this file.')
+
+    def handle(self, *args, **options):
+        report = {}
+        with tempfile.TemporaryDirectory() as workdir:
+            for label, async_views, extra in MODES:
+                output = os.path.join(workdir, 'report.json')
+                command = [
+                    sys.executable, str(settings.BASE_DIR / 'manage.py'), 'bench_polls',
+                    '--views', options['views'],
+                    '--concurrency', str(options['concurrency']),
+                    '--requests', str(options['requests']),
+                    '--votes', str(options['votes']),
+                    '--users', str(options['users']),
+                    '--output', output,
+                    *extra,
+                ]
+                # The URLconf picks its views at import, so each mode needs a fresh process.
+                env = {**os.environ, 'POLLS_ASYNC_VIEWS': async_views}
+                result = subprocess.run(command, env=env, capture_output=True, text=True)
+                if result.returncode:
+                    raise CommandError(f'Benchmark of {label} views failed:\n{result.stderr}')
+                with open(output) as fh:
+                    report[label] = json.load(fh)['views']
+
+        self.stdout.write(f'{"view":<10}{"mode":<13}{"req/s":>10}{"p50 ms":>10}{"p95 ms":>10}{"p99 ms":>10}'
+                          f'{"errors":>8}')
+        for view in report[MODES[0][0]]:
+            for label, stats in report.items():
+                stats = stats[view]
+                self.stdout.write(f'{view:<10}{label:<13}{stats["requests_per_second"]:>10}{stats["p50_ms"]:>10}'
+                                  f'{stats["p95_ms"]:>10}{stats["p99_ms"]:>10}{stats["errors"]:>8}')
+        if options['output']:
+            with open(options['output'], 'w') as fh:
+                json.dump({'concurrency': options['concurrency'], 'modes': report}, fh, indent=2)
+                fh.write('\n')
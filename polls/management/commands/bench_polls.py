@@ -0,0 +1,275 @@
+import asyncio
+import json
+import logging
+import os
+import queue
+import random
+import re
+import tempfile
+import threading
+import time
+from datetime import timedelta
+from io import StringIO
+
+from asgiref.sync import ThreadSensitiveContext
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import AsyncClient, Client, override_settings
+from django.test.utils import CaptureQueriesContext, setup_test_environment, teardown_test_environment
+from django.urls import reverse
+from django.utils import timezone
+
+from polls.models import Choice, Question, Vote
+
+VIEWS = ('index', 'detail', 'results', 'vote')
+QUERIES = re.compile(r'desc="(\d+) queries"')
+
+
+def percentile(sorted_values, fraction):
+    """Return the nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    rank = max(0, min(len(sorted_values) - 1, int(round(fraction * len(sorted_values))) - 1))
+    return sorted_values[rank]
+
+
+class Command(BaseCommand):
+    """Benchmark the polls views against a synthetic dataset."""
+
+    help = ('Build a synthetic polls dataset in a throwaway database, drive the index, detail, '
+            'results and vote views with concurrent clients, and report latency, throughput '
+            'and SQL query counts as JSON.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--questions', type=int, default=50)
+        parser.add_argument('--choices', type=int, default=4, help='Choices per question.')
+        parser.add_argument('--users', type=int, default=500)
+        parser.add_argument('--votes', type=int, default=10000)
+        parser.add_argument('--requests', type=int, default=200, help='Requests per view.')
+        parser.add_argument('--concurrency', type=int, default=8)
+        parser.add_argument('--views', default=','.join(VIEWS),
+                            help=f'Comma-separated views to drive (default: {",".join(VIEWS)}).')
+        parser.add_argument('--asgi', action='store_true',
+                            help='Send requests through the ASGI handler from concurrent asyncio tasks '
+                                 'instead of through the WSGI handler from threads.')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--output', help='Write the JSON report to this file instead of stdout.')
+        parser.add_argument('--fixtures', metavar='DIR',
+                            help='Also write the generated dataset as users.json and polls.json fixtures.')
+        parser.add_argument('--baseline', help='JSON report of an earlier run to compare against.')
+        parser.add_argument('--tolerance', type=float, default=0.2,
+                            help='Allowed fractional p95 slowdown against the baseline (default: 0.2).')
+
+    def handle(self, *args, **options):
+        views = [name.strip() for name in options['views'].split(',') if name.strip()]
+        unknown = set(views) - set(VIEWS)
+        if unknown:
+            raise CommandError(f'Unknown view(s): {", ".join(sorted(unknown))}')
+        self.rng = random.Random(options['seed'])
+
+        # Failed requests are counted in the report; don't also log each traceback.
+        logging.getLogger('django.request').setLevel(logging.CRITICAL)
+        # Every client shares one address; measure the views, not the rate limiter.
+        with tempfile.TemporaryDirectory() as workdir, override_settings(POLLS_RATE_LIMITS={}):
+            # A file database lets every client thread open its own connection.
+            connection.settings_dict['TEST']['NAME'] = os.path.join(workdir, 'bench.sqlite3')
+            setup_test_environment()
+            old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+            try:
+                dataset = self.build_dataset(options)
+                if options['fixtures']:
+                    self.write_fixtures(options['fixtures'])
+                report = {
+                    'dataset': {key: options[key] for key in ('questions', 'choices', 'users', 'votes')},
+                    'concurrency': options['concurrency'],
+                    'handler': 'asgi' if options['asgi'] else 'wsgi',
+                    'views': {name: (self.drive_async if options['asgi'] else self.drive)(name, dataset, options)
+                              for name in views},
+                }
+            finally:
+                connection.creation.destroy_test_db(old_name, verbosity=0)
+                teardown_test_environment()
+
+        output = json.dumps(report, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as fh:
+                fh.write(output + '\n')
+        else:
+            self.stdout.write(output)
+        if options['baseline']:
+            self.compare(report, options['baseline'], options['tolerance'])
+
+    def build_dataset(self, options):
+        """Create users, questions, choices and votes with bulk inserts."""
+        now = timezone.now()
+        password = make_password('bench-password')
+        users = User.objects.bulk_create(
+            [User(username=f'bench{n}', password=password) for n in range(options['users'])],
+            batch_size=1000,
+        )
+        questions = []
+        for n in range(options['questions']):
+            pub_date = now - timedelta(days=self.rng.randint(1, 365))
+            # Roughly one poll in five has closed; the rest are open.
+            end_date = None if n % 5 else pub_date + timedelta(days=self.rng.randint(0, 30))
+            if end_date and end_date > now:
+                end_date = now - timedelta(minutes=1)
+            questions.append(Question(question_text=f'Benchmark question {n}?', pub_date=pub_date, end_date=end_date))
+        questions = Question.objects.bulk_create(questions, batch_size=1000)
+        choices = Choice.objects.bulk_create(
+            [Choice(question=q, choice_text=f'Option {n}') for q in questions for n in range(options['choices'])],
+            batch_size=1000,
+        )
+        choices_by_question = {}
+        for choice in choices:
+            choices_by_question.setdefault(choice.question_id, []).append(choice.pk)
+
+        pairs = len(users) * len(questions)
+        if options['votes'] > pairs:
+            raise CommandError(f'At most {pairs} votes fit {len(users)} users and {len(questions)} questions.')
+        batch = []
+        for index in self.rng.sample(range(pairs), options['votes']):
+            user = users[index // len(questions)]
+            question = questions[index % len(questions)]
+            batch.append(Vote(user=user, question=question,
+                              choice_id=self.rng.choice(choices_by_question[question.pk])))
+            if len(batch) >= 5000:
+                Vote.objects.bulk_create(batch)
+                batch = []
+        Vote.objects.bulk_create(batch)
+        call_command('reconcile_votes', stdout=StringIO())
+
+        open_questions = [q for q in questions if q.end_date is None]
+        return {
+            'users': users,
+            'questions': questions,
+            'open_questions': open_questions or questions,
+            'choices': choices_by_question,
+        }
+
+    def write_fixtures(self, directory):
+        """Dump the generated dataset in the shape of data/users.json and data/polls.json."""
+        os.makedirs(directory, exist_ok=True)
+        call_command('dumpdata', 'auth.user', indent=2, output=os.path.join(directory, 'users.json'))
+        call_command('dumpdata', 'polls.question', 'polls.choice', 'polls.vote', indent=2,
+                     output=os.path.join(directory, 'polls.json'))
+
+    def make_request(self, name, dataset):
+        """Return a (method, url, data) tuple for one request to the named view."""
+        if name == 'index':
+            return 'get', reverse('polls:index'), None
+        if name == 'vote':
+            question = self.rng.choice(dataset['open_questions'])
+            data = {'choice': self.rng.choice(dataset['choices'][question.pk])}
+            return 'post', reverse('polls:vote', args=(question.pk,)), data
+        question = self.rng.choice(dataset['open_questions'] if name == 'detail' else dataset['questions'])
+        return 'get', reverse(f'polls:{name}', args=(question.pk,)), None
+
+    def drive(self, name, dataset, options):
+        """Send ``--requests`` requests to one view from ``--concurrency`` threads and summarise them."""
+        work = queue.Queue()
+        for _ in range(options['requests']):
+            work.put(self.make_request(name, dataset))
+        users = self.rng.sample(dataset['users'], min(options['concurrency'], len(dataset['users'])))
+        clients = []
+        for user in users:
+            # Failed requests are reported as 500s and counted rather than raised.
+            client = Client(raise_request_exception=False)
+            client.force_login(user)
+            clients.append(client)
+        samples = []
+        lock = threading.Lock()
+
+        def worker(client):
+            try:
+                while True:
+                    try:
+                        method, url, data = work.get_nowait()
+                    except queue.Empty:
+                        return
+                    with CaptureQueriesContext(connection) as queries:
+                        start = time.perf_counter()
+                        response = getattr(client, method)(url, data)
+                        elapsed = time.perf_counter() - start
+                    with lock:
+                        samples.append((elapsed, len(queries), response.status_code >= 400))
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=worker, args=(client,)) for client in clients]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return self.summarise(samples, time.perf_counter() - started)
+
+    def drive_async(self, name, dataset, options):
+        """Like drive(), but through the ASGI handler from ``--concurrency`` asyncio tasks."""
+        work = [self.make_request(name, dataset) for _ in range(options['requests'])]
+        users = self.rng.sample(dataset['users'], min(options['concurrency'], len(dataset['users'])))
+        clients = []
+        for user in users:
+            client = AsyncClient(raise_request_exception=False)
+            client.force_login(user)
+            clients.append(client)
+        samples = []
+
+        async def worker(client):
+            while work:
+                method, url, data = work.pop()
+                start = time.perf_counter()
+                # An ASGI server gives each request its own thread for sync code; the test client doesn't.
+                async with ThreadSensitiveContext():
+                    response = await getattr(client, method)(url, data)
+                elapsed = time.perf_counter() - start
+                # Queries run on worker threads, so they are read from the Server-Timing header.
+                match = QUERIES.search(response.get('Server-Timing', ''))
+                samples.append((elapsed, int(match.group(1)) if match else 0, response.status_code >= 400))
+
+        async def run():
+            await asyncio.gather(*(worker(client) for client in clients))
+
+        started = time.perf_counter()
+        asyncio.run(run())
+        return self.summarise(samples, time.perf_counter() - started)
+
+    def summarise(self, samples, wall):
+        """Reduce (seconds, queries, failed) samples to the report's statistics."""
+        latencies = sorted(elapsed * 1000 for elapsed, _, _ in samples)
+        # Error pages can run extra queries of their own, so only successful requests are counted.
+        query_counts = [count for _, count, failed in samples if not failed]
+        return {
+            'requests': len(samples),
+            'errors': sum(1 for _, _, failed in samples if failed),
+            'requests_per_second': round(len(samples) / wall, 1) if wall else 0.0,
+            'p50_ms': round(percentile(latencies, 0.50), 2),
+            'p95_ms': round(percentile(latencies, 0.95), 2),
+            'p99_ms': round(percentile(latencies, 0.99), 2),
+            'queries_per_request': round(sum(query_counts) / len(query_counts), 2) if query_counts else 0.0,
+            'max_queries': max(query_counts, default=0),
+        }
+
+    def compare(self, report, baseline_path, tolerance):
+        """Raise CommandError if any view got slower or issues more queries than the baseline."""
+        with open(baseline_path) as fh:
+            baseline = json.load(fh)
+        regressions = []
+        for name, stats in report['views'].items():
+            before = baseline.get('views', {}).get(name)
+            if before is None:
+                continue
+            if stats['p95_ms'] > before['p95_ms'] * (1 + tolerance):
+                regressions.append(f'{name}: p95 {before["p95_ms"]} ms -> {stats["p95_ms"]} ms')
+            if stats['errors'] > before['errors']:
+                regressions.append(f'{name}: errors {before["errors"]} -> {stats["errors"]}')
+            if stats['queries_per_request'] > before['queries_per_request']:
+                regressions.append(
+                    f'{name}: queries/request {before["queries_per_request"]} -> {stats["queries_per_request"]}'
+                )
+        if regressions:
+            raise CommandError('Performance regression against baseline:\n  ' + '\n  '.join(regressions))
+        self.stderr.write(self.style.SUCCESS('No regressions against the baseline.'))
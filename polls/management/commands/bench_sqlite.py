@@ -0,0 +1,55 @@
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+PROFILES = ('default', 'production')
+
+
+class Command(BaseCommand):
+    """Compare vote throughput under the default and the tuned SQLite profiles."""
+
+    help = ('Run the vote benchmark from bench_polls once per SQLITE_PROFILE, each in its own '
+            'process, and report throughput, latency and errors side by side.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--writers', type=int, default=16, help='Parallel voting clients.')
+        parser.add_argument('--requests', type=int, default=500, help='Votes submitted per profile.')
+        parser.add_argument('--votes', type=int, default=10000, help='Votes already in the dataset.')
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--output', help='Also write the combined JSON report to this file.')
+
+    def handle(self, *args, **options):
+        report = {}
+        with tempfile.TemporaryDirectory() as workdir:
+            for profile in PROFILES:
+                output = os.path.join(workdir, f'{profile}.json')
+                command = [
+                    sys.executable, str(settings.BASE_DIR / 'manage.py'), 'bench_polls',
+                    '--views', 'vote',
+                    '--concurrency', str(options['writers']),
+                    '--requests', str(options['requests']),
+                    '--votes', str(options['votes']),
+                    '--users', str(options['users']),
+                    '--output', output,
+                ]
+                # Settings are read at start-up, so each profile needs a fresh process.
+                env = {**os.environ, 'SQLITE_PROFILE': profile}
+                result = subprocess.run(command, env=env, capture_output=True, text=True)
+                if result.returncode:
+                    raise CommandError(f'Benchmark with SQLITE_PROFILE={profile} failed:\n{result.stderr}')
+                with open(output) as fh:
+                    report[profile] = json.load(fh)['views']['vote']
+
+        self.stdout.write(f'{"profile":<12}{"votes/s":>10}{"p50 ms":>10}{"p95 ms":>10}{"p99 ms":>10}{"errors":>8}')
+        for profile, stats in report.items():
+            self.stdout.write(f'{profile:<12}{stats["requests_per_second"]:>10}{stats["p50_ms"]:>10}'
+                              f'{stats["p95_ms"]:>10}{stats["p99_ms"]:>10}{stats["errors"]:>8}')
+        if options['output']:
+            with open(options['output'], 'w') as fh:
+                json.dump({'writers': options['writers'], 'profiles': report}, fh, indent=2)
+                fh.write('\n')
@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from polls import rollups
+
+
+class Command(BaseCommand):
+    """Fold old vote rollup buckets into coarser ones."""
+
+    help = ('Fold minute vote buckets older than POLLS_ROLLUP_MINUTE_HOURS into hours and hour buckets '
+            'older than POLLS_ROLLUP_HOUR_DAYS into days. Run it periodically, e.g. hourly from cron.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rebuild', action='store_true',
+                            help='First recreate every bucket from the Vote table, e.g. after a bulk import.')
+
+    def handle(self, *args, **options):
+        if options['rebuild']:
+            self.stdout.write(f'Rebuilt {rollups.rebuild()} minute bucket(s) from votes.')
+        self.stdout.write(self.style.SUCCESS(f'Folded {rollups.compact()} bucket(s).'))
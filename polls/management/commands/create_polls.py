@@ -0,0 +1,41 @@
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+
+from polls import authoring
+
+
+class Command(BaseCommand):
+    """Create questions with their choices from a CSV or JSON file."""
+
+    help = ('Create polls from a JSON list of {question_text, pub_date, end_date, choices} objects or a '
+            'CSV file with question_text, pub_date, end_date and choice_1, choice_2, ... columns. Every '
+            'poll is checked first; nothing is created if any of them is invalid.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('file')
+        parser.add_argument('--format', choices=authoring.FORMATS,
+                            help='File format; guessed from the extension by default.')
+        parser.add_argument('--batch-size', type=int, default=500,
+                            help='Rows per bulk insert (default: 500).')
+        parser.add_argument('--dry-run', action='store_true', help='Only check the file.')
+
+    def handle(self, *args, **options):
+        file_format = options['format'] or authoring.guess_format(options['file'])
+        if file_format is None:
+            raise CommandError('Cannot tell the file format from its extension; use --format.')
+        try:
+            # utf-8-sig also reads files that start with a byte order mark, as Excel saves CSV.
+            with open(options['file'], newline='', encoding='utf-8-sig') as fh:
+                polls = authoring.validate(authoring.read(fh, file_format))
+        except ValidationError as error:
+            raise CommandError('\n'.join(error.messages))
+        if options['dry_run']:
+            self.stdout.write(self.style.SUCCESS(f'{len(polls)} poll(s) are valid.'))
+            return
+        questions = authoring.create(polls, batch_size=options['batch_size'])
+        choices = sum(len(poll['choices']) for poll in polls)
+        self.stdout.write(self.style.SUCCESS(
+            f'Created {len(questions)} poll(s) with {choices} choice(s). Running servers without a shared cache '
+            f'list them within {settings.POLLS_SCHEDULE_CACHE_TIMEOUT} seconds.'
+        ))
@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand
+
+from polls import export
+
+
+class Command(BaseCommand):
+    """Stream votes or per-choice results to a CSV or JSONL file."""
+
+    help = ('Export the votes of some or all questions, or their per-choice totals with --summary, '
+            'as CSV or JSONL without loading them into memory.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('question_ids', nargs='*', type=int, help='Questions to export (default: all).')
+        parser.add_argument('--format', choices=export.FORMATS, default='csv')
+        parser.add_argument('--summary', action='store_true', help='One row per choice with its vote count.')
+        parser.add_argument('--output', help='Write to this file instead of stdout.')
+        parser.add_argument('--chunk-size', type=int, default=2000,
+                            help='Rows fetched from the database at a time (default: 2000).')
+
+    def handle(self, *args, **options):
+        columns, values = export.rows(options['question_ids'] or None, summary=options['summary'],
+                                      chunk_size=options['chunk_size'])
+        lines = export.encode(options['format'], columns, values)
+        if options['output']:
+            with open(options['output'], 'w', newline='') as fh:
+                fh.writelines(lines)
+        else:
+            for line in lines:
+                self.stdout.write(line, ending='')
@@ -0,0 +1,261 @@
+import csv
+import json
+import os
+import time
+from io import StringIO
+
+from django.contrib.auth.hashers import identify_hasher, is_password_usable, make_password
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from polls import content, leaderboard, rollups, schedule, tallies
+from polls.models import Choice, Question, Vote
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+# Models in the order their rows must be written, with the fields that refer to earlier models.
+MODELS = {
+    'auth.user': (User, {}),
+    'polls.question': (Question, {}),
+    'polls.choice': (Choice, {'question': 'polls.question'}),
+    'polls.vote': (Vote, {'user': 'auth.user', 'question': 'polls.question', 'choice': 'polls.choice'}),
+}
+
+# Counters kept in step with Vote rows; values in fixtures (such as data/polls-v1.json) are ignored
+# and the counters of imported questions are recomputed from their votes.
+COUNTER_FIELDS = {'total_votes', 'votes'}
+
+
+def iter_json_array(fh, chunk_size=1 << 16):
+    """Yield the objects of a top-level JSON array one at a time, reading the file in chunks."""
+    decoder = json.JSONDecoder()
+    buffer = ''
+    pos = 0
+    started = False
+    eof = False
+    while True:
+        while pos < len(buffer) and buffer[pos] in ' \t\r\n,':
+            pos += 1
+        if not started and pos < len(buffer):
+            if buffer[pos] != '[':
+                raise CommandError('Expected a JSON array of fixture objects.')
+            started = True
+            pos += 1
+            continue
+        if started and pos < len(buffer) and buffer[pos] == ']':
+            return
+        try:
+            if pos >= len(buffer):
+                raise ValueError
+            obj, end = decoder.raw_decode(buffer, pos)
+        except ValueError:
+            # The next object is incomplete: read more, or fail at the end of the file.
+            if eof:
+                if pos >= len(buffer) and not started:
+                    return
+                raise CommandError('Truncated or malformed JSON fixture.')
+            chunk = fh.read(chunk_size)
+            eof = not chunk
+            buffer = buffer[pos:] + chunk
+            pos = 0
+            continue
+        if not isinstance(obj, dict):
+            raise CommandError('Fixture arrays must contain objects.')
+        yield obj
+        pos = end
+
+
+def iter_jsonl(fh):
+    """Yield one fixture object per non-blank line."""
+    for line in fh:
+        if line.strip():
+            yield json.loads(line)
+
+
+def iter_csv(fh, model_label):
+    """Yield fixture objects from a CSV file with a header of ``pk`` and field names."""
+    for row in csv.DictReader(fh):
+        pk = row.pop('pk', None)
+        fields = {name: (value if value != '' else None) for name, value in row.items()}
+        yield {'model': model_label, 'pk': int(pk) if pk else None, 'fields': fields}
+
+
+class Command(BaseCommand):
+    """Stream large fixture files into the database in bulk."""
+
+    help = ('Import users, questions, choices and votes from fixtures shaped like data/users.json '
+            'and data/polls.json (or JSONL/CSV variants) with batched bulk inserts, without loading '
+            'whole files into memory.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('files', nargs='+')
+        parser.add_argument('--format', choices=['json', 'jsonl', 'csv'],
+                            help='File format; guessed from the extension by default.')
+        parser.add_argument('--model', choices=sorted(MODELS),
+                            help='Model of the rows in CSV files, which have no "model" column.')
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help='Rows per bulk insert and per transaction (default: 1000).')
+        parser.add_argument('--keep-pks', action='store_true',
+                            help='Insert rows with the primary keys from the file instead of new ones, and '
+                                 'let references to rows outside the files use those keys as they are.')
+        parser.add_argument('--skip-reconcile', action='store_true',
+                            help="Don't recompute the vote counters and rollups after importing votes.")
+
+    def handle(self, *args, **options):
+        self.batch_size = options['batch_size']
+        self.keep_pks = options['keep_pks']
+        if not self.keep_pks and not connection.features.can_return_rows_from_bulk_insert:
+            raise CommandError('This database cannot return new primary keys from bulk inserts; use --keep-pks.')
+        # Fixture primary key -> database primary key, per model.
+        self.id_maps = {label: {} for label in MODELS}
+        self.choice_questions = {}
+        self.pending = {label: [] for label in MODELS}
+        self.counts = {label: 0 for label in MODELS}
+        self.voted_users = set()
+        self.voted_questions = set()
+
+        started = time.perf_counter()
+        for path in options['files']:
+            for record in self.read(path, options['format'], options['model']):
+                label = record.get('model', '').lower()
+                if label not in MODELS:
+                    raise CommandError(f'{path}: unsupported model "{record.get("model")}".')
+                self.pending[label].append(record)
+                if len(self.pending[label]) >= self.batch_size:
+                    self.flush(label)
+            for label in MODELS:
+                self.flush(label)
+        elapsed = time.perf_counter() - started
+
+        if self.counts['polls.vote']:
+            if not options['skip_reconcile']:
+                call_command('reconcile_votes', stdout=StringIO())
+                rollups.rebuild(self.voted_questions)
+                leaderboard.rebuild()
+            Vote.forget_choices(self.voted_users)
+            for question_id in self.voted_questions:
+                tallies.invalidate(question_id)
+        for question_id in self.id_maps['polls.question'].values():
+            content.changed(question_id)
+        if self.counts['polls.question']:
+            schedule.invalidate()
+
+        total = sum(self.counts.values())
+        for label, count in self.counts.items():
+            if count:
+                self.stdout.write(f'{label}: {count} row(s)')
+        summary = f'Imported {total} row(s) in {elapsed:.1f} s ({total / elapsed if elapsed else 0:.0f} rows/s)'
+        if resource is not None:
+            # ru_maxrss is in kilobytes on Linux.
+            summary += f', peak memory {resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024:.0f} MB'
+        self.stdout.write(self.style.SUCCESS(summary + '.'))
+
+    def read(self, path, file_format, model_label):
+        extension = os.path.splitext(path)[1].lower()
+        file_format = file_format or {'.jsonl': 'jsonl', '.ndjson': 'jsonl', '.csv': 'csv'}.get(extension, 'json')
+        with open(path, newline='' if file_format == 'csv' else None, encoding='utf-8') as fh:
+            if file_format == 'csv':
+                if not model_label:
+                    raise CommandError('CSV files need --model.')
+                yield from iter_csv(fh, model_label)
+            elif file_format == 'jsonl':
+                yield from iter_jsonl(fh)
+            else:
+                yield from iter_json_array(fh)
+
+    def flush(self, label):
+        """Insert the pending rows of a model, after the rows they refer to."""
+        records = self.pending[label]
+        if not records:
+            return
+        for dependency in set(MODELS[label][1].values()):
+            self.flush(dependency)
+        self.pending[label] = []
+        with transaction.atomic():
+            getattr(self, 'insert_' + label.split('.')[1])(records)
+        self.counts[label] += len(records)
+
+    def build(self, label, record):
+        """Make an unsaved model instance from a fixture record, translating foreign keys."""
+        model, relations = MODELS[label]
+        values = {}
+        for name, value in record['fields'].items():
+            field = model._meta.get_field(name)
+            if field.many_to_many:
+                continue
+            if name in COUNTER_FIELDS:
+                continue
+            if name in relations:
+                if value is not None:
+                    value = self.resolve(label, record, name, int(value))
+                values[field.attname] = value
+            else:
+                values[name] = field.to_python(value) if isinstance(value, str) else value
+        if self.keep_pks and record.get('pk') is not None:
+            values['pk'] = record['pk']
+        return model(**values)
+
+    def resolve(self, label, record, name, value):
+        """Return the database key of a fixture row referred to by ``name``."""
+        target = MODELS[label][1][name]
+        if value in self.id_maps[target]:
+            return self.id_maps[target][value]
+        if self.keep_pks:
+            return value
+        raise CommandError(
+            f'{label} {record.get("pk")}: {name} {value} is not in the imported files. Import the '
+            f'{target} rows in the same run, or use --keep-pks if they already exist with the same keys.'
+        )
+
+    def remember(self, label, records, objects):
+        for record, obj in zip(records, objects):
+            if record.get('pk') is not None:
+                self.id_maps[label][int(record['pk'])] = obj.pk
+
+    def insert_user(self, records):
+        users = [self.build('auth.user', record) for record in records]
+        existing = dict(User.objects.filter(username__in=[u.username for u in users]).values_list('username', 'pk'))
+        new_users = []
+        for user in users:
+            if user.username in existing:
+                user.pk = existing[user.username]
+                continue
+            user.password = user.password or ''
+            if is_password_usable(user.password) and user.password:
+                try:
+                    identify_hasher(user.password)
+                except ValueError:
+                    # A plain-text password; hashed ones, blank ones and unusable "!" markers are stored as they are.
+                    user.password = make_password(user.password)
+            new_users.append(user)
+        User.objects.bulk_create(new_users, batch_size=self.batch_size)
+        self.remember('auth.user', records, users)
+
+    def insert_question(self, records):
+        questions = [self.build('polls.question', record) for record in records]
+        Question.objects.bulk_create(questions, batch_size=self.batch_size)
+        self.remember('polls.question', records, questions)
+
+    def insert_choice(self, records):
+        choices = [self.build('polls.choice', record) for record in records]
+        Choice.objects.bulk_create(choices, batch_size=self.batch_size)
+        self.remember('polls.choice', records, choices)
+        self.choice_questions.update((choice.pk, choice.question_id) for choice in choices)
+
+    def insert_vote(self, records):
+        votes = [self.build('polls.vote', record) for record in records]
+        unknown = {vote.choice_id for vote in votes if vote.question_id is None} - set(self.choice_questions)
+        if unknown:
+            self.choice_questions.update(Choice.objects.filter(pk__in=unknown).values_list('pk', 'question_id'))
+        for vote in votes:
+            if vote.question_id is None:
+                vote.question_id = self.choice_questions[vote.choice_id]
+            self.voted_users.add(vote.user_id)
+            self.voted_questions.add(vote.question_id)
+        # A user's existing vote on a question wins over one in the file.
+        Vote.objects.bulk_create(votes, batch_size=self.batch_size, ignore_conflicts=True)
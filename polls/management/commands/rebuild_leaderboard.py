@@ -0,0 +1,26 @@
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.management.base import BaseCommand
+
+from polls import leaderboard
+
+
+class Command(BaseCommand):
+    """Recompute the cached participation leaderboard."""
+
+    help = ('Rebuild the most-active and trending poll rankings from the stored vote counters and the '
+            'vote rollup buckets now, rather than when POLLS_LEADERBOARD_REFRESH expires. The rebuilt board '
+            'is stored in the cache, so it only reaches the running server when the cache is shared between '
+            'processes (e.g. Redis or Memcached), not with the default per-process LocMemCache.')
+
+    def handle(self, *args, **options):
+        board = leaderboard.rebuild()
+        self.stdout.write(self.style.SUCCESS(
+            f'Ranked {len(board.by_total)} question(s) by votes and {len(board.by_score)} by recent activity.'
+        ))
+        if isinstance(caches['default'], LocMemCache):
+            self.stderr.write(self.style.WARNING(
+                'The cache is private to this process, so running servers keep their own boards and '
+                f'rebuild them within {settings.POLLS_LEADERBOARD_REFRESH} seconds.'
+            ))
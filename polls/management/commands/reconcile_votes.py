@@ -0,0 +1,55 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count
+
+from polls import leaderboard
+from polls.models import Choice, Question, Vote
+
+
+class Command(BaseCommand):
+    """Recompute the denormalized vote counters from the Vote table, except for archived questions."""
+
+    help = ('Recompute Choice.votes and Question.total_votes from Vote rows and report any drift. '
+            'Archived questions are skipped, as their votes may have moved out.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Report drift without writing the corrected counters.')
+        parser.add_argument('--batch-size', type=int, default=500,
+                            help='Number of rows per bulk update (default: 500).')
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        votes = Vote.objects.filter(question__snapshot__isnull=True)
+        choices = Choice.objects.filter(question__snapshot__isnull=True)
+        questions = Question.objects.filter(snapshot__isnull=True)
+        choice_counts = dict(votes.values_list('choice_id').annotate(n=Count('id')).order_by())
+        question_totals = {}
+        drifted_choices = []
+        for choice in choices.only('id', 'question_id', 'votes').iterator(chunk_size=batch_size):
+            actual = choice_counts.get(choice.pk, 0)
+            question_totals[choice.question_id] = question_totals.get(choice.question_id, 0) + actual
+            if choice.votes != actual:
+                self.stdout.write(f'Choice {choice.pk}: stored {choice.votes}, actual {actual}')
+                choice.votes = actual
+                drifted_choices.append(choice)
+
+        drifted_questions = []
+        for question in questions.only('id', 'total_votes').iterator(chunk_size=batch_size):
+            actual = question_totals.get(question.pk, 0)
+            if question.total_votes != actual:
+                self.stdout.write(f'Question {question.pk}: stored {question.total_votes}, actual {actual}')
+                question.total_votes = actual
+                drifted_questions.append(question)
+
+        if not options['dry_run']:
+            with transaction.atomic():
+                Choice.objects.bulk_update(drifted_choices, ['votes'], batch_size=batch_size)
+                Question.objects.bulk_update(drifted_questions, ['total_votes'], batch_size=batch_size)
+            if drifted_questions:
+                leaderboard.rebuild()
+
+        verb = 'Found' if options['dry_run'] else 'Fixed'
+        self.stdout.write(self.style.SUCCESS(
+            f'{verb} drift in {len(drifted_choices)} choice(s) and {len(drifted_questions)} question(s).'
+        ))
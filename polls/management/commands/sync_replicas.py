@@ -0,0 +1,42 @@
+import sqlite3
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections
+
+
+class Command(BaseCommand):
+    """Copy the primary SQLite database into each read replica."""
+
+    help = ('Stand-in for replication between SQLite files: copy the primary database into every '
+            'database in DATABASE_REPLICAS with SQLite\'s online backup API, once or every --interval seconds.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--interval', type=float, default=0,
+                            help='Keep copying, this many seconds apart (default: copy once).')
+
+    def handle(self, *args, **options):
+        primary = connections[DEFAULT_DB_ALIAS]
+        if primary.vendor != 'sqlite':
+            raise CommandError('sync_replicas only copies SQLite databases; use the database\'s own replication.')
+        if not settings.POLLS_READ_REPLICAS:
+            raise CommandError('No replicas configured; set DATABASE_REPLICAS.')
+        while True:
+            start = time.perf_counter()
+            primary.ensure_connection()
+            for alias in settings.POLLS_READ_REPLICAS:
+                replica = connections[alias]
+                # Close the replica's own connection so the copy replaces the file it reads.
+                replica.close()
+                target = sqlite3.connect(replica.settings_dict['NAME'])
+                try:
+                    # Readers of the replica wait on its lock for the few milliseconds the copy takes.
+                    primary.connection.backup(target)
+                finally:
+                    target.close()
+            self.stdout.write(f'Copied the primary to {len(settings.POLLS_READ_REPLICAS)} replica(s) '
+                              f'in {(time.perf_counter() - start) * 1000:.0f} ms.')
+            if not options['interval']:
+                break
+            time.sleep(options['interval'])
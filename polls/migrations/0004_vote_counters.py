@@ -0,0 +1,41 @@
+# Generated by Django 5.0.14 on 2026-10-17 05:51
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def backfill_counters(apps, schema_editor):
+    """Populate the new counter columns from the existing Vote rows."""
+    Choice = apps.get_model('polls', 'Choice')
+    Question = apps.get_model('polls', 'Question')
+    choices = list(Choice.objects.annotate(num_votes=Count('vote')))
+    totals = {}
+    for choice in choices:
+        choice.votes = choice.num_votes
+        totals[choice.question_id] = totals.get(choice.question_id, 0) + choice.num_votes
+    Choice.objects.bulk_update(choices, ['votes'], batch_size=500)
+    questions = list(Question.objects.filter(pk__in=totals))
+    for question in questions:
+        question.total_votes = totals[question.pk]
+    Question.objects.bulk_update(questions, ['total_votes'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('polls', '0003_remove_choice_votes_vote'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='choice',
+            name='votes',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='question',
+            name='total_votes',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,64 @@
+# Generated by Django 5.0.14 on 2026-10-17 06:20
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count, Max, OuterRef, Subquery
+
+
+def backfill_and_deduplicate(apps, schema_editor):
+    """
+    Copy each vote's question from its choice, then keep only the newest vote
+    per (user, question) and recompute the vote counters to match.
+    """
+    Choice = apps.get_model('polls', 'Choice')
+    Question = apps.get_model('polls', 'Question')
+    Vote = apps.get_model('polls', 'Vote')
+
+    Vote.objects.update(
+        question_id=Subquery(Choice.objects.filter(pk=OuterRef('choice_id')).values('question_id')[:1])
+    )
+
+    duplicates = (Vote.objects.values('user_id', 'question_id')
+                  .annotate(n=Count('id'), newest=Max('id'))
+                  .filter(n__gt=1)
+                  .order_by())
+    for row in duplicates.iterator():
+        (Vote.objects.filter(user_id=row['user_id'], question_id=row['question_id'])
+         .exclude(pk=row['newest'])
+         .delete())
+
+    choices = list(Choice.objects.annotate(num_votes=Count('vote')))
+    totals = {}
+    for choice in choices:
+        choice.votes = choice.num_votes
+        totals[choice.question_id] = totals.get(choice.question_id, 0) + choice.num_votes
+    Choice.objects.bulk_update(choices, ['votes'], batch_size=500)
+    questions = list(Question.objects.all())
+    for question in questions:
+        question.total_votes = totals.get(question.pk, 0)
+    Question.objects.bulk_update(questions, ['total_votes'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('polls', '0004_vote_counters'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='vote',
+            name='question',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, to='polls.question'),
+        ),
+        migrations.RunPython(backfill_and_deduplicate, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='vote',
+            name='question',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='polls.question'),
+        ),
+        migrations.AddConstraint(
+            model_name='vote',
+            constraint=models.UniqueConstraint(fields=('user', 'question'), name='unique_vote_per_user_question'),
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 5.0.14 on 2026-10-17 12:40
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('polls', '0007_vote_timestamps_voterollup'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ResultSnapshot',
+            fields=[
+                ('question', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True,
+                                                  related_name='snapshot', serialize=False, to='polls.question')),
+                ('results', models.JSONField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('archive_file', models.CharField(blank=True, max_length=255)),
+            ],
+        ),
+    ]
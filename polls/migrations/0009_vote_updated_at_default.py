@@ -0,0 +1,19 @@
+# Generated by Django 5.0.14 on 2026-10-17 14:05
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('polls', '0008_result_snapshot'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='vote',
+            name='updated_at',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+    ]
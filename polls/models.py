@@ -1,10 +1,34 @@
 import datetime
+from django.conf import settings
 from django.contrib import admin
+from django.core.cache import cache
 from django.db import models
+from django.db.models import Q
 from django.utils import timezone
 from django.contrib.auth.models import User
 
 
+class QuestionQuerySet(models.QuerySet):
+    """Poll status filters evaluated by the database rather than per row in Python."""
+
+    def published(self, now=None):
+        return self.filter(pub_date__lte=now or timezone.now())
+
+    def upcoming(self, now=None):
+        return self.filter(pub_date__gt=now or timezone.now())
+
+    def open(self, now=None):
+        now = now or timezone.now()
+        return self.filter(Q(end_date__isnull=True) | Q(end_date__gte=now), pub_date__lte=now)
+
+    def closed(self, now=None):
+        return self.filter(end_date__lt=now or timezone.now())
+
+    def before(self, pub_date, pk):
+        """Questions that come after (pub_date, pk) in newest-first order, for keyset pagination."""
+        return self.filter(Q(pub_date__lt=pub_date) | Q(pub_date=pub_date, pk__lt=pk))
+
+
 class Question(models.Model):
     """
     Represents a question that can be asked in a poll.
@@ -13,10 +37,20 @@ class Question(models.Model):
         question_text (str): The text of the question.
         pub_date (datetime): The date and time when the question was published.
         end_date (datetime): The optional end date and time for the question.
+        total_votes (int): Number of votes cast for this question, kept in step with Vote rows.
     """
     question_text = models.CharField(max_length=200)
     pub_date = models.DateTimeField('date published')
     end_date = models.DateTimeField('date ended', null=True, blank=True)
+    total_votes = models.IntegerField(default=0)
+
+    objects = QuestionQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['pub_date', 'id'], name='polls_question_pub_date_idx'),
+            models.Index(fields=['end_date', 'pub_date'], name='polls_question_end_date_idx'),
+        ]
 
     @admin.display(
         boolean=True,
@@ -28,17 +62,20 @@ class Question(models.Model):
         return now - datetime.timedelta(days=1) <= self.pub_date <= now
 
     def is_published(self):
-        now = timezone.localtime(timezone.now())
+        now = timezone.now()
         return now >= self.pub_date
 
     def can_vote(self):
         """
         Check if the question is open for voting.
 
+        Views ask :mod:`polls.schedule` instead, which answers from a cached
+        set of open question ids.
+
         Returns:
             bool: True if the question is open for voting, False otherwise.
         """
-        now = timezone.localtime(timezone.now())
+        now = timezone.now()
         if self.end_date is None:
             return now >= self.pub_date
         else:
@@ -49,6 +86,13 @@ class Question(models.Model):
 
 
 class Choice(models.Model):
+    """
+    A possible answer to a question.
+
+    The ``votes`` column is a denormalized counter of the Vote rows for this
+    choice.  It is updated with F-expressions whenever a vote is cast, and can
+    be recomputed with ``manage.py reconcile_votes``.
+    """
     question = models.ForeignKey(Question, on_delete=models.CASCADE)
     choice_text = models.CharField(max_length=200)
     votes = models.IntegerField(default=0)
@@ -56,15 +100,27 @@ class Choice(models.Model):
     def __str__(self):
         return self.choice_text
 
-    @property
-    def votes(self):
-        return self.vote_set.count()
-
 
 class Vote(models.Model):
-    """Record a choice for a question made by a user."""
+    """
+    Record a choice for a question made by a user.
+
+    ``question`` duplicates ``choice.question`` so that the one-vote-per-user
+    rule can be enforced by a unique constraint on (user, question).
+    """
     user = models.ForeignKey(User, on_delete=models.CASCADE)
+    question = models.ForeignKey(Question, on_delete=models.CASCADE)
     choice = models.ForeignKey(Choice, on_delete=models.CASCADE)
+    created_at = models.DateTimeField(default=timezone.now)
+    # Set by save() rather than auto_now, which raw fixture loads skip, leaving the column NULL.
+    updated_at = models.DateTimeField(default=timezone.now)
+
+    CHOICES_CACHE_KEY = 'polls:voted:{}'
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'question'], name='unique_vote_per_user_question'),
+        ]
 
     @classmethod
     def get_vote(cls, question: Question, user: User):
@@ -77,10 +133,106 @@ class Vote(models.Model):
         if not user or not user.is_authenticated:
             return None
         try:
-            return Vote.objects.get(user=user, choice__question=question)
+            return Vote.objects.select_related('choice').get(user=user, question=question)
         except Vote.DoesNotExist:
             # no vote yet
             return None
 
+    @classmethod
+    def choices_for(cls, user: User, question_ids):
+        """Return the choices a user picked on several questions, with at most one query.
+
+        Lookups are cached per user, including the questions the user has not
+        voted on, and the cache is cleared by :meth:`forget_choices` when the
+        user votes.
+
+        :param user: the User whose votes to look up
+        :param question_ids: ids of the questions of interest
+        :returns: a dict mapping question id to chosen choice id, for the questions the user voted on
+        """
+        if not user or not user.is_authenticated:
+            return {}
+        key = cls.CHOICES_CACHE_KEY.format(user.pk)
+        known = cache.get(key) or {}
+        missing = [question_id for question_id in question_ids if question_id not in known]
+        if missing:
+            found = dict(cls.objects.filter(user=user, question_id__in=missing).values_list('question_id', 'choice_id'))
+            known.update({question_id: found.get(question_id) for question_id in missing})
+            cache.set(key, known, settings.POLLS_VOTED_CACHE_TIMEOUT)
+        return {question_id: known[question_id] for question_id in question_ids if known[question_id] is not None}
+
+    @classmethod
+    def forget_choices(cls, user_ids):
+        """Drop the cached choices_for() lookups of users who have just voted."""
+        cache.delete_many([cls.CHOICES_CACHE_KEY.format(user_id) for user_id in user_ids])
+
+    def save(self, *args, **kwargs):
+        if self.question_id is None and self.choice_id is not None:
+            self.question_id = self.choice.question_id
+        self.updated_at = timezone.now()
+        if kwargs.get('update_fields') is not None:
+            kwargs['update_fields'] = {*kwargs['update_fields'], 'updated_at'}
+        super().save(*args, **kwargs)
+
     def __str__(self):
         return f'Vote by {self.user.username} for {self.choice.choice_text}'
+
+
+class VoteRollup(models.Model):
+    """
+    Net change in a choice's vote count during one time bucket.
+
+    A new vote adds one to its choice's bucket; changing a vote also takes
+    one away from the previous choice, so summing a choice's buckets up to
+    some time gives its vote count at that time.  The vote path writes
+    minute buckets, and the ``compact_rollups`` command folds old ones into
+    hour and then day buckets.
+
+    Attributes:
+        question (Question): The question of the choice, for per-question queries.
+        choice (Choice): The choice whose count changed.
+        granularity (str): The length of the bucket, one of GRANULARITIES.
+        bucket (datetime): The start of the bucket.
+        votes (int): The net change in the choice's votes during the bucket.
+    """
+    GRANULARITIES = ('minute', 'hour', 'day')
+
+    question = models.ForeignKey(Question, on_delete=models.CASCADE)
+    choice = models.ForeignKey(Choice, on_delete=models.CASCADE)
+    granularity = models.CharField(max_length=6, choices=[(g, g) for g in GRANULARITIES])
+    bucket = models.DateTimeField()
+    votes = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['choice', 'granularity', 'bucket'], name='unique_rollup_bucket'),
+        ]
+        indexes = [
+            models.Index(fields=['question', 'bucket'], name='polls_rollup_question_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.choice.choice_text} {self.votes:+d} ({self.granularity} of {self.bucket})'
+
+
+class ResultSnapshot(models.Model):
+    """
+    The final results of a closed question, written once by ``archive_polls``.
+
+    Results pages read the snapshot instead of counting votes, so they cost
+    one row however many votes were cast, and the question's Vote rows can
+    be moved out to an archive file.
+
+    Attributes:
+        question (Question): The archived question.
+        results (dict): The tally in the shape returned by ``polls.tallies.tally()``.
+        created_at (datetime): When the question was archived.
+        archive_file (str): Where the question's raw votes were moved, if they were.
+    """
+    question = models.OneToOneField(Question, on_delete=models.CASCADE, primary_key=True, related_name='snapshot')
+    results = models.JSONField()
+    created_at = models.DateTimeField(auto_now_add=True)
+    archive_file = models.CharField(max_length=255, blank=True)
+
+    def __str__(self):
+        return f'Results of {self.question}'
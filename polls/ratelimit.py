@@ -0,0 +1,132 @@
+"""
+Token-bucket rate limiting for the vote and signup endpoints.
+
+Each user and each client address has a bucket per scope holding up to
+``BURST`` tokens, refilled at ``RATE`` tokens per minute; a request takes one
+token from the user's bucket and one from the address's, and is answered
+with ``429 Too Many Requests`` and a ``Retry-After`` header when either is
+empty.  An address's bucket is ``POLLS_RATE_LIMIT_IP_FACTOR`` times larger,
+as a campus network puts many users behind one address.
+
+Buckets are stored in the cache as (tokens, last refill time) and refilled
+lazily when read, so a check is one ``get_many`` and at most one
+``set_many`` and never touches the database.  Updates are serialized within
+a process only: with several processes sharing a cache, concurrent
+requests can occasionally get through together.  The client address is
+``REMOTE_ADDR``; behind a proxy it is the proxy's unless the proxy rewrites it.
+"""
+import math
+import threading
+import time
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse
+
+BUCKET_KEY = 'polls:ratelimit:{}:{}'
+REJECTED_KEY = 'polls:ratelimit:rejected:{}'
+
+# Serializes read-modify-write updates of the cached buckets within a process.
+_lock = threading.Lock()
+
+
+def get_limit(scope):
+    """Return the (tokens per second, burst) of a scope, or None if it is not limited."""
+    limit = settings.POLLS_RATE_LIMITS.get(scope)
+    if not limit or limit['RATE'] <= 0 or limit['BURST'] <= 0:
+        return None
+    return limit['RATE'] / 60, limit['BURST']
+
+
+def buckets(scope, user, address):
+    """Return the (cache key, rate, burst) of each bucket a request takes a token from."""
+    rate, burst = get_limit(scope)
+    factor = settings.POLLS_RATE_LIMIT_IP_FACTOR
+    found = [(BUCKET_KEY.format(scope, f'ip:{address}'), rate * factor, burst * factor)]
+    if user is not None and user.is_authenticated:
+        found.append((BUCKET_KEY.format(scope, f'user:{user.pk}'), rate, burst))
+    return found
+
+
+def take(scope, user, address, now=None):
+    """
+    Take a token from each of the request's buckets.
+
+    Returns:
+        float: 0 if the request is allowed, otherwise the seconds until it would be.
+    """
+    if get_limit(scope) is None:
+        return 0
+    now = time.time() if now is None else now
+    wanted = buckets(scope, user, address)
+    with _lock:
+        stored = cache.get_many([key for key, _, _ in wanted])
+        updated = {}
+        wait = 0
+        for key, rate, burst in wanted:
+            tokens, stamp = stored.get(key, (burst, now))
+            tokens = min(burst, tokens + (now - stamp) * rate)
+            if tokens < 1:
+                wait = max(wait, (1 - tokens) / rate)
+            updated[key] = (tokens - 1, now)
+        if wait:
+            _count(REJECTED_KEY.format(scope))
+            return wait
+        # An untouched bucket is full again after burst / rate seconds, so it can expire then.
+        timeout = math.ceil(max(burst / rate for _, rate, burst in wanted))
+        cache.set_many(updated, timeout)
+    return 0
+
+
+def too_many_requests(wait):
+    response = HttpResponse(f'Too many requests. Try again in {math.ceil(wait)} seconds.\n',
+                            status=429, content_type='text/plain')
+    response['Retry-After'] = str(math.ceil(wait))
+    return response
+
+
+def rate_limit(scope, methods=('POST',)):
+    """
+    Limit a view, sync or async, to the scope's rate for ``methods`` requests.
+
+    Args:
+        scope (str): A key of ``POLLS_RATE_LIMITS``.
+        methods (tuple): The request methods that take tokens; others pass freely.
+    """
+    def decorator(view):
+        if iscoroutinefunction(view):
+            @wraps(view)
+            async def wrapper(request, *args, **kwargs):
+                if request.method in methods:
+                    user = await request.auser()
+                    wait = await sync_to_async(take)(scope, user, request.META.get('REMOTE_ADDR'))
+                    if wait:
+                        return too_many_requests(wait)
+                return await view(request, *args, **kwargs)
+        else:
+            @wraps(view)
+            def wrapper(request, *args, **kwargs):
+                if request.method in methods:
+                    wait = take(scope, request.user, request.META.get('REMOTE_ADDR'))
+                    if wait:
+                        return too_many_requests(wait)
+                return view(request, *args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def stats():
+    """Return the number of rejected requests of each scope."""
+    keys = {scope: REJECTED_KEY.format(scope) for scope in settings.POLLS_RATE_LIMITS}
+    counts = cache.get_many(keys.values())
+    return {scope: {'rejected': counts.get(key, 0)} for scope, key in keys.items()}
+
+
+def _count(key):
+    try:
+        cache.incr(key)
+    except ValueError:
+        # The counter was never set or has been evicted.
+        cache.add(key, 1, None)
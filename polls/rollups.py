@@ -0,0 +1,163 @@
+"""
+Time-bucketed vote counts for participation analytics.
+
+The vote path adds each vote to a minute bucket of :class:`VoteRollup` in the
+same transaction as the vote itself, so "how fast did this poll fill up"
+reads a few hundred rollup rows instead of scanning the Vote table.  The
+``compact_rollups`` command periodically folds minute buckets older than
+``POLLS_ROLLUP_MINUTE_HOURS`` into hour buckets, and hour buckets older than
+``POLLS_ROLLUP_HOUR_DAYS`` into day buckets, so old polls keep a coarser but
+complete history.  Buckets are aligned to UTC.
+"""
+import datetime
+from collections import defaultdict
+from itertools import groupby
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, F, Sum
+from django.db.models.functions import Trunc
+from django.utils import timezone
+
+from .models import Vote, VoteRollup
+
+UTC = datetime.timezone.utc
+
+
+def truncate(moment, granularity):
+    """Return the start of the UTC bucket of ``granularity`` that contains ``moment``."""
+    moment = moment.astimezone(UTC).replace(second=0, microsecond=0)
+    if granularity in ('hour', 'day'):
+        moment = moment.replace(minute=0)
+    if granularity == 'day':
+        moment = moment.replace(hour=0)
+    return moment
+
+
+def _add(granularity, deltas):
+    """
+    Add vote changes to rollup buckets, creating the buckets that don't exist yet.
+
+    Args:
+        granularity (str): The granularity of the buckets.
+        deltas (dict): Maps ``(question_id, choice_id, bucket)`` to the change in votes.
+    """
+    deltas = {key: delta for key, delta in deltas.items() if delta}
+    if not deltas:
+        return
+    # Create missing buckets at zero first, so concurrent writers only ever increment.
+    VoteRollup.objects.bulk_create(
+        [VoteRollup(question_id=q, choice_id=c, granularity=granularity, bucket=bucket) for q, c, bucket in deltas],
+        ignore_conflicts=True,
+    )
+    grouped = defaultdict(list)
+    for (_, choice_id, bucket), delta in deltas.items():
+        grouped[bucket, delta].append(choice_id)
+    for (bucket, delta), choice_ids in grouped.items():
+        (VoteRollup.objects.filter(choice_id__in=choice_ids, granularity=granularity, bucket=bucket)
+         .update(votes=F('votes') + delta))
+
+
+def record(deltas, now=None):
+    """
+    Add vote changes to the current minute bucket; call inside the vote's transaction.
+
+    Args:
+        deltas (dict): Maps ``(question_id, choice_id)`` to the change in that choice's votes.
+    """
+    bucket = truncate(now or timezone.now(), 'minute')
+    _add('minute', {(q, c, bucket): delta for (q, c), delta in deltas.items()})
+
+
+def compact(now=None):
+    """
+    Fold old minute buckets into hours and old hour buckets into days.
+
+    Only whole coarser buckets are folded, so a bucket is never split
+    between two granularities.
+
+    Returns:
+        int: The number of rollup rows folded away.
+    """
+    now = now or timezone.now()
+    folded = 0
+    steps = (
+        ('minute', 'hour', datetime.timedelta(hours=settings.POLLS_ROLLUP_MINUTE_HOURS)),
+        ('hour', 'day', datetime.timedelta(days=settings.POLLS_ROLLUP_HOUR_DAYS)),
+    )
+    for finer, coarser, keep in steps:
+        cutoff = truncate(now - keep, coarser)
+        with transaction.atomic():
+            old = VoteRollup.objects.filter(granularity=finer, bucket__lt=cutoff)
+            sums = (old.annotate(start=Trunc('bucket', coarser, tzinfo=UTC))
+                    .values_list('question_id', 'choice_id', 'start')
+                    .annotate(total=Sum('votes'))
+                    .order_by())
+            _add(coarser, {(q, c, start): total for q, c, start, total in sums})
+            folded += old.delete()[0]
+    return folded
+
+
+def rebuild(question_ids=None, batch_size=1000):
+    """
+    Recreate minute buckets from the Vote table, for votes that bypassed the vote path.
+
+    Each vote counts once, for its current choice, at its creation time;
+    earlier choices of changed votes are not recorded in the Vote table.
+    Archived questions keep their buckets, as their votes may have moved out.
+
+    Returns:
+        int: The number of buckets written.
+    """
+    votes = Vote.objects.filter(question__snapshot__isnull=True)
+    rollups = VoteRollup.objects.filter(question__snapshot__isnull=True)
+    if question_ids is not None:
+        votes = votes.filter(question_id__in=question_ids)
+        rollups = rollups.filter(question_id__in=question_ids)
+    counts = (votes.annotate(start=Trunc('created_at', 'minute', tzinfo=UTC))
+              .values_list('question_id', 'choice_id', 'start')
+              .annotate(n=Count('id'))
+              .order_by())
+    written = 0
+    with transaction.atomic():
+        rollups.delete()
+        batch = []
+        for question_id, choice_id, start, n in counts.iterator(chunk_size=batch_size):
+            batch.append(VoteRollup(question_id=question_id, choice_id=choice_id,
+                                    granularity='minute', bucket=start, votes=n))
+            if len(batch) >= batch_size:
+                written += len(VoteRollup.objects.bulk_create(batch))
+                batch = []
+        written += len(VoteRollup.objects.bulk_create(batch))
+    return written
+
+
+def series(question_id, granularity='hour'):
+    """
+    Return a question's votes over time, reading only the rollup table.
+
+    Buckets already compacted to a coarser granularity than requested
+    appear once, at the start of their coarser bucket.
+
+    Returns:
+        dict: ``question_id``, ``granularity`` and a ``buckets`` list of dicts with
+        ``start``, ``votes`` (net change per choice id), ``total`` (net new
+        votes) and ``cumulative`` (votes cast by the end of the bucket).
+    """
+    rows = (VoteRollup.objects.filter(question_id=question_id)
+            .annotate(start=Trunc('bucket', granularity, tzinfo=UTC))
+            .values_list('start', 'choice_id')
+            .annotate(total=Sum('votes'))
+            .order_by('start', 'choice_id'))
+    buckets = []
+    cumulative = 0
+    for start, group in groupby(rows, key=lambda row: row[0]):
+        votes = {choice_id: total for _, choice_id, total in group}
+        cumulative += sum(votes.values())
+        buckets.append({
+            'start': start.isoformat(),
+            'votes': votes,
+            'total': sum(votes.values()),
+            'cumulative': cumulative,
+        })
+    return {'question_id': question_id, 'granularity': granularity, 'buckets': buckets}
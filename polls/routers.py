@@ -0,0 +1,115 @@
+"""
+Primary/replica database routing for the polls app.
+
+With ``DATABASE_REPLICAS`` set, reads of polls models (the poll list,
+results pages and APIs) go to a randomly chosen replica while every write,
+and every read inside a transaction on the primary such as the vote path's
+``select_for_update()``, goes to the primary.  Other apps (auth, sessions,
+admin) always use the primary.
+
+A user who has just voted must see their own vote, so PinPrimaryMiddleware
+sends a whole request to the primary when it is an unsafe method, and for
+``POLLS_REPLICA_PIN_SECONDS`` after one via a cookie.
+
+Pinning alone is not enough, because shared cache entries can be filled by
+anyone: ``tallies.get_results()`` counts results whose version is younger
+than ``POLLS_REPLICA_PIN_SECONDS`` on the primary, and ``schedule`` always
+builds from the primary, so nothing read from a lagging replica is cached
+in their place.  Replication must keep up within the pin window.
+
+Replicas are plain copies: with SQLite, ``sync_replicas`` copies the primary
+into each replica file and stands in for real replication.
+"""
+import random
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+PIN_COOKIE = 'polls_primary_until'
+
+_use_primary = ContextVar('polls_use_primary', default=False)
+
+
+@contextmanager
+def use_primary():
+    """Send every polls read in the block to the primary."""
+    token = _use_primary.set(True)
+    try:
+        yield
+    finally:
+        _use_primary.reset(token)
+
+
+class PrimaryReplicaRouter:
+    """Route polls reads to the replicas in ``POLLS_READ_REPLICAS`` and everything else to the primary."""
+
+    app_label = 'polls'
+
+    def db_for_read(self, model, **hints):
+        if model._meta.app_label != self.app_label or not settings.POLLS_READ_REPLICAS:
+            return None
+        if _use_primary.get() or connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+        return random.choice(settings.POLLS_READ_REPLICAS)
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same rows as the primary.
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == DEFAULT_DB_ALIAS
+
+
+class PinPrimaryMiddleware:
+    """Serve writes, and reads shortly after a write, from the primary database."""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        token = _use_primary.set(self.pinned(request))
+        try:
+            response = self.get_response(request)
+        finally:
+            _use_primary.reset(token)
+        return self.pin(request, response)
+
+    async def __acall__(self, request):
+        # Sync code called by the view inherits this context, and so the flag.
+        token = _use_primary.set(self.pinned(request))
+        try:
+            response = await self.get_response(request)
+        finally:
+            _use_primary.reset(token)
+        return self.pin(request, response)
+
+    @staticmethod
+    def pinned(request):
+        if request.method not in ('GET', 'HEAD', 'OPTIONS', 'TRACE'):
+            return True
+        try:
+            return float(request.COOKIES.get(PIN_COOKIE, 0)) > time.time()
+        except ValueError:
+            return False
+
+    @staticmethod
+    def pin(request, response):
+        if settings.POLLS_READ_REPLICAS and request.method == 'POST' and response.status_code < 400:
+            seconds = settings.POLLS_REPLICA_PIN_SECONDS
+            response.set_cookie(PIN_COOKIE, str(time.time() + seconds), max_age=seconds,
+                                httponly=True, samesite='Lax')
+        return response
@@ -0,0 +1,97 @@
+"""
+The poll schedule: which questions are open right now, and until when that holds.
+
+Whether a poll is open only changes when a ``pub_date`` or ``end_date``
+passes, or when a question is edited.  The schedule caches the ids of the
+open and upcoming questions together with the next of those boundaries, so
+listing pages and the vote gate answer "is this poll open?" with a set
+lookup.  It is rebuilt, in two queries, the first time it is read after the
+boundary, and dropped by the Question signal receivers on every edit.
+
+Those receivers only reach the cache of the process that made the edit.
+With the default per-process ``LocMemCache``, questions created or edited
+elsewhere (by ``create_polls``, ``import_polls`` or another worker) are
+picked up when the schedule is next rebuilt, which happens at least every
+``POLLS_SCHEDULE_CACHE_TIMEOUT`` seconds.  A shared cache such as Redis or
+Memcached makes edits visible to every process at once.  The schedule is
+always built from the primary database, so a lagging read replica cannot
+hide a new question from it.
+"""
+import datetime
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Min, Q
+from django.utils import timezone
+
+from .models import Question
+from .routers import use_primary
+
+SCHEDULE_KEY = 'polls:schedule'
+
+OPEN = 'open'
+UPCOMING = 'upcoming'
+CLOSED = 'closed'
+
+
+def build(now=None):
+    """
+    Compute the schedule from the database.
+
+    Returns:
+        dict: ``open`` and ``upcoming`` frozensets of question ids, and
+        ``valid_until``, the next time a question opens or closes or
+        ``POLLS_SCHEDULE_CACHE_TIMEOUT`` seconds from now, whichever is first.
+    """
+    now = now or timezone.now()
+    open_ids = []
+    upcoming_ids = []
+    # Archived questions stay closed even if their end_date is moved: their results are frozen.
+    current = Question.objects.filter(Q(end_date__isnull=True) | Q(end_date__gte=now), snapshot__isnull=True)
+    for pk, pub_date in current.values_list('pk', 'pub_date'):
+        (open_ids if pub_date <= now else upcoming_ids).append(pk)
+    boundaries = Question.objects.aggregate(
+        next_pub=Min('pub_date', filter=Q(pub_date__gt=now)),
+        next_end=Min('end_date', filter=Q(end_date__gte=now)),
+    )
+    moments = [moment for moment in boundaries.values() if moment is not None]
+    moments.append(now + datetime.timedelta(seconds=settings.POLLS_SCHEDULE_CACHE_TIMEOUT))
+    return {
+        'open': frozenset(open_ids),
+        'upcoming': frozenset(upcoming_ids),
+        'valid_until': min(moments),
+    }
+
+
+def get(now=None):
+    """Return the current schedule, rebuilding it if it was dropped or has expired."""
+    now = now or timezone.now()
+    current = cache.get(SCHEDULE_KEY)
+    if current is None or now >= current['valid_until']:
+        with use_primary():
+            current = build(now)
+        cache.set(SCHEDULE_KEY, current, settings.POLLS_SCHEDULE_CACHE_TIMEOUT)
+    return current
+
+
+def invalidate():
+    """Drop the schedule after a question was created, edited or deleted."""
+    cache.delete(SCHEDULE_KEY)
+
+
+def open_ids(now=None):
+    """Return the ids of the questions open for voting."""
+    return get(now)['open']
+
+
+def is_open(question_id, now=None):
+    """Return True if the question is open for voting."""
+    return question_id in get(now)['open']
+
+
+def status(question_id, now=None):
+    """Return OPEN, UPCOMING or CLOSED for a question."""
+    current = get(now)
+    if question_id in current['open']:
+        return OPEN
+    return UPCOMING if question_id in current['upcoming'] else CLOSED
@@ -0,0 +1,52 @@
+"""Signal receivers that keep cached poll pages, vote counters and users in step with edits."""
+from django.contrib.auth.models import User
+from django.contrib.auth.signals import user_logged_out
+from django.db.models import QuerySet
+from django.db.models.signals import post_delete, post_save, pre_delete
+from django.dispatch import receiver
+
+from . import auth, content, leaderboard, schedule, tallies, voting
+from .models import Choice, Question, Vote
+
+
+@receiver([post_save, post_delete], sender=Question)
+def question_changed(sender, instance, **kwargs):
+    content.changed(instance.pk)
+    tallies.invalidate(instance.pk)
+    schedule.invalidate()
+
+
+@receiver(post_delete, sender=Question)
+def question_deleted(sender, instance, **kwargs):
+    leaderboard.forget(instance.pk)
+
+
+@receiver([post_save, post_delete], sender=Choice)
+def choice_changed(sender, instance, **kwargs):
+    content.changed(instance.question_id)
+    tallies.invalidate(instance.question_id)
+
+
+@receiver(pre_delete, sender=Choice)
+def choice_deleting(sender, instance, origin=None, **kwargs):
+    # A deleted question takes its counters with it; otherwise its total must drop.
+    if isinstance(origin, Question) or (isinstance(origin, QuerySet) and origin.model is Question):
+        return
+    voting.retract_votes(Vote.objects.filter(choice=instance))
+
+
+@receiver(pre_delete, sender=User)
+def user_deleting(sender, instance, **kwargs):
+    # The cascade would delete the user's votes without taking them off the counters.
+    voting.retract_votes(Vote.objects.filter(user=instance))
+
+
+@receiver([post_save, post_delete], sender=User)
+def user_changed(sender, instance, **kwargs):
+    auth.forget_user(instance.pk)
+
+
+@receiver(user_logged_out)
+def logged_out(sender, request, user, **kwargs):
+    if user is not None:
+        auth.forget_user(user.pk)
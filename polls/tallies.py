@@ -0,0 +1,107 @@
+"""
+Poll result tallies served from Django's cache framework.
+
+Each question has a version number stored in the cache.  Cached tallies are
+keyed by question id *and* version, so bumping the version after a vote makes
+every older entry unreachable without having to find and delete it.  Versions
+are seeded from the clock rather than starting at 1, so a version key that is
+evicted from the cache never comes back with a number that was used before.
+
+Because a version is the time it was created, a miss can tell whether the
+last vote was recent enough that a read replica may not have it yet; such
+tallies are counted on the primary, so the result cached under the new
+version always includes the vote that created it.
+"""
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count
+
+from .models import Choice, ResultSnapshot
+from .routers import use_primary
+
+VERSION_KEY = 'polls:results:version:{}'
+RESULTS_KEY = 'polls:results:{}:{}'
+HITS_KEY = 'polls:results:hits'
+MISSES_KEY = 'polls:results:misses'
+
+
+def get_version(question_id):
+    """Return the current results version for a question, creating one if needed."""
+    key = VERSION_KEY.format(question_id)
+    version = cache.get(key)
+    if version is None:
+        version = time.time_ns()
+        if not cache.add(key, version, None):
+            version = cache.get(key, version)
+    return version
+
+
+def invalidate(question_id):
+    """Move a question to a new results version so its cached tally is no longer used."""
+    cache.set(VERSION_KEY.format(question_id), time.time_ns(), None)
+
+
+def tally(question_id):
+    """
+    Count the votes for every choice of a question in a single query.
+
+    Returns:
+        dict: ``question_id``, ``total`` and a ``choices`` list of dicts with
+        ``id``, ``choice_text`` and ``votes``, ordered by choice id.
+    """
+    rows = (Choice.objects.filter(question_id=question_id)
+            .annotate(num_votes=Count('vote'))
+            .order_by('pk')
+            .values_list('pk', 'choice_text', 'num_votes'))
+    choices = [{'id': pk, 'choice_text': text, 'votes': votes} for pk, text, votes in rows]
+    return {
+        'question_id': question_id,
+        'total': sum(choice['votes'] for choice in choices),
+        'choices': choices,
+    }
+
+
+def get_results(question_id):
+    """
+    Return the tally for a question, from the cache when the current version is there.
+
+    On a miss, archived questions read their ResultSnapshot instead of counting votes.
+    """
+    version = get_version(question_id)
+    key = RESULTS_KEY.format(question_id, version)
+    results = cache.get(key)
+    if results is None:
+        _count(MISSES_KEY)
+        if time.time_ns() - version < settings.POLLS_REPLICA_PIN_SECONDS * 10**9:
+            with use_primary():
+                results = _compute(question_id)
+        else:
+            results = _compute(question_id)
+        cache.set(key, results, settings.POLLS_RESULTS_CACHE_TIMEOUT)
+    else:
+        _count(HITS_KEY)
+    return results
+
+
+def _compute(question_id):
+    results = ResultSnapshot.objects.filter(question_id=question_id).values_list('results', flat=True).first()
+    return tally(question_id) if results is None else results
+
+
+def cache_stats():
+    """Return the results cache hit and miss counts and the hit ratio."""
+    counts = cache.get_many([HITS_KEY, MISSES_KEY])
+    hits = counts.get(HITS_KEY, 0)
+    misses = counts.get(MISSES_KEY, 0)
+    lookups = hits + misses
+    return {'hits': hits, 'misses': misses, 'ratio': hits / lookups if lookups else 0.0}
+
+
+def _count(key):
+    try:
+        cache.incr(key)
+    except ValueError:
+        # The counter was never set or has been evicted.
+        cache.add(key, 1, None)
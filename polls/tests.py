@@ -1,9 +1,38 @@
+import asyncio
 import datetime
+import gzip
+import json
+import os
+import tempfile
+import threading
+import time
+from unittest import mock
+from io import StringIO
 
 from django.conf import settings
-from django.test import TestCase
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import IntegrityError, OperationalError, connections
+from django.db.utils import load_backend
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.db import connection
 from django.utils import timezone
-from .models import Question, Choice
+from asgiref.sync import sync_to_async
+from django.contrib.auth.models import AnonymousUser
+from django.http import HttpResponse
+from mysite import profiling
+from mysite import settings as project_settings
+from mysite.middleware import ServerTimingMiddleware
+from . import auth, authoring, leaderboard, ratelimit, rollups, schedule, tallies, views, voting
+from .buffer import CacheStore, MemoryStore, VoteBuffer
+from .admin import EstimatedCountPaginator
+from .live import ResultsBroadcaster
+from .routers import PIN_COOKIE, PinPrimaryMiddleware, PrimaryReplicaRouter, use_primary
+from .management.commands.import_polls import iter_json_array
+from .models import Question, Choice, ResultSnapshot, Vote, VoteRollup
 from urllib.parse import urlencode
 from django.contrib.auth.models import User
 import django.test
@@ -77,6 +106,29 @@ class QuestionIndexViewTests(TestCase):
         )
 
 
+class QuestionListingTests(TestCase):
+
+    def test_keyset_pagination(self):
+        """The index lists page_size questions and links to the next page by cursor."""
+        questions = [create_question(question_text=f"Question {n}.", days=-n) for n in range(1, 13)]
+        response = self.client.get(reverse('polls:index'))
+        self.assertEqual(response.context['latest_question_list'], questions[:10])
+        cursor = response.context['next_cursor']
+        response = self.client.get(reverse('polls:index'), {'before': cursor})
+        self.assertEqual(response.context['latest_question_list'], questions[10:])
+        self.assertIsNone(response.context['next_cursor'])
+
+    def test_status_filters(self):
+        """The status parameter lists open, upcoming or closed polls."""
+        past = timezone.now() - datetime.timedelta(days=1)
+        open_question = create_question(question_text="Open.", days=-5)
+        closed_question = create_question(question_text="Closed.", days=-5, end_date=past)
+        upcoming_question = create_question(question_text="Upcoming.", days=5)
+        for status, expected in (('open', open_question), ('closed', closed_question), ('upcoming', upcoming_question)):
+            response = self.client.get(reverse('polls:index'), {'status': status})
+            self.assertEqual(response.context['latest_question_list'], [expected])
+
+
 class QuestionModelTests(TestCase):
 
     def test_was_published_recently_with_future_question(self):
@@ -266,3 +318,1294 @@ class UserAuthTest(django.test.TestCase):
         # should be redirected to the login page with the next parameter included
         self.assertEqual(response.status_code, 302)
         self.assertRedirects(response, login_url)
+
+
+class VoteCounterTests(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user(username="voter", password="FatChance!")
+        self.question = create_question(question_text="Counter question.", days=-1)
+        self.choice1 = Choice.objects.create(question=self.question, choice_text="One")
+        self.choice2 = Choice.objects.create(question=self.question, choice_text="Two")
+        self.client.force_login(self.user)
+
+    def vote_for(self, choice):
+        return self.client.post(reverse('polls:vote', args=(self.question.id,)), {'choice': choice.id})
+
+    def test_new_vote_increments_counters(self):
+        """A first vote increments the chosen choice and the question total."""
+        self.vote_for(self.choice1)
+        self.choice1.refresh_from_db()
+        self.question.refresh_from_db()
+        self.assertEqual(self.choice1.votes, 1)
+        self.assertEqual(self.question.total_votes, 1)
+
+    def test_changed_vote_moves_counter(self):
+        """Changing a vote moves one count between choices and keeps the total."""
+        self.vote_for(self.choice1)
+        self.vote_for(self.choice2)
+        self.choice1.refresh_from_db()
+        self.choice2.refresh_from_db()
+        self.question.refresh_from_db()
+        self.assertEqual((self.choice1.votes, self.choice2.votes), (0, 1))
+        self.assertEqual(self.question.total_votes, 1)
+
+    def test_reconcile_votes_fixes_drift(self):
+        """reconcile_votes recomputes counters that no longer match the Vote table."""
+        Vote.objects.create(user=self.user, choice=self.choice2)
+        out = StringIO()
+        call_command('reconcile_votes', stdout=out)
+        self.choice2.refresh_from_db()
+        self.question.refresh_from_db()
+        self.assertEqual(self.choice2.votes, 1)
+        self.assertEqual(self.question.total_votes, 1)
+        self.assertIn('Fixed drift in 1 choice(s) and 1 question(s).', out.getvalue())
+
+    def assert_counts(self, choice1, choice2, total):
+        for obj in (self.choice1, self.choice2, self.question):
+            obj.refresh_from_db()
+        self.assertEqual((self.choice1.votes, self.choice2.votes, self.question.total_votes), (choice1, choice2, total))
+        self.assertEqual(tallies.get_results(self.question.id)['total'], total)
+
+    def test_cascaded_deletes_take_votes_off_the_counters(self):
+        """Deleting a user or a choice retracts the votes the cascade removes and refreshes the tally."""
+        cache.clear()
+        other = User.objects.create_user(username="other", password="FatChance!")
+        third = User.objects.create_user(username="third", password="FatChance!")
+        with self.captureOnCommitCallbacks(execute=True):
+            voting.cast_vote(self.user, self.choice1)
+            voting.cast_vote(other, self.choice2)
+            voting.cast_vote(third, self.choice2)
+        self.assert_counts(1, 2, 3)
+        with self.captureOnCommitCallbacks(execute=True):
+            other.delete()
+        self.assert_counts(1, 1, 2)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.choice2.delete()
+        self.question.refresh_from_db()
+        self.assertEqual(self.question.total_votes, 1)
+        self.assertEqual(tallies.get_results(self.question.id)['total'], 1)
+
+    def test_deleting_a_question_deletes_its_votes(self):
+        """A deleted question's choices and votes go without retracting them one by one."""
+        voting.cast_vote(self.user, self.choice1)
+        with mock.patch.object(voting, 'retract_votes', wraps=voting.retract_votes) as retract:
+            self.question.delete()
+        retract.assert_not_called()
+        self.assertFalse(Vote.objects.exists())
+
+
+class ResultsTallyTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username="voter", password="FatChance!")
+        self.question = create_question(question_text="Tally question.", days=-1)
+        self.choice1 = Choice.objects.create(question=self.question, choice_text="One")
+        self.choice2 = Choice.objects.create(question=self.question, choice_text="Two")
+        Vote.objects.create(user=self.user, choice=self.choice2)
+
+    def test_tally_counts_all_choices_in_one_query(self):
+        """tally() returns every choice with its vote count using a single query."""
+        with self.assertNumQueries(1):
+            results = tallies.tally(self.question.id)
+        self.assertEqual(results['total'], 1)
+        self.assertEqual([c['votes'] for c in results['choices']], [0, 1])
+
+    def test_cached_results_skip_the_database(self):
+        """A second lookup is a cache hit and runs no queries."""
+        tallies.get_results(self.question.id)
+        with self.assertNumQueries(0):
+            tallies.get_results(self.question.id)
+        self.assertEqual(tallies.cache_stats(), {'hits': 1, 'misses': 1, 'ratio': 0.5})
+
+    def test_vote_invalidates_cached_results(self):
+        """Voting bumps the question's results version so the next page shows the new count."""
+        tallies.get_results(self.question.id)
+        self.client.force_login(self.user)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('polls:vote', args=(self.question.id,)), {'choice': self.choice1.id})
+        response = self.client.get(reverse('polls:results', args=(self.question.id,)))
+        self.assertEqual([c['votes'] for c in response.context['results']['choices']], [1, 0])
+
+
+class CastVoteTests(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user(username="voter", password="FatChance!")
+        self.question = create_question(question_text="Upsert question.", days=-1)
+        self.choice1 = Choice.objects.create(question=self.question, choice_text="One")
+        self.choice2 = Choice.objects.create(question=self.question, choice_text="Two")
+
+    def test_vote_records_question(self):
+        """A vote saved with only a choice takes its question from the choice."""
+        vote = Vote.objects.create(user=self.user, choice=self.choice1)
+        self.assertEqual(vote.question_id, self.question.id)
+
+    def test_one_vote_per_user_per_question(self):
+        """The database rejects a second vote row for the same user and question."""
+        Vote.objects.create(user=self.user, choice=self.choice1)
+        with self.assertRaises(IntegrityError):
+            Vote.objects.create(user=self.user, choice=self.choice2)
+
+    def test_cast_vote_replaces_previous_vote(self):
+        """cast_vote() updates the existing row and reports the previous choice."""
+        self.assertIsNone(voting.cast_vote(self.user, self.choice1))
+        self.assertEqual(voting.cast_vote(self.user, self.choice2), self.choice1.id)
+        self.assertEqual(list(Vote.objects.values_list('choice_id', flat=True)), [self.choice2.id])
+        self.question.refresh_from_db()
+        self.assertEqual(self.question.total_votes, 1)
+
+    def test_racing_first_votes_are_counted_once(self):
+        """A first vote that loses the insert race to the same user's other vote is applied as a change."""
+        locked_choice = voting._locked_choice
+        calls = []
+
+        def racing(user_id, question_id):
+            calls.append(user_id)
+            if len(calls) == 1:
+                # Read "no vote yet", then let the other submission insert its row.
+                result = locked_choice(user_id, question_id)
+                voting.cast_vote(self.user, self.choice1)
+                return result
+            return locked_choice(user_id, question_id)
+
+        with mock.patch.object(voting, '_locked_choice', racing):
+            self.assertEqual(voting.cast_vote(self.user, self.choice2), self.choice1.id)
+        self.question.refresh_from_db()
+        self.choice1.refresh_from_db()
+        self.choice2.refresh_from_db()
+        self.assertEqual((self.question.total_votes, self.choice1.votes, self.choice2.votes), (1, 0, 1))
+        self.assertEqual(Vote.get_vote(self.question, self.user).choice, self.choice2)
+
+
+class ConcurrentVoteTests(SimpleTestCase):
+
+    def test_concurrent_votes_wait_for_the_write_lock(self):
+        """Transactions that read and then write, as a vote does, wait their turn instead of failing."""
+        directory = tempfile.mkdtemp()
+        database = connections.configure_settings({'default': {
+            **settings.DATABASES['default'], 'NAME': os.path.join(directory, 'votes.sqlite3'),
+        }})['default']
+        backend = load_backend(database['ENGINE'])
+        setup = backend.DatabaseWrapper(database, 'votes')
+        with setup.cursor() as cursor:
+            cursor.execute('CREATE TABLE tally (total integer)')
+            cursor.execute('INSERT INTO tally VALUES (0)')
+        setup.close()
+        voters = 8
+        barrier = threading.Barrier(voters)
+        errors = []
+
+        def vote():
+            conn = backend.DatabaseWrapper(database, 'votes')
+            try:
+                barrier.wait()
+                # What transaction.atomic() does on entry.
+                conn.set_autocommit(False, force_begin_transaction_with_broken_autocommit=True)
+                with conn.cursor() as cursor:
+                    cursor.execute('SELECT total FROM tally')
+                    total = cursor.fetchone()[0]
+                    time.sleep(0.02)
+                    cursor.execute('UPDATE tally SET total = %s', [total + 1])
+                conn.commit()
+            except OperationalError as error:
+                errors.append(error)
+                conn.rollback()
+            finally:
+                conn.close()
+
+        threads = [threading.Thread(target=vote) for _ in range(voters)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        check = backend.DatabaseWrapper(database, 'votes')
+        with check.cursor() as cursor:
+            cursor.execute('SELECT total FROM tally')
+            total = cursor.fetchone()[0]
+        check.close()
+        self.assertEqual(errors, [])
+        self.assertEqual(total, voters)
+
+
+class VoteBufferTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username="voter", password="FatChance!")
+        self.other = User.objects.create_user(username="other", password="FatChance!")
+        self.question = create_question(question_text="Buffered question.", days=-1)
+        self.choice1 = Choice.objects.create(question=self.question, choice_text="One")
+        self.choice2 = Choice.objects.create(question=self.question, choice_text="Two")
+
+    def assert_flush_is_last_write_wins(self, store):
+        buffer = VoteBuffer(store, batch_size=10, flush_interval=0)
+        buffer.submit(self.user.id, self.question.id, self.choice1.id)
+        buffer.submit(self.other.id, self.question.id, self.choice1.id)
+        buffer.submit(self.user.id, self.question.id, self.choice2.id)
+        self.assertEqual(Vote.objects.count(), 0)
+        self.assertEqual(buffer.flush(), 2)
+        self.assertEqual(len(buffer), 0)
+        self.assertEqual(Vote.get_vote(self.question, self.user).choice, self.choice2)
+        self.choice1.refresh_from_db()
+        self.choice2.refresh_from_db()
+        self.question.refresh_from_db()
+        self.assertEqual((self.choice1.votes, self.choice2.votes, self.question.total_votes), (1, 1, 2))
+
+    def test_memory_buffer_keeps_latest_vote(self):
+        """Only the latest queued vote per user and question is written."""
+        self.assert_flush_is_last_write_wins(MemoryStore())
+
+    def test_cache_buffer_keeps_latest_vote(self):
+        """The cache-backed store gives the same result as the in-memory one."""
+        self.assert_flush_is_last_write_wins(CacheStore())
+
+    def test_cache_buffer_waits_for_entries_being_written(self):
+        """A flush stops at a numbered entry not written yet, then writes it and later votes in order."""
+        store = CacheStore()
+        buffer = VoteBuffer(store, batch_size=10, flush_interval=0)
+        cache.add(CacheStore.TAIL_KEY, 0, None)
+        # A put() that has taken its number but not yet written its entry.
+        seq = cache.incr(CacheStore.TAIL_KEY)
+        buffer.submit(self.user.id, self.question.id, self.choice2.id)
+        self.assertEqual(buffer.flush(), 0)
+        self.assertEqual(len(buffer), 2)
+        cache.set(CacheStore.ENTRY_KEY.format(seq), (self.user.id, self.question.id, self.choice1.id), None)
+        self.assertEqual(buffer.flush(), 1)
+        self.assertEqual(len(buffer), 0)
+        self.assertEqual(Vote.get_vote(self.question, self.user).choice, self.choice2)
+
+    def test_cache_buffer_skips_abandoned_entries(self):
+        """An entry whose writer died is skipped after the gap timeout instead of blocking the queue."""
+        buffer = VoteBuffer(CacheStore(gap_timeout=0), batch_size=10, flush_interval=0)
+        cache.add(CacheStore.TAIL_KEY, 0, None)
+        cache.incr(CacheStore.TAIL_KEY)
+        buffer.submit(self.user.id, self.question.id, self.choice1.id)
+        buffer.flush()
+        with self.assertLogs('polls.buffer', 'WARNING'):
+            buffer.flush()
+        self.assertEqual(len(buffer), 0)
+        self.assertEqual(Vote.objects.count(), 1)
+
+    def test_cache_buffer_flushes_one_process_at_a_time(self):
+        """A flusher that cannot get the cache-wide lock gives up without touching the queue."""
+        store = CacheStore(lock_wait=0)
+        buffer = VoteBuffer(store, batch_size=10, flush_interval=0)
+        buffer.submit(self.user.id, self.question.id, self.choice1.id)
+        cache.add(CacheStore.LOCK_KEY, 'another-process', 60)
+        with self.assertRaises(TimeoutError):
+            buffer.flush()
+        self.assertEqual(len(buffer), 1)
+        cache.set(CacheStore.HEAD_KEY, 5, None)
+        store.ack(([], 0))
+        self.assertEqual(cache.get(CacheStore.HEAD_KEY), 5)
+
+    def test_full_buffer_flushes_on_submit(self):
+        """Reaching max_size writes the queue instead of growing it."""
+        buffer = VoteBuffer(MemoryStore(), max_size=1, flush_interval=0)
+        buffer.submit(self.user.id, self.question.id, self.choice1.id)
+        self.assertEqual(len(buffer), 0)
+        self.assertEqual(Vote.objects.count(), 1)
+
+    def test_full_buffer_leaves_a_locked_flush_to_its_holder(self):
+        """A submit that cannot get the flush lock queues the vote instead of failing the request."""
+        buffer = VoteBuffer(CacheStore(lock_wait=0), max_size=1, flush_interval=0)
+        cache.add(CacheStore.LOCK_KEY, 'another-process', 60)
+        buffer.submit(self.user.id, self.question.id, self.choice1.id)
+        self.assertEqual(len(buffer), 1)
+
+    def test_votes_of_deleted_users_are_dropped(self):
+        """A queued vote whose user was deleted before the flush doesn't hold up the others."""
+        buffer = VoteBuffer(MemoryStore(), batch_size=10, flush_interval=0)
+        buffer.submit(self.other.id, self.question.id, self.choice1.id)
+        buffer.submit(self.user.id, self.question.id, self.choice2.id)
+        self.other.delete()
+        self.assertEqual(buffer.flush(), 1)
+        self.assertEqual(len(buffer), 0)
+        connection.check_constraints()
+        self.assertEqual(list(Vote.objects.values_list('user_id', flat=True)), [self.user.id])
+
+
+class ServerTimingMiddlewareTests(TestCase):
+
+    def test_server_timing_header(self):
+        """Responses report SQL, template, view and total time in a Server-Timing header."""
+        create_question(question_text="Timed question.", days=-1)
+        response = self.client.get(reverse('polls:index'))
+        timing = response['Server-Timing']
+        for metric in ('db;dur=', 'queries"', 'tpl;dur=', 'view;dur=', 'total;dur='):
+            self.assertIn(metric, timing)
+
+    @override_settings(REQUEST_QUERY_BUDGET=0)
+    def test_over_budget_request_is_logged(self):
+        """A request over the query budget is logged with its SQL fingerprints."""
+        question = create_question(question_text="Timed question.", days=-1)
+        with self.assertLogs('mysite.middleware', level='WARNING') as logs:
+            self.client.get(reverse('polls:results', args=(question.id,)))
+        self.assertIn('polls_question', logs.output[0])
+        self.assertIn('WHERE "polls_question"."id" = %s', logs.output[0])
+
+
+class VotedLookupTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username="voter", password="FatChance!")
+        self.question1 = create_question(question_text="First.", days=-2)
+        self.question2 = create_question(question_text="Second.", days=-1)
+        self.choice1 = Choice.objects.create(question=self.question1, choice_text="One")
+        self.choice2 = Choice.objects.create(question=self.question2, choice_text="Two")
+        Vote.objects.create(user=self.user, choice=self.choice1)
+
+    def test_choices_for_uses_one_query_then_the_cache(self):
+        """choices_for() maps voted questions to choices in one query, then answers from the cache."""
+        ids = [self.question1.id, self.question2.id]
+        with self.assertNumQueries(1):
+            self.assertEqual(Vote.choices_for(self.user, ids), {self.question1.id: self.choice1.id})
+        with self.assertNumQueries(0):
+            self.assertEqual(Vote.choices_for(self.user, ids), {self.question1.id: self.choice1.id})
+
+    def test_voting_clears_cached_lookups(self):
+        """A new vote is visible to choices_for() straight away."""
+        ids = [self.question1.id, self.question2.id]
+        Vote.choices_for(self.user, ids)
+        with self.captureOnCommitCallbacks(execute=True):
+            voting.cast_vote(self.user, self.choice2)
+        self.assertEqual(Vote.choices_for(self.user, ids),
+                         {self.question1.id: self.choice1.id, self.question2.id: self.choice2.id})
+
+    def test_index_marks_voted_polls(self):
+        """The index passes the user's voted questions to the template."""
+        self.client.force_login(self.user)
+        response = self.client.get(reverse('polls:index'))
+        self.assertEqual(response.context['voted'], {self.question1.id: self.choice1.id})
+        self.assertContains(response, "(Voted)", count=1)
+
+
+class ResultsApiTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username="voter", password="FatChance!")
+        self.question = create_question(question_text="API question.", days=-1)
+        self.choice = Choice.objects.create(question=self.question, choice_text="One")
+        self.url = reverse('polls:results_api', args=(self.question.id,))
+
+    def test_results_json(self):
+        """The API returns per-choice counts and the total with an ETag and Last-Modified."""
+        response = self.client.get(self.url)
+        self.assertEqual(response.json(), {
+            'question_id': self.question.id,
+            'total': 0,
+            'choices': [{'id': self.choice.id, 'choice_text': 'One', 'votes': 0}],
+        })
+        self.assertTrue(response.has_header('ETag'))
+        self.assertTrue(response.has_header('Last-Modified'))
+
+    def test_unchanged_results_are_not_modified(self):
+        """A matching If-None-Match gets 304 without counting the votes."""
+        etag = self.client.get(self.url)['ETag']
+        with self.assertNumQueries(1):
+            response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+    def test_vote_changes_etag(self):
+        """After a vote the old ETag no longer matches."""
+        etag = self.client.get(self.url)['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            voting.cast_vote(self.user, self.choice)
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['total'], 1)
+
+    def test_missing_question(self):
+        """An unknown question id is a 404."""
+        response = self.client.get(reverse('polls:results_api', args=(self.question.id + 1,)))
+        self.assertEqual(response.status_code, 404)
+
+    def test_missing_question_gets_no_version(self):
+        """An unknown id is a 404 even with a matching ETag, and leaves nothing in the cache."""
+        missing = reverse('polls:results_api', args=(self.question.id + 1,))
+        response = self.client.get(missing)
+        self.assertEqual(response.status_code, 404)
+        self.assertFalse(response.has_header('ETag'))
+        self.assertIsNone(cache.get(tallies.VERSION_KEY.format(self.question.id + 1)))
+        # A version left over from a deleted question is not a match either.
+        tallies.invalidate(self.question.id + 1)
+        etag = f'"{tallies.get_version(self.question.id + 1)}"'
+        self.assertEqual(self.client.get(missing, HTTP_IF_NONE_MATCH=etag).status_code, 404)
+
+
+class ResultsBroadcasterTests(SimpleTestCase):
+
+    async def test_burst_is_coalesced_and_fanned_out(self):
+        """A burst of notifications loads the tally once and delivers it to every subscriber."""
+        loads = []
+
+        def load(question_id):
+            loads.append(question_id)
+            return {'question_id': question_id, 'total': len(loads)}
+
+        broadcaster = ResultsBroadcaster(load=load, interval=0.05)
+        first = broadcaster.subscribe(1)
+        second = broadcaster.subscribe(1)
+        for _ in range(10):
+            broadcaster.notify(1)
+        updates = [await asyncio.wait_for(s.get(), 1) for s in (first, second)]
+        self.assertEqual(loads, [1])
+        self.assertEqual(updates, [{'question_id': 1, 'total': 1}] * 2)
+        first.close()
+        second.close()
+
+    async def test_notify_without_subscribers_does_nothing(self):
+        """Questions nobody is watching cost nothing to notify."""
+        broadcaster = ResultsBroadcaster(load=self.fail, interval=0)
+        broadcaster.subscribe(1).close()
+        broadcaster.notify(1)
+        await asyncio.sleep(0.01)
+
+
+class ResultsStreamTests(TestCase):
+
+    def test_stream_is_refused_under_wsgi(self):
+        """Under WSGI the stream endpoint answers 204 so EventSource stops retrying."""
+        question = create_question(question_text="Streamed.", days=-1)
+        response = self.client.get(reverse('polls:results_stream', args=(question.id,)))
+        self.assertEqual(response.status_code, 204)
+
+    async def test_stream_sends_current_results(self):
+        """Under ASGI the stream opens with the current tally as a results event."""
+        question = await Question.objects.acreate(question_text="Streamed.", pub_date=timezone.now())
+        response = await self.async_client.get(reverse('polls:results_stream', args=(question.id,)))
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        first_event = await anext(aiter(response.streaming_content))
+        await response.streaming_content.aclose()
+        self.assertTrue(first_event.startswith(b'event: results\ndata: '))
+
+
+class FragmentCacheTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.question = create_question(question_text="Cached question.", days=-1)
+        self.choice = Choice.objects.create(question=self.question, choice_text="Original")
+        self.url = reverse('polls:detail', args=(self.question.id,))
+
+    def choice_queries(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(self.url)
+        return response, [q['sql'] for q in queries if 'FROM "polls_choice"' in q['sql']]
+
+    def test_cached_choice_list_skips_choice_query(self):
+        """Once the choice list fragment is cached, the detail page does not query choices."""
+        _, first = self.choice_queries()
+        response, second = self.choice_queries()
+        self.assertEqual(len(first), 1)
+        self.assertEqual(second, [])
+        self.assertContains(response, "Original")
+
+    def test_editing_a_choice_refreshes_the_fragment(self):
+        """Saving a choice, as the admin inline does, bumps the version and re-renders the list."""
+        self.client.get(self.url)
+        self.choice.choice_text = "Edited"
+        self.choice.save()
+        response = self.client.get(self.url)
+        self.assertContains(response, "Edited")
+        self.assertNotContains(response, "Original")
+
+
+class ImportPollsTests(TestCase):
+
+    HASHED = 'pbkdf2_sha256$720000$HQHsTk7NLnTwjXDTJiWWzo$V/KuaDlYGzcaOymuKrJKwv8BEgt82Oq01DN5A7tqsMk='
+
+    def write(self, suffix, text):
+        fh = tempfile.NamedTemporaryFile('w', suffix=suffix, delete=False)
+        fh.write(text)
+        fh.close()
+        self.addCleanup(os.remove, fh.name)
+        return fh.name
+
+    def test_shipped_fixtures_load(self):
+        """The fixtures in data/, loaded by the installation steps, fit the current schema."""
+        data = settings.BASE_DIR / 'data'
+        call_command('loaddata', data / 'users.json', data / 'polls.json', verbosity=0)
+        self.assertEqual(Vote.objects.count(), 9)
+        self.assertFalse(Vote.objects.filter(updated_at__isnull=True).exists())
+
+    def test_json_array_is_parsed_across_chunks(self):
+        """Objects split over read boundaries are decoded whole."""
+        records = [{'model': 'polls.question', 'pk': n, 'fields': {'question_text': 'Q, [x]?'}} for n in range(5)]
+        parsed = list(iter_json_array(StringIO(json.dumps(records, indent=2)), chunk_size=7))
+        self.assertEqual(parsed, records)
+
+    def test_import_remaps_keys_and_reconciles_counters(self):
+        """Rows get new primary keys, foreign keys follow them, and counters match the votes."""
+        create_question(question_text="Existing question.", days=-1)
+        users = self.write('.json', json.dumps([
+            {'model': 'auth.user', 'pk': 7, 'fields': {'username': 'hashed', 'password': self.HASHED}},
+            {'model': 'auth.user', 'pk': 8, 'fields': {'username': 'plain', 'password': 'FatChance!'}},
+        ]))
+        polls = self.write('.jsonl', '\n'.join(json.dumps(record) for record in [
+            {'model': 'polls.question', 'pk': 1,
+             'fields': {'question_text': 'Imported?', 'pub_date': '2023-09-11T12:53:25Z', 'end_date': None}},
+            {'model': 'polls.choice', 'pk': 1, 'fields': {'question': 1, 'choice_text': 'Yes'}},
+            {'model': 'polls.vote', 'pk': 1, 'fields': {'user': 7, 'choice': 1}},
+            {'model': 'polls.vote', 'pk': 2, 'fields': {'user': 8, 'choice': 1}},
+        ]))
+        out = StringIO()
+        call_command('import_polls', users, polls, batch_size=1, stdout=out)
+        question = Question.objects.get(question_text='Imported?')
+        choice = question.choice_set.get()
+        self.assertEqual(choice.votes, 2)
+        self.assertEqual(question.total_votes, 2)
+        self.assertEqual(User.objects.get(username='hashed').password, self.HASHED)
+        self.assertTrue(User.objects.get(username='plain').check_password('FatChance!'))
+        self.assertIn('Imported 6 row(s)', out.getvalue())
+
+    def test_passwordless_users_stay_passwordless(self):
+        """Unusable and blank passwords are kept as they are rather than hashed as plain text."""
+        unusable = User(username='x')
+        unusable.set_unusable_password()
+        path = self.write('.csv', f'pk,username,password\n7,nopass,{unusable.password}\n8,blank,\n')
+        call_command('import_polls', path, model='auth.user', stdout=StringIO())
+        nopass = User.objects.get(username='nopass')
+        self.assertEqual(nopass.password, unusable.password)
+        self.assertFalse(nopass.has_usable_password())
+        self.assertFalse(nopass.check_password(unusable.password))
+        self.assertEqual(User.objects.get(username='blank').password, '')
+
+    def test_csv_import(self):
+        """CSV rows name their model with --model and, with --keep-pks, refer to existing rows by key."""
+        question = create_question(question_text="CSV question.", days=-1)
+        path = self.write('.csv', f'pk,question,choice_text\n1,{question.pk},Red\n2,{question.pk},Blue\n')
+        call_command('import_polls', path, model='polls.choice', keep_pks=True, stdout=StringIO())
+        self.assertQuerysetEqual(question.choice_set.order_by('pk'), ['Red', 'Blue'], transform=str)
+
+    def test_unknown_references_are_refused(self):
+        """Without --keep-pks, a vote for a user missing from the files is an error, not a guess."""
+        existing = User.objects.create_user(username="bystander", password="FatChance!")
+        polls = self.write('.json', json.dumps([
+            {'model': 'polls.question', 'pk': 1, 'fields': {'question_text': 'Q?', 'pub_date': '2023-09-11T12:53:25Z'}},
+            {'model': 'polls.choice', 'pk': 1, 'fields': {'question': 1, 'choice_text': 'Yes'}},
+            {'model': 'polls.vote', 'pk': 1, 'fields': {'user': existing.pk, 'choice': 1}},
+        ]))
+        with self.assertRaisesMessage(CommandError, f'polls.vote 1: user {existing.pk} is not in the imported files'):
+            call_command('import_polls', polls, stdout=StringIO())
+        self.assertFalse(Vote.objects.exists())
+
+    def test_legacy_vote_counts_are_ignored(self):
+        """Choice.votes values in old fixtures do not leave the counters drifted."""
+        call_command('import_polls', os.path.join(settings.BASE_DIR, 'data', 'polls-v1.json'), stdout=StringIO())
+        out = StringIO()
+        call_command('reconcile_votes', dry_run=True, stdout=out)
+        self.assertIn('Found drift in 0 choice(s) and 0 question(s).', out.getvalue())
+
+
+class ExportTests(TestCase):
+
+    def setUp(self):
+        self.staff = User.objects.create_user(username="staff", password="FatChance!", is_staff=True)
+        self.question = create_question(question_text="Export question.", days=-1)
+        self.choice = Choice.objects.create(question=self.question, choice_text="Yes")
+        Choice.objects.create(question=self.question, choice_text="No")
+        voting.cast_vote(self.staff, self.choice)
+        self.url = reverse('polls:export')
+
+    def download(self, **params):
+        response = self.client.get(self.url, params)
+        return response, b''.join(response.streaming_content).decode()
+
+    def test_export_requires_staff(self):
+        """Non-staff users are sent to the admin login instead of getting the export."""
+        self.client.force_login(User.objects.create_user(username="student", password="FatChance!"))
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 302)
+
+    def test_votes_are_streamed_as_csv(self):
+        """Each vote is one CSV row after the header."""
+        self.client.force_login(self.staff)
+        response, body = self.download(question=self.question.id)
+        self.assertTrue(response.streaming)
+        self.assertEqual(body.splitlines(), [
+            'question_id,choice_id,choice_text,user_id,username',
+            f'{self.question.id},{self.choice.id},Yes,{self.staff.id},staff',
+        ])
+
+    async def test_export_is_streamed_asynchronously_under_asgi(self):
+        """Under ASGI rows are read a chunk at a time instead of being collected into a list first."""
+        await self.async_client.aforce_login(self.staff)
+        with mock.patch.object(views.export, 'aiterate', wraps=views.export.aiterate) as aiterate:
+            response = await self.async_client.get(self.url, {'question': self.question.id})
+        self.assertTrue(response.is_async)
+        aiterate.assert_called_once()
+        body = b''.join([chunk async for chunk in response.streaming_content]).decode()
+        self.assertEqual(body.splitlines()[1], f'{self.question.id},{self.choice.id},Yes,{self.staff.id},staff')
+
+    def test_summary_counts_votes_per_choice(self):
+        """Summary mode gives one JSON line per choice, including choices with no votes."""
+        self.client.force_login(self.staff)
+        _, body = self.download(summary=1, format='jsonl')
+        self.assertEqual([json.loads(line)['votes'] for line in body.splitlines()], [1, 0])
+
+    def test_summary_keeps_counts_of_archived_polls(self):
+        """Choices of a poll whose votes were archived to a file still export their counts."""
+        self.question.end_date = timezone.now() - datetime.timedelta(days=1)
+        self.question.save()
+        call_command('archive_polls', '--closed-for', '0', '--move-votes', tempfile.mkdtemp(), stdout=StringIO())
+        self.assertFalse(Vote.objects.exists())
+        self.client.force_login(self.staff)
+        _, body = self.download(summary=1, format='jsonl')
+        self.assertEqual([json.loads(line)['votes'] for line in body.splitlines()], [1, 0])
+
+    def test_export_command(self):
+        """export_votes writes the same rows to stdout."""
+        out = StringIO()
+        call_command('export_votes', self.question.id, '--summary', stdout=out)
+        self.assertIn(f'{self.question.id},Export question.,{self.choice.id},Yes,1', out.getvalue())
+
+
+class VoteRollupTests(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user(username="voter", password="FatChance!")
+        self.question = create_question(question_text="Rollup question.", days=-1)
+        self.choice1 = Choice.objects.create(question=self.question, choice_text="One")
+        self.choice2 = Choice.objects.create(question=self.question, choice_text="Two")
+
+    def minute_buckets(self):
+        return dict(VoteRollup.objects.filter(granularity='minute').values_list('choice_id', 'votes'))
+
+    def test_votes_are_timestamped(self):
+        """Changing a vote keeps its creation time and moves its update time."""
+        voting.cast_vote(self.user, self.choice1)
+        first = Vote.objects.get()
+        voting.cast_vote(self.user, self.choice2)
+        vote = Vote.objects.get()
+        self.assertEqual(vote.created_at, first.created_at)
+        self.assertGreater(vote.updated_at, first.updated_at)
+
+    def test_vote_path_maintains_minute_buckets(self):
+        """A changed vote moves one count between the choices' buckets."""
+        voting.cast_vote(self.user, self.choice1)
+        self.assertEqual(self.minute_buckets(), {self.choice1.id: 1})
+        voting.cast_vote(self.user, self.choice2)
+        self.assertEqual(self.minute_buckets(), {self.choice1.id: 0, self.choice2.id: 1})
+
+    def test_compact_folds_old_buckets(self):
+        """Minute buckets past the retention period become one hour bucket with the same total."""
+        now = timezone.now()
+        old = now - datetime.timedelta(hours=settings.POLLS_ROLLUP_MINUTE_HOURS + 2)
+        rollups.record({(self.question.id, self.choice1.id): 2}, now=old)
+        rollups.record({(self.question.id, self.choice1.id): 3}, now=old + datetime.timedelta(minutes=1))
+        rollups.record({(self.question.id, self.choice1.id): 1}, now=now)
+        self.assertEqual(rollups.compact(now), 2)
+        hours = VoteRollup.objects.filter(granularity='hour').values_list('votes', flat=True)
+        self.assertEqual(sum(hours), 5)
+        self.assertEqual(VoteRollup.objects.filter(granularity='minute').count(), 1)
+
+    def test_rebuild_from_votes(self):
+        """rebuild() recreates buckets for votes that bypassed the vote path."""
+        Vote.objects.create(user=self.user, choice=self.choice2)
+        self.assertEqual(rollups.rebuild(), 1)
+        self.assertEqual(self.minute_buckets(), {self.choice2.id: 1})
+
+    def test_timeline_api(self):
+        """The timeline lists buckets with per-choice changes and a running total."""
+        start = datetime.datetime(2026, 1, 1, 9, 0, tzinfo=datetime.timezone.utc)
+        rollups.record({(self.question.id, self.choice1.id): 2}, now=start + datetime.timedelta(minutes=5))
+        rollups.record({(self.question.id, self.choice2.id): 1}, now=start + datetime.timedelta(hours=1))
+        url = reverse('polls:results_timeline', args=(self.question.id,))
+        data = self.client.get(url, {'granularity': 'hour'}).json()
+        self.assertEqual([(b['start'], b['total'], b['cumulative']) for b in data['buckets']], [
+            ('2026-01-01T09:00:00+00:00', 2, 2),
+            ('2026-01-01T10:00:00+00:00', 1, 3),
+        ])
+        self.assertEqual(self.client.get(url, {'granularity': 'week'}).status_code, 400)
+
+
+class AdminTests(TestCase):
+
+    def setUp(self):
+        self.admin = User.objects.create_superuser(username="admin", password="FatChance!")
+        self.client.force_login(self.admin)
+        self.question = create_question(question_text="Admin question.", days=-1)
+        self.choice1 = Choice.objects.create(question=self.question, choice_text="One")
+        self.choice2 = Choice.objects.create(question=self.question, choice_text="Two")
+
+    def add_votes(self, n):
+        start = User.objects.count()
+        users = User.objects.bulk_create([User(username=f'voter{i}') for i in range(start, start + n)])
+        for user in users:
+            voting.cast_vote(user, self.choice1)
+
+    def changelist_queries(self, url):
+        # Load the session and user into the cache first, so only the page's own queries are counted.
+        self.client.get(url)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(queries)
+
+    def test_vote_changelist_query_count_does_not_grow(self):
+        """Listing votes costs the same number of queries for 2 votes as for 20."""
+        url = reverse('admin:polls_vote_changelist')
+        self.add_votes(2)
+        few = self.changelist_queries(url)
+        self.add_votes(18)
+        self.assertEqual(self.changelist_queries(url), few)
+
+    def test_question_changelist_shows_totals(self):
+        """The question list shows choice and vote totals, without a query per question."""
+        self.add_votes(3)
+        url = reverse('admin:polls_question_changelist')
+        one = self.changelist_queries(url)
+        create_question(question_text="Another question.", days=-2)
+        self.assertEqual(self.changelist_queries(url), one)
+        response = self.client.get(url)
+        self.assertContains(response, '<td class="field-choice_count">2</td>', html=True)
+        self.assertContains(response, '<td class="field-total_votes">3</td>', html=True)
+
+    def test_estimated_count_for_large_tables(self):
+        """Unfiltered querysets over the threshold are counted from the table's statistics."""
+        self.add_votes(3)
+        paginator = EstimatedCountPaginator(Vote.objects.all(), 10)
+        paginator.exact_below = 1
+        self.assertEqual(paginator.count, Vote.objects.order_by('-pk').first().pk)
+
+    def test_admin_edits_keep_counters(self):
+        """Changing and deleting votes in the admin goes through the vote path."""
+        self.add_votes(1)
+        vote = Vote.objects.get()
+        self.client.post(reverse('admin:polls_vote_change', args=(vote.pk,)),
+                         {'user': vote.user_id, 'choice': self.choice2.pk})
+        self.choice1.refresh_from_db()
+        self.choice2.refresh_from_db()
+        self.assertEqual((self.choice1.votes, self.choice2.votes), (0, 1))
+        self.client.post(reverse('admin:polls_vote_delete', args=(vote.pk,)), {'post': 'yes'})
+        self.question.refresh_from_db()
+        self.assertFalse(Vote.objects.exists())
+        self.assertEqual(self.question.total_votes, 0)
+
+
+@override_settings(SESSION_ENGINE='django.contrib.sessions.backends.cached_db',
+                   AUTHENTICATION_BACKENDS=['polls.auth.CachedModelBackend'])
+class CachedAuthTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username="cached", password="FatChance!")
+        self.client.login(username="cached", password="FatChance!")
+        self.url = reverse('polls:index')
+
+    def tables_read(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(self.url)
+        self.assertEqual(response.context['user'], self.user)
+        return {table for q in queries for table in ('django_session', 'auth_user') if f'"{table}"' in q['sql']}
+
+    def test_repeat_requests_skip_session_and_user_queries(self):
+        """Once cached, neither the session nor the user is read from the database."""
+        self.tables_read()
+        self.assertEqual(self.tables_read(), set())
+
+    def test_password_change_invalidates_cached_user(self):
+        """A password change logs out other sessions even though the user was cached."""
+        self.tables_read()
+        self.user.set_password("NewChance!")
+        self.user.save()
+        response = self.client.get(self.url)
+        self.assertFalse(response.context['user'].is_authenticated)
+
+    def test_logout_forgets_cached_user(self):
+        """Logging out drops the cached user."""
+        self.tables_read()
+        self.client.post(reverse('logout'))
+        self.assertIsNone(cache.get(auth.USER_KEY.format(self.user.pk)))
+
+    def test_per_process_cache_keeps_sessions_and_users_in_the_database(self):
+        """Without a shared cache, sessions and users are not cached, so logouts reach every worker."""
+        self.assertFalse(project_settings.SHARED_CACHE)
+        self.assertEqual(project_settings.SESSION_ENGINE, 'django.contrib.sessions.backends.db')
+        self.assertEqual(project_settings.AUTHENTICATION_BACKENDS, ['django.contrib.auth.backends.ModelBackend'])
+
+
+class AsyncViewTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username="async", password="FatChance!")
+        self.question = create_question(question_text="Async question.", days=-1)
+        self.choice = Choice.objects.create(question=self.question, choice_text="Yes")
+        self.factory = django.test.AsyncRequestFactory()
+
+    def request(self, method, url, data=None, user=None):
+        request = getattr(self.factory, method)(url, data)
+        request.user = user or AnonymousUser()
+
+        async def auser():
+            return request.user
+
+        request.auser = auser
+        return request
+
+    async def test_async_vote_is_recorded(self):
+        """The async vote view records the vote and redirects to the results."""
+        url = reverse('polls:vote', args=(self.question.id,))
+        response = await views.vote_async(self.request('post', url, {'choice': self.choice.id}, self.user),
+                                          self.question.id)
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(await Vote.objects.filter(user=self.user, choice=self.choice).acount(), 1)
+
+    async def test_async_vote_requires_login(self):
+        """Anonymous voters are sent to the login page."""
+        url = reverse('polls:vote', args=(self.question.id,))
+        response = await views.vote_async(self.request('post', url, {'choice': self.choice.id}), self.question.id)
+        self.assertEqual(response.status_code, 302)
+        self.assertIn(reverse('login'), response.url)
+
+    async def test_async_detail_and_results(self):
+        """The async pages render the same templates as the sync ones."""
+        response = await views.detail_async(self.request('get', '/'), self.question.id)
+        await sync_to_async(response.render)()
+        self.assertContains(response, "Yes")
+        response = await views.results_async(self.request('get', '/'), self.question.id)
+        await sync_to_async(response.render)()
+        self.assertContains(response, "Async question.")
+
+    async def test_server_timing_counts_async_queries(self):
+        """Under ASGI the middleware stays async and still counts the ORM's queries."""
+        async def view(request):
+            await Question.objects.acount()
+            return HttpResponse()
+
+        middleware = ServerTimingMiddleware(view)
+        self.assertTrue(asyncio.iscoroutinefunction(middleware))
+        response = await middleware(self.request('get', '/'))
+        self.assertIn('desc="1 queries"', response['Server-Timing'])
+
+
+class PollScheduleTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.now = timezone.now()
+        self.open = create_question(question_text="Open.", days=-1, end_date=self.now + datetime.timedelta(hours=1))
+        self.upcoming = create_question(question_text="Upcoming.", days=2)
+        self.closed = create_question(question_text="Closed.", days=-3, end_date=self.now - datetime.timedelta(days=1))
+
+    def test_status_lookups(self):
+        """The schedule sorts questions into open, upcoming and closed like can_vote()."""
+        self.assertEqual(schedule.open_ids(self.now), {self.open.id})
+        self.assertEqual([schedule.status(q.id, self.now) for q in (self.open, self.upcoming, self.closed)],
+                         [schedule.OPEN, schedule.UPCOMING, schedule.CLOSED])
+
+    @override_settings(POLLS_SCHEDULE_CACHE_TIMEOUT=86400)
+    def test_schedule_is_cached_until_the_next_boundary(self):
+        """Lookups before the next transition run no queries; the first one after it rebuilds."""
+        schedule.get(self.now)
+        with self.assertNumQueries(0):
+            self.assertTrue(schedule.is_open(self.open.id, self.now + datetime.timedelta(minutes=59)))
+        self.assertFalse(schedule.is_open(self.open.id, self.now + datetime.timedelta(hours=1, seconds=1)))
+
+    def test_schedule_expires_after_the_cache_timeout(self):
+        """Questions created without signals, e.g. by another process, show up once the schedule expires."""
+        schedule.get(self.now)
+        added = Question.objects.bulk_create([Question(question_text="Elsewhere.", pub_date=self.now)])[0]
+        self.assertFalse(schedule.is_open(added.id, self.now + datetime.timedelta(seconds=1)))
+        later = self.now + datetime.timedelta(seconds=settings.POLLS_SCHEDULE_CACHE_TIMEOUT)
+        self.assertTrue(schedule.is_open(added.id, later))
+
+    def test_editing_a_question_rebuilds_the_schedule(self):
+        """Saving a question drops the cached schedule."""
+        schedule.get(self.now)
+        self.closed.end_date = None
+        self.closed.save()
+        self.assertTrue(schedule.is_open(self.closed.id))
+
+    def test_vote_on_closed_poll_is_refused(self):
+        """The vote gate rejects polls that are not open."""
+        user = User.objects.create_user(username="late", password="FatChance!")
+        choice = Choice.objects.create(question=self.closed, choice_text="Too late")
+        self.client.force_login(user)
+        response = self.client.post(reverse('polls:vote', args=(self.closed.id,)), {'choice': choice.id})
+        self.assertRedirects(response, reverse('polls:index'))
+        self.assertFalse(Vote.objects.exists())
+
+
+class LeaderboardTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.users = User.objects.bulk_create([User(username=f'fan{n}') for n in range(3)])
+        self.busy = create_question(question_text="Busy poll.", days=-1)
+        self.quiet = create_question(question_text="Quiet poll.", days=-1)
+        self.busy_choice = Choice.objects.create(question=self.busy, choice_text="Yes")
+        self.quiet_choice = Choice.objects.create(question=self.quiet, choice_text="Yes")
+
+    def vote(self, user, choice):
+        with self.captureOnCommitCallbacks(execute=True):
+            voting.cast_vote(user, choice)
+
+    def test_votes_update_the_rankings(self):
+        """Votes show in the totals at once and in the order once the cached rankings expire."""
+        self.vote(self.users[0], self.quiet_choice)
+        leaderboard.top('total')
+        for user in self.users:
+            self.vote(user, self.busy_choice)
+        with self.assertNumQueries(1):
+            top = leaderboard.top('total')
+        self.assertEqual([(e['question_id'], e['total_votes']) for e in top], [(self.quiet.id, 1)])
+        cache.delete(leaderboard.BOARD_KEY)
+        top = leaderboard.top('total')
+        self.assertEqual([(e['question_id'], e['total_votes']) for e in top], [(self.busy.id, 3), (self.quiet.id, 1)])
+
+    def test_votes_leave_the_board_alone(self):
+        """The vote path neither rewrites the cached board nor rebuilds a missing one."""
+        with mock.patch.object(leaderboard, 'build', wraps=leaderboard.build) as build:
+            self.vote(self.users[0], self.busy_choice)
+        build.assert_not_called()
+        self.assertIsNone(cache.get(leaderboard.BOARD_KEY))
+
+    def test_trending_score_decays(self):
+        """Older votes weigh less: a vote one half-life old counts half."""
+        now = timezone.now()
+        half_life = datetime.timedelta(hours=settings.POLLS_TRENDING_HALF_LIFE_HOURS)
+        board = leaderboard.Board({self.busy.id: 2, self.quiet.id: 1}, {
+            self.busy.id: leaderboard._log_weight(now - half_life, 2),
+            self.quiet.id: leaderboard._log_weight(now),
+        })
+        cache.set(leaderboard.BOARD_KEY, board, None)
+        scores = {e['question_id']: e['trending_score'] for e in leaderboard.top('trending', now=now)}
+        self.assertAlmostEqual(scores[self.busy.id], 1.0)
+        self.assertAlmostEqual(scores[self.quiet.id], 1.0)
+
+    def test_rebuild_command_refreshes_the_board(self):
+        """rebuild_leaderboard ranks the votes cast since the cached board was built."""
+        leaderboard.get_board()
+        for user in self.users[:2]:
+            self.vote(user, self.quiet_choice)
+        out = StringIO()
+        err = StringIO()
+        call_command('rebuild_leaderboard', stdout=out, stderr=err)
+        self.assertEqual(leaderboard.get_board().totals, {self.quiet.id: 2})
+        self.assertIn('Ranked 1 question(s)', out.getvalue())
+        # The test cache is LocMemCache, which a separate command process could not reach.
+        self.assertIn('private to this process', err.getvalue())
+
+    def test_leaderboard_api(self):
+        """The API returns the requested ranking, capped at the requested size."""
+        self.vote(self.users[0], self.busy_choice)
+        data = self.client.get(reverse('polls:leaderboard_api'), {'by': 'trending', 'limit': 1}).json()
+        self.assertEqual(data['ranking'], 'trending')
+        self.assertEqual([e['question_text'] for e in data['questions']], ["Busy poll."])
+        self.assertContains(self.client.get(reverse('polls:leaderboard')), "Busy poll.")
+
+
+class ArchiveTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.question = create_question(question_text="Old poll.", days=-30,
+                                        end_date=timezone.now() - datetime.timedelta(days=10))
+        self.yes = Choice.objects.create(question=self.question, choice_text="Yes")
+        self.no = Choice.objects.create(question=self.question, choice_text="No")
+        with self.captureOnCommitCallbacks(execute=True):
+            for n in range(3):
+                user = User.objects.create_user(username=f"archived{n}", password="FatChance!")
+                voting.cast_vote(user, self.yes if n else self.no)
+        self.directory = tempfile.mkdtemp()
+
+    def test_archive_snapshots_results_and_moves_votes(self):
+        """Archived results come from the snapshot after the votes have moved to a file."""
+        before = tallies.tally(self.question.id)
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command('archive_polls', '--move-votes', self.directory, stdout=StringIO())
+        self.assertFalse(Vote.objects.filter(question=self.question).exists())
+        cache.clear()
+        with self.assertNumQueries(1):
+            self.assertEqual(tallies.get_results(self.question.id), before)
+        response = self.client.get(reverse('polls:results', args=(self.question.id,)))
+        self.assertEqual(response.context['results']['total'], 3)
+        with gzip.open(self.question.snapshot.archive_file, 'rt') as fh:
+            self.assertEqual(len(fh.readlines()), 3)
+
+    def test_recent_and_archived_questions_are_skipped(self):
+        """Only questions closed for --closed-for days without a snapshot are archived."""
+        call_command('archive_polls', '--closed-for', '30', stdout=StringIO())
+        self.assertFalse(ResultSnapshot.objects.exists())
+        call_command('archive_polls', stdout=StringIO())
+        out = StringIO()
+        call_command('archive_polls', stdout=out)
+        self.assertIn('Archived 0 question(s).', out.getvalue())
+
+    def test_archived_polls_cannot_be_reopened(self):
+        """Moving an archived poll's end_date into the future does not open it for voting."""
+        call_command('archive_polls', stdout=StringIO())
+        self.question.end_date = timezone.now() + datetime.timedelta(days=7)
+        self.question.save()
+        self.assertEqual(schedule.status(self.question.id), schedule.CLOSED)
+        user = User.objects.create_user(username="reopener", password="FatChance!")
+        self.client.force_login(user)
+        response = self.client.post(reverse('polls:vote', args=(self.question.id,)), {'choice': self.yes.id})
+        self.assertRedirects(response, reverse('polls:index'))
+        self.assertFalse(Vote.objects.filter(user=user).exists())
+
+    def test_reconcile_keeps_counters_of_archived_questions(self):
+        """reconcile_votes does not zero the counters of a question whose votes moved out."""
+        call_command('archive_polls', '--move-votes', self.directory, stdout=StringIO())
+        call_command('reconcile_votes', stdout=StringIO())
+        self.question.refresh_from_db()
+        self.assertEqual(self.question.total_votes, 3)
+
+
+@override_settings(POLLS_RATE_LIMITS={'vote': {'RATE': 6, 'BURST': 2}, 'signup': {'RATE': 6, 'BURST': 1}},
+                   POLLS_RATE_LIMIT_IP_FACTOR=2)
+class RateLimitTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username="hammer", password="FatChance!")
+        question = create_question(question_text="Limited poll.", days=-1)
+        self.choice = Choice.objects.create(question=question, choice_text="Yes")
+        self.url = reverse('polls:vote', args=(question.id,))
+
+    def test_votes_beyond_the_burst_are_rejected(self):
+        """Once a user's bucket is empty, votes get a 429 with Retry-After and are counted."""
+        self.client.force_login(self.user)
+        statuses = [self.client.post(self.url, {'choice': self.choice.id}).status_code for _ in range(3)]
+        self.assertEqual(statuses, [302, 302, 429])
+        response = self.client.post(self.url, {'choice': self.choice.id})
+        self.assertEqual(response['Retry-After'], '10')
+        self.assertEqual(ratelimit.stats()['vote'], {'rejected': 2})
+
+    def test_buckets_refill_over_time(self):
+        """A token comes back after 60 / RATE seconds."""
+        self.assertEqual(ratelimit.take('vote', self.user, '10.0.0.1', now=0), 0)
+        self.assertEqual(ratelimit.take('vote', self.user, '10.0.0.1', now=0), 0)
+        self.assertEqual(ratelimit.take('vote', self.user, '10.0.0.1', now=5), 5)
+        self.assertEqual(ratelimit.take('vote', self.user, '10.0.0.1', now=10), 0)
+
+    def test_address_bucket_is_shared_by_users(self):
+        """Different users behind one address share its larger bucket."""
+        users = [User.objects.create_user(username=f"shared{n}", password="FatChance!") for n in range(5)]
+        allowed = [ratelimit.take('vote', user, '10.0.0.2', now=0) == 0 for user in users]
+        self.assertEqual(allowed, [True, True, True, True, False])
+
+    def test_signup_is_limited_per_address(self):
+        """Anonymous signups are limited by address; showing the form is not."""
+        url = reverse('signup')
+        self.assertEqual(self.client.post(url, {}).status_code, 200)
+        self.assertEqual(self.client.post(url, {}).status_code, 200)
+        self.assertEqual(self.client.post(url, {}).status_code, 429)
+        self.assertEqual(self.client.get(url).status_code, 200)
+
+    def test_stats_are_for_staff(self):
+        """The rejection counters are served as JSON to staff only."""
+        self.client.force_login(self.user)
+        self.assertEqual(self.client.get(reverse('polls:ratelimit_stats')).status_code, 302)
+        self.client.force_login(User.objects.create_user(username="ops", password="FatChance!", is_staff=True))
+        data = self.client.get(reverse('polls:ratelimit_stats')).json()
+        self.assertEqual(data['scopes']['signup'], {'rejected': 0})
+
+
+class ProfilingTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.directory = tempfile.mkdtemp()
+        self.staff = User.objects.create_user(username="profiler", password="FatChance!", is_staff=True)
+        create_question(question_text="Profiled poll.", days=-1)
+
+    def profile(self, **headers):
+        with override_settings(PROFILE_DIR=self.directory, PROFILE_KEEP=2):
+            return self.client.get(reverse('polls:index'), {'_profile': '1'} if not headers else {}, **headers)
+
+    def test_staff_requests_are_profiled_with_sql_origins(self):
+        """The profile and SQL log are saved, each statement with the code that ran it."""
+        self.client.force_login(self.staff)
+        response = self.profile()
+        profile_id = response['X-Profile-Id']
+        self.assertTrue(os.path.exists(os.path.join(self.directory, f'{profile_id}.prof')))
+        with override_settings(PROFILE_DIR=self.directory):
+            saved = profiling.load(profile_id)
+            self.assertEqual(saved['path'], '/polls/?_profile=1')
+            stacks = [frame for query in saved['queries'] for frame in query['stack']]
+            self.assertTrue(any(frame.startswith('polls/views.py') for frame in stacks))
+            page = self.client.get(reverse('profile_detail', args=(profile_id,)))
+        self.assertContains(page, 'Functions by cumulative')
+
+    def test_admin_index_links_to_profiles(self):
+        """Staff reach the saved profiles from the admin index."""
+        self.client.force_login(self.staff)
+        response = self.client.get(reverse('admin:index'))
+        self.assertContains(response, f'href="{reverse("profiles")}"')
+
+    def test_other_users_are_not_profiled(self):
+        """Without staff status the parameter and header are ignored."""
+        self.client.force_login(User.objects.create_user(username="curious", password="FatChance!"))
+        self.assertNotIn('X-Profile-Id', self.profile())
+        self.assertNotIn('X-Profile-Id', self.profile(HTTP_X_PROFILE='1'))
+        self.assertEqual(os.listdir(self.directory), [])
+
+    def test_only_the_newest_profiles_are_kept(self):
+        """Older profiles are deleted beyond PROFILE_KEEP and the admin lists the rest."""
+        self.client.force_login(self.staff)
+        ids = [self.profile(HTTP_X_PROFILE='1')['X-Profile-Id'] for _ in range(3)]
+        self.assertEqual(len(os.listdir(self.directory)), 4)
+        with override_settings(PROFILE_DIR=self.directory):
+            page = self.client.get(reverse('profiles'))
+        self.assertNotContains(page, ids[0])
+        self.assertContains(page, ids[2])
+
+
+class AuthoringTests(TestCase):
+
+    CSV = (
+        'question_text,pub_date,end_date,choice_1,choice_2,choice_3\n'
+        'Best canteen?,2026-01-05,2026-01-20 18:00,Central,Engineering,\n'
+        'Exam week?,,,Week 8,Week 9,Week 10\n'
+    )
+
+    def setUp(self):
+        cache.clear()
+        self.directory = tempfile.mkdtemp()
+
+    def write(self, name, text):
+        path = os.path.join(self.directory, name)
+        with open(path, 'w') as fh:
+            fh.write(text)
+        return path
+
+    def test_csv_polls_are_created_in_bulk(self):
+        """Each row becomes a question with its non-blank choice columns, in a fixed number of queries."""
+        path = self.write('polls.csv', self.CSV)
+        with self.assertNumQueries(4):
+            call_command('create_polls', path, stdout=StringIO())
+        canteen = Question.objects.get(question_text="Best canteen?")
+        self.assertEqual(list(canteen.choice_set.values_list('choice_text', flat=True)), ["Central", "Engineering"])
+        self.assertEqual(canteen.end_date, timezone.make_aware(datetime.datetime(2026, 1, 20, 18)))
+        self.assertEqual(Question.objects.get(question_text="Exam week?").choice_set.count(), 3)
+
+    def test_csv_with_byte_order_mark(self):
+        """A CSV saved by Excel, starting with a byte order mark, reads the same as one without."""
+        path = self.write('polls.csv', '\ufeff' + self.CSV)
+        call_command('create_polls', path, stdout=StringIO())
+        self.assertTrue(Question.objects.filter(question_text="Best canteen?").exists())
+
+    def test_invalid_files_create_nothing(self):
+        """Every problem is reported and no poll is created when any is invalid."""
+        path = self.write('polls.json', json.dumps([
+            {'question_text': "Fine?", 'pub_date': '2026-01-01', 'choices': ["Yes", "No"]},
+            {'question_text': "", 'pub_date': 'soon', 'choices': ["Only"]},
+        ]))
+        with self.assertRaises(CommandError) as raised:
+            call_command('create_polls', path, stdout=StringIO())
+        self.assertIn('Poll 2: question_text is required.', str(raised.exception))
+        self.assertIn('Poll 2: pub_date "soon" is not an ISO 8601 date.', str(raised.exception))
+        self.assertIn('Poll 2: a poll needs at least 2 choices.', str(raised.exception))
+        self.assertFalse(Question.objects.exists())
+
+    def test_new_polls_are_listed_immediately(self):
+        """Creating polls moves the schedule and poll list on, as saving one would."""
+        self.assertEqual(schedule.open_ids(), frozenset())
+        with self.captureOnCommitCallbacks(execute=True):
+            authoring.load(StringIO(self.CSV), 'csv')
+        exam = Question.objects.get(question_text="Exam week?")
+        self.assertTrue(schedule.is_open(exam.id))
+        self.assertContains(self.client.get(reverse('polls:index')), "Exam week?")
+
+    def test_polls_created_elsewhere_open_after_the_schedule_expires(self):
+        """Polls created by another process, whose cache notifications never arrive, open within the timeout."""
+        now = timezone.now()
+        schedule.get(now)
+        # Without running the on-commit callbacks, as when create_polls runs in its own process.
+        authoring.load(StringIO(self.CSV), 'csv')
+        exam = Question.objects.get(question_text="Exam week?")
+        self.assertFalse(schedule.is_open(exam.id, now))
+        later = now + datetime.timedelta(seconds=settings.POLLS_SCHEDULE_CACHE_TIMEOUT)
+        self.assertTrue(schedule.is_open(exam.id, later))
+
+    def test_admin_upload(self):
+        """Staff with add permission upload a file from the question change list."""
+        admin_user = User.objects.create_superuser(username="author", password="FatChance!")
+        self.client.force_login(admin_user)
+        url = reverse('admin:polls_question_upload')
+        self.assertContains(self.client.get(reverse('admin:polls_question_changelist')), url)
+        upload = SimpleUploadedFile('polls.csv', self.CSV.encode())
+        response = self.client.post(url, {'file': upload})
+        self.assertRedirects(response, reverse('admin:polls_question_changelist'))
+        self.assertEqual(Question.objects.count(), 2)
+        bad = SimpleUploadedFile('polls.csv', b'question_text,choice_1\nLonely?,Yes\n')
+        self.assertContains(self.client.post(url, {'file': bad}), 'Poll 1: a poll needs at least 2 choices.')
+
+
+@override_settings(POLLS_READ_REPLICAS=['replica0', 'replica1'])
+class ReplicaRoutingTests(SimpleTestCase):
+
+    def setUp(self):
+        self.router = PrimaryReplicaRouter()
+
+    def test_polls_reads_go_to_replicas(self):
+        """Outside a transaction, polls models are read from a replica and written to the primary."""
+        self.assertIn(self.router.db_for_read(Question), ['replica0', 'replica1'])
+        self.assertEqual(self.router.db_for_write(Vote), 'default')
+        self.assertIsNone(self.router.db_for_read(User))
+
+    def test_reads_inside_a_primary_transaction_stay_on_the_primary(self):
+        """The vote path's locking reads run on the primary."""
+        with mock.patch.object(connection, 'in_atomic_block', True):
+            self.assertEqual(self.router.db_for_read(Vote), 'default')
+
+    def test_pinned_reads_use_the_primary(self):
+        """use_primary() overrides the replica choice."""
+        with use_primary():
+            self.assertEqual(self.router.db_for_read(Question), 'default')
+
+    def test_fresh_results_are_counted_on_the_primary(self):
+        """A tally missed right after a vote is read from the primary, an older one from a replica."""
+        cache.clear()
+        seen = []
+
+        def compute(question_id):
+            seen.append(self.router.db_for_read(Choice))
+            return {'question_id': question_id, 'total': 0, 'choices': []}
+
+        with mock.patch.object(tallies, '_compute', compute):
+            tallies.invalidate(1)
+            tallies.get_results(1)
+            old = time.time_ns() - (settings.POLLS_REPLICA_PIN_SECONDS + 1) * 10**9
+            cache.set(tallies.VERSION_KEY.format(1), old, None)
+            tallies.get_results(1)
+        self.assertEqual(seen[0], 'default')
+        self.assertIn(seen[1], ['replica0', 'replica1'])
+
+    def test_schedule_is_built_on_the_primary(self):
+        """The cached schedule never comes from a replica that may lack new questions."""
+        cache.clear()
+        seen = []
+
+        def build(now=None):
+            seen.append(self.router.db_for_read(Question))
+            return {'open': frozenset(), 'upcoming': frozenset(), 'valid_until': timezone.now()}
+
+        with mock.patch.object(schedule, 'build', build):
+            schedule.get()
+        self.assertEqual(seen, ['default'])
+
+    def test_voting_pins_the_user_to_the_primary(self):
+        """A successful POST sets the pin cookie, and requests carrying it read from the primary."""
+        seen = []
+
+        def view(request):
+            seen.append(self.router.db_for_read(Question) if request.method == 'GET' else None)
+            return HttpResponse()
+
+        middleware = PinPrimaryMiddleware(view)
+        factory = django.test.RequestFactory()
+        response = middleware(factory.post('/polls/1/vote/'))
+        self.assertIn(PIN_COOKIE, response.cookies)
+        request = factory.get('/polls/1/results/')
+        request.COOKIES[PIN_COOKIE] = response.cookies[PIN_COOKIE].value
+        middleware(request)
+        self.assertEqual(seen[-1], 'default')
@@ -1,13 +1,34 @@
+from django.conf import settings
 from django.urls import path
 
 from . import views
 
 app_name = 'polls'
+
+if settings.POLLS_ASYNC_VIEWS:
+    # Under an ASGI server these handle requests on the event loop instead of a worker thread.
+    question_views = [
+        path('<int:question_id>/', views.detail_async, name='detail'),
+        path('<int:question_id>/results/', views.results_async, name='results'),
+        path('<int:question_id>/vote/', views.vote_async, name='vote'),
+    ]
+else:
+    question_views = [
+        path('<int:pk>/', views.DetailView.as_view(), name='detail'),
+        path('<int:pk>/results/', views.ResultsView.as_view(), name='results'),
+        path('<int:question_id>/vote/', views.vote, name='vote'),
+    ]
+
 urlpatterns = [
     path('', views.IndexView.as_view(), name='index'),
-    path('<int:pk>/', views.DetailView.as_view(), name='detail'),
-    path('<int:pk>/results/', views.ResultsView.as_view(), name='results'),
-    path('<int:question_id>/vote/', views.vote, name='vote'),
+    *question_views,
+    path('<int:question_id>/results/stream/', views.results_stream, name='results_stream'),
+    path('api/<int:question_id>/results/', views.results_api, name='results_api'),
+    path('api/<int:question_id>/timeline/', views.results_timeline, name='results_timeline'),
+    path('leaderboard/', views.leaderboard_page, name='leaderboard'),
+    path('api/leaderboard/', views.leaderboard_api, name='leaderboard_api'),
+    path('export/', views.export_votes, name='export'),
+    path('api/ratelimit/', views.ratelimit_stats, name='ratelimit_stats'),
     path('<int:question_id>/', views.detail, name='detail'),
 ]
 
@@ -1,34 +1,101 @@
-from django.http import HttpResponseRedirect
-from django.shortcuts import get_object_or_404
+import asyncio
+import datetime
+import json
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.http import HttpResponse, HttpResponseRedirect, JsonResponse, StreamingHttpResponse
+from django.shortcuts import aget_object_or_404, get_object_or_404
+from django.template.response import TemplateResponse
+from django.utils.cache import patch_cache_control
 from django.views import generic
+from django.views.decorators.http import condition
 from django.utils import timezone
-from .models import Choice, Question, Vote
+from . import content, export, leaderboard, live, ratelimit, rollups, schedule, tallies, voting
+from .ratelimit import rate_limit
+from .models import Choice, Question, Vote, VoteRollup
 from django.urls import reverse
 from django.http import Http404
 from django.contrib import messages
+from django.contrib.admin.views.decorators import staff_member_required
 from django.contrib.auth.decorators import login_required
+from django.contrib.auth.views import redirect_to_login
 from django.shortcuts import render, redirect
 
 
+EPOCH = datetime.datetime(1970, 1, 1, tzinfo=datetime.timezone.utc)
+
+
+def encode_cursor(question):
+    """Return the keyset cursor that continues a newest-first listing after ``question``."""
+    return f'{(question.pub_date - EPOCH) // datetime.timedelta(microseconds=1)}-{question.pk}'
+
+
+def decode_cursor(cursor):
+    """Return the (pub_date, pk) pair in a cursor, or None if it is missing or malformed."""
+    try:
+        micros, pk = cursor.split('-')
+        return EPOCH + datetime.timedelta(microseconds=int(micros)), int(pk)
+    except (AttributeError, ValueError, OverflowError):
+        return None
+
+
 class IndexView(generic.ListView):
     """
-    View to display a list of the latest poll questions.
+    View to display a page of published poll questions, newest first.
+
+    Pages are fetched with keyset pagination on (pub_date, id), so every page
+    costs the same whatever its position in the archive.  The ``status`` query
+    parameter narrows the list to open, upcoming or closed polls, and
+    ``before`` holds the cursor of the previous page.
 
     Attributes:
         template_name (str): The template used to render the view.
         context_object_name (str): The name used to pass the list of questions to the template.
+        page_size (int): Number of questions per page.
     """
     template_name = 'polls/index.html'
     context_object_name = 'latest_question_list'
+    page_size = 10
+    statuses = ('open', 'upcoming', 'closed')
 
     def get_queryset(self):
         """
-        Return the last five published questions (not including those set to be published in the future).
+        Return one page of questions matching the requested status.
+
+        Without a status, all published questions are listed (not including
+        those set to be published in the future).
 
         Returns:
-            QuerySet: The list of latest questions.
+            list: The questions on this page, each annotated with ``is_open``.
         """
-        return Question.objects.filter(pub_date__lte=timezone.now()).order_by('-pub_date')[:5]
+        now = timezone.now()
+        status = self.request.GET.get('status')
+        self.status = status if status in self.statuses else ''
+        questions = Question.objects.all()
+        if self.status:
+            questions = getattr(questions, self.status)(now)
+        else:
+            questions = questions.published(now)
+        cursor = decode_cursor(self.request.GET.get('before'))
+        if cursor:
+            questions = questions.before(*cursor)
+        # Fetch one extra row to learn whether another page follows.
+        page = list(questions.order_by('-pub_date', '-id')[:self.page_size + 1])
+        self.next_cursor = encode_cursor(page[self.page_size - 1]) if len(page) > self.page_size else None
+        open_ids = schedule.open_ids(now)
+        for question in page:
+            question.is_open = question.id in open_ids
+        return page[:self.page_size]
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context['status'] = self.status
+        context['next_cursor'] = self.next_cursor
+        context['voted'] = Vote.choices_for(self.request.user, [q.id for q in context['latest_question_list']])
+        context['list_version'] = content.list_version()
+        return context
 
 
 class DetailView(generic.DetailView):
@@ -77,23 +144,14 @@ class DetailView(generic.DetailView):
         except Http404:
             return redirect('polls:index')
 
-        if question.end_date and question.end_date < timezone.now():
+        if schedule.status(question.id) == schedule.CLOSED:
             return HttpResponseRedirect(reverse('polls:index'))
 
         return super().get(request, *args, **kwargs)
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        question = context['question']
-
-        if self.request.user.is_authenticated:
-            try:
-                user_vote = Vote.objects.get(user=self.request.user, choice__question=question)
-                context['user_has_voted'] = True
-                context['selected_choice'] = user_vote.choice
-            except Vote.DoesNotExist:
-                context['user_has_voted'] = False
-
+        context.update(detail_context(context['question'], self.request.user))
         return context
 
 
@@ -108,6 +166,11 @@ class ResultsView(generic.DetailView):
     model = Question
     template_name = 'polls/results.html'
 
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context.update(results_context(context['question'], self.request.user))
+        return context
+
 
 @login_required
 def index(request):
@@ -119,37 +182,236 @@ def index(request):
     return render(request, 'polls/index.html', context)
 
 
+def detail_context(question, user):
+    """Return the template context of the detail page, apart from the question's choices."""
+    selected_choice_id = Vote.choices_for(user, [question.id]).get(question.id)
+    selected_choice = question.choice_set.filter(pk=selected_choice_id).first() if selected_choice_id else None
+    return {
+        'question': question,
+        # Left lazy: the choices are only fetched when the cached fragment has expired.
+        'choices': question.choice_set.all(),
+        'content_version': content.question_version(question.id),
+        'poll_status': schedule.status(question.id),
+        'selected_choice': selected_choice,
+        'user_has_voted': selected_choice is not None,
+    }
+
+
+def results_context(question, user):
+    """Return the template context of the results page."""
+    return {
+        'question': question,
+        'results': tallies.get_results(question.id),
+        'results_version': tallies.get_version(question.id),
+        'content_version': content.question_version(question.id),
+        'user_choice_id': Vote.choices_for(user, [question.id]).get(question.id),
+    }
+
+
 @login_required
 def detail(request, question_id):
     question = get_object_or_404(Question, pk=question_id)
-    selected_choice = None
-
-    # Check if the user has already voted for this question
-    if request.user.is_authenticated:
-        try:
-            selected_choice = Vote.objects.get(user=request.user, choice__question=question).choice
-        except Vote.DoesNotExist:
-            pass
-
-    return render(request, 'polls/detail.html', {'question': question, 'selected_choice': selected_choice})
+    return render(request, 'polls/detail.html', detail_context(question, request.user))
 
 
 def results(request, question_id):
     question = get_object_or_404(Question, pk=question_id)
-    user_choice = None
-    if request.user.is_authenticated:
-        try:
-            user_vote = Vote.objects.get(user=request.user, choice__question=question)
-            user_choice = user_vote.choice
-        except Vote.DoesNotExist:
-            pass
-    return render(request, 'polls/results.html', {'question': question, 'user_choice': user_choice})
+    return render(request, 'polls/results.html', results_context(question, request.user))
+
 
+async def detail_async(request, question_id):
+    """
+    Async version of DetailView, served instead of it when POLLS_ASYNC_VIEWS is on.
+
+    The question is loaded with the async ORM and the page is rendered on a
+    worker thread by the handler, like any TemplateResponse.
+    """
+    question = await aget_object_or_404(Question, pk=question_id)
+    if await sync_to_async(schedule.status)(question.id) == schedule.CLOSED:
+        return HttpResponseRedirect(reverse('polls:index'))
+    user = await request.auser()
+    # The voted lookup mixes cache reads and a query, so it runs as one sync call.
+    context = await sync_to_async(detail_context)(question, user)
+    return TemplateResponse(request, 'polls/detail.html', context)
+
+
+async def results_async(request, question_id):
+    """Async version of ResultsView, served instead of it when POLLS_ASYNC_VIEWS is on."""
+    question = await aget_object_or_404(Question, pk=question_id)
+    user = await request.auser()
+    context = await sync_to_async(results_context)(question, user)
+    return TemplateResponse(request, 'polls/results.html', context)
+
+
+def results_version(request, question_id):
+    """
+    Return a question's results version, or None if there is no such question.
+
+    Versions are only created for questions that exist, so unknown ids never
+    leave keys in the cache or get 304 for a guessed ETag.  The answer is
+    kept on the request, as the ETag, Last-Modified and view all need it.
+    """
+    if not hasattr(request, '_results_version'):
+        exists = Question.objects.filter(pk=question_id).exists()
+        request._results_version = tallies.get_version(question_id) if exists else None
+    return request._results_version
 
+
+def results_etag(request, question_id):
+    version = results_version(request, question_id)
+    return None if version is None else str(version)
+
+
+def results_last_modified(request, question_id):
+    version = results_version(request, question_id)
+    if version is None:
+        return None
+    # Versions are nanosecond timestamps taken when the tally last changed.
+    return datetime.datetime.fromtimestamp(version / 1e9, tz=datetime.timezone.utc)
+
+
+@condition(etag_func=results_etag, last_modified_func=results_last_modified)
+def results_api(request, question_id):
+    """
+    Return a question's vote counts as JSON.
+
+    The ETag is the question's results version, which changes whenever a vote
+    is recorded, so a client that sends it back in If-None-Match gets
+    304 Not Modified without the votes being counted again.
+    """
+    if results_version(request, question_id) is None:
+        raise Http404("This poll does not exist.")
+    response = JsonResponse(tallies.get_results(question_id))
+    patch_cache_control(response, no_cache=True)
+    return response
+
+
+def results_timeline(request, question_id):
+    """
+    Return a question's votes over time as JSON.
+
+    The ``granularity`` query parameter is ``minute``, ``hour`` (the default)
+    or ``day``.  The series is read from the rollup table, not from votes.
+    """
+    granularity = request.GET.get('granularity', 'hour')
+    if granularity not in VoteRollup.GRANULARITIES:
+        return JsonResponse({'error': f'granularity must be one of {", ".join(VoteRollup.GRANULARITIES)}'},
+                            status=400)
+    if not Question.objects.filter(pk=question_id).exists():
+        raise Http404("This poll does not exist.")
+    response = JsonResponse(rollups.series(question_id, granularity))
+    patch_cache_control(response, no_cache=True)
+    return response
+
+
+def leaderboard_params(request):
+    """Return the requested ranking and size, falling back to the defaults."""
+    ranking = request.GET.get('by', 'total')
+    try:
+        limit = min(max(int(request.GET.get('limit', 10)), 1), 100)
+    except ValueError:
+        limit = 10
+    return (ranking if ranking in leaderboard.RANKINGS else 'total'), limit
+
+
+def leaderboard_page(request):
+    """Show the most active polls and the polls trending now."""
+    _, limit = leaderboard_params(request)
+    return render(request, 'polls/leaderboard.html', {
+        'most_active': leaderboard.top('total', limit),
+        'trending': leaderboard.top('trending', limit),
+    })
+
+
+def leaderboard_api(request):
+    """
+    Return the top polls as JSON.
+
+    ``by`` is ``total`` (most votes, the default) or ``trending`` (most
+    recent activity), and ``limit`` the number of polls, at most 100.
+    """
+    ranking, limit = leaderboard_params(request)
+    return JsonResponse({'ranking': ranking, 'questions': leaderboard.top(ranking, limit)})
+
+
+@staff_member_required
+def export_votes(request):
+    """
+    Download votes, or per-choice totals with ``summary=1``, as CSV or JSONL.
+
+    Repeat the ``question`` parameter to export several questions; leave it
+    out to export all of them.  Rows are streamed from a database iterator,
+    so the export runs in constant memory however many votes there are,
+    under ASGI as well as WSGI.
+    """
+    file_format = request.GET.get('format', 'csv')
+    if file_format not in export.FORMATS:
+        return HttpResponse(f'Unknown format "{file_format}".', status=400)
+    try:
+        question_ids = [int(pk) for pk in request.GET.getlist('question')] or None
+    except ValueError:
+        return HttpResponse('Question ids must be integers.', status=400)
+    summary = request.GET.get('summary') == '1'
+    columns, values = export.rows(question_ids, summary=summary)
+    content_type = 'text/csv' if file_format == 'csv' else 'application/x-ndjson'
+    lines = export.encode(file_format, columns, values)
+    if isinstance(request, ASGIRequest):
+        lines = export.aiterate(lines)
+    response = StreamingHttpResponse(lines, content_type=content_type)
+    filename = f'{"results" if summary else "votes"}.{file_format}'
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
+
+
+@staff_member_required
+def ratelimit_stats(request):
+    """Return the number of requests each rate limit has rejected, for monitoring."""
+    return JsonResponse({'scopes': ratelimit.stats()})
+
+
+async def results_stream(request, question_id):
+    """
+    Stream a question's vote counts as Server-Sent Events.
+
+    The current tally is sent on connect and again whenever votes change it.
+    Under WSGI the stream would tie up a worker thread forever, so it answers
+    204 No Content instead, which tells EventSource clients not to reconnect.
+    """
+    if not isinstance(request, ASGIRequest):
+        return HttpResponse(status=204)
+    if not await Question.objects.filter(pk=question_id).aexists():
+        raise Http404("This poll does not exist.")
+    response = StreamingHttpResponse(_results_events(question_id), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
+async def _results_events(question_id):
+    subscription = live.broadcaster.subscribe(question_id)
+    try:
+        results = await sync_to_async(tallies.get_results)(question_id)
+        while True:
+            yield f'event: results\ndata: {json.dumps(results)}\n\n'
+            while True:
+                try:
+                    results = await asyncio.wait_for(subscription.get(), settings.POLLS_LIVE_RESULTS_KEEPALIVE)
+                    break
+                except asyncio.TimeoutError:
+                    # A comment line keeps proxies from closing an idle stream.
+                    yield ': keep-alive\n\n'
+    finally:
+        subscription.close()
+
+
+@rate_limit('vote')
 @login_required
 def vote(request, question_id):
     """Handles the voting for a question's choices."""
     question = get_object_or_404(Question, pk=question_id)
+    if not schedule.is_open(question.id):
+        messages.error(request, "Voting is not allowed for this poll.")
+        return redirect('polls:index')
 
     try:
         selected_choice = question.choice_set.get(pk=request.POST['choice'])
@@ -157,22 +419,40 @@ def vote(request, question_id):
         # Redisplay the question voting form with an error message.
         return render(request, 'polls/detail.html', {
             'question': question,
+            'choices': question.choice_set.all(),
+            'content_version': content.question_version(question.id),
+            'poll_status': schedule.OPEN,
         })
-    this_user = request.user
+    voting.submit_vote(request.user, selected_choice)
+    next_url = request.POST.get('next', reverse('polls:results', args=(question.id,)))
+    return HttpResponseRedirect(next_url)
 
+
+@rate_limit('vote')
+async def vote_async(request, question_id):
+    """
+    Async version of :func:`vote`, served instead of it when POLLS_ASYNC_VIEWS is on.
+
+    The user, question and choice are loaded without leaving the event loop;
+    only the vote itself, which needs a transaction and row locks, runs on a
+    worker thread.
+    """
+    user = await request.auser()
+    if not user.is_authenticated:
+        return redirect_to_login(request.get_full_path())
+    question = await aget_object_or_404(Question, pk=question_id)
+    if not await sync_to_async(schedule.is_open)(question.id):
+        await sync_to_async(messages.error)(request, "Voting is not allowed for this poll.")
+        return redirect('polls:index')
     try:
-        # Find a vote for this user and this question.
-        vote = Vote.objects.get(user=this_user, choice__question=question)
-        vote.choice = selected_choice
-    except Vote.DoesNotExist:
-        # No matching vote - create a new vote.
-        vote = Vote(user=this_user, choice=selected_choice)
-
-    vote = Vote.get_vote(question=question, user=this_user)
-    if vote:
-        vote.choice = selected_choice
-    else:
-        vote = Vote(user=this_user, choice=selected_choice)
-    vote.save()
+        selected_choice = await question.choice_set.aget(pk=request.POST['choice'])
+    except (KeyError, ValueError, Choice.DoesNotExist):
+        return TemplateResponse(request, 'polls/detail.html', {
+            'question': question,
+            'choices': question.choice_set.all(),
+            'content_version': content.question_version(question.id),
+            'poll_status': schedule.OPEN,
+        })
+    await sync_to_async(voting.submit_vote)(user, selected_choice)
     next_url = request.POST.get('next', reverse('polls:results', args=(question.id,)))
     return HttpResponseRedirect(next_url)
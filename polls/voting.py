@@ -0,0 +1,175 @@
+"""
+The vote write path.
+
+A user's existing vote row is read under a row lock and updated; a first
+vote is inserted in a savepoint.  If a concurrent first vote by the same
+user wins the race, the (user, question) unique constraint rejects the
+insert, and the vote is re-read and applied as a change instead.  Either
+way each vote moves the counters exactly once: the vote counters and the
+minute rollup buckets are adjusted in the same transaction.
+"""
+from collections import defaultdict
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from . import live, rollups, tallies
+from .models import Choice, Question, Vote
+
+
+def submit_vote(user, choice):
+    """Cast a vote now, or queue it when write-behind ingestion is enabled."""
+    if settings.POLLS_VOTE_BUFFER['ENABLED']:
+        from .buffer import get_buffer
+        get_buffer().submit(user.pk, choice.question_id, choice.pk)
+    else:
+        cast_vote(user, choice)
+
+
+def cast_vote(user, choice):
+    """
+    Record ``user``'s vote for ``choice``, replacing any earlier vote on the same question.
+
+    Returns:
+        int or None: The id of the previously selected choice, or None if this is the user's first vote.
+    """
+    question_id = choice.question_id
+    key = (user.pk, question_id)
+    with transaction.atomic():
+        previous_choice_id = _locked_choice(user.pk, question_id)
+        if previous_choice_id is None:
+            try:
+                with transaction.atomic():
+                    Vote.objects.create(user=user, question_id=question_id, choice=choice)
+            except IntegrityError:
+                # A concurrent first vote by the same user inserted the row first; change it instead.
+                previous_choice_id = _locked_choice(user.pk, question_id)
+            else:
+                _update_counters({key: choice.pk}, {})
+                return None
+        if previous_choice_id == choice.pk:
+            return previous_choice_id
+        Vote.objects.filter(user=user, question_id=question_id).update(choice=choice, updated_at=timezone.now())
+        _update_counters({key: choice.pk}, {key: previous_choice_id})
+    return previous_choice_id
+
+
+def _locked_choice(user_id, question_id):
+    """Return the user's current choice on a question, locking the vote row, or None."""
+    return (Vote.objects.select_for_update()
+            .filter(user_id=user_id, question_id=question_id)
+            .values_list('choice_id', flat=True)
+            .first())
+
+
+def record_votes(votes, batch_size=500):
+    """
+    Write a batch of votes in one transaction.
+
+    Args:
+        votes (dict): Maps ``(user_id, question_id)`` to the chosen choice id.
+            Votes whose choice or user has since been deleted are dropped.
+
+    Returns:
+        int: The number of votes that were new or changed.
+    """
+    if not votes:
+        return 0
+    with transaction.atomic():
+        live_choices = set(Choice.objects.filter(pk__in=set(votes.values())).values_list('pk', flat=True))
+        live_users = set(User.objects.filter(pk__in={user_id for user_id, _ in votes}).values_list('pk', flat=True))
+        votes = {(user_id, question_id): choice_id for (user_id, question_id), choice_id in votes.items()
+                 if choice_id in live_choices and user_id in live_users}
+        user_ids = {user_id for user_id, _ in votes}
+        question_ids = {question_id for _, question_id in votes}
+        while True:
+            existing = (Vote.objects.select_for_update()
+                        .filter(user_id__in=user_ids, question_id__in=question_ids)
+                        .values_list('user_id', 'question_id', 'choice_id'))
+            previous = {(u, q): c for u, q, c in existing if (u, q) in votes}
+            changed = {key: choice_id for key, choice_id in votes.items() if previous.get(key) != choice_id}
+            try:
+                with transaction.atomic():
+                    Vote.objects.bulk_create(
+                        [Vote(user_id=u, question_id=q, choice_id=c)
+                         for (u, q), c in changed.items() if (u, q) not in previous],
+                        batch_size=batch_size,
+                    )
+            except IntegrityError:
+                # Another transaction voted for one of these users first; classify the batch again.
+                continue
+            break
+        # The remaining rows exist and are locked, so these are plain updates.
+        updated = [Vote(user_id=u, question_id=q, choice_id=c) for (u, q), c in changed.items() if (u, q) in previous]
+        Vote.objects.bulk_create(
+            updated,
+            batch_size=batch_size,
+            update_conflicts=True,
+            unique_fields=['user', 'question'],
+            update_fields=['choice', 'updated_at'],
+        )
+        _update_counters(changed, previous)
+    return len(changed)
+
+
+def retract_votes(votes):
+    """
+    Delete votes and take them off the counters and rollups.
+
+    Args:
+        votes (QuerySet): The Vote rows to delete.
+
+    Returns:
+        int: The number of votes deleted.
+    """
+    with transaction.atomic():
+        rows = list(votes.select_for_update().values_list('pk', 'user_id', 'question_id', 'choice_id'))
+        Vote.objects.filter(pk__in=[pk for pk, _, _, _ in rows]).delete()
+        _update_counters({}, {}, removed={(u, q): c for _, u, q, c in rows})
+    return len(rows)
+
+
+def _update_counters(changed, previous, removed=None):
+    """
+    Apply the counter and rollup changes for a set of new, changed or ``removed`` votes.
+
+    Rows that move by the same amount share a single UPDATE, so a batch
+    costs a handful of statements however many votes it holds.
+    """
+    choice_deltas = defaultdict(int)
+    question_deltas = defaultdict(int)
+    rollup_deltas = defaultdict(int)
+    for key, choice_id in changed.items():
+        choice_deltas[choice_id] += 1
+        rollup_deltas[key[1], choice_id] += 1
+        if key in previous:
+            choice_deltas[previous[key]] -= 1
+            rollup_deltas[key[1], previous[key]] -= 1
+        else:
+            question_deltas[key[1]] += 1
+    removed = removed or {}
+    for (_, question_id), choice_id in removed.items():
+        choice_deltas[choice_id] -= 1
+        question_deltas[question_id] -= 1
+        rollup_deltas[question_id, choice_id] -= 1
+    for model, field, deltas in ((Choice, 'votes', choice_deltas), (Question, 'total_votes', question_deltas)):
+        by_delta = defaultdict(list)
+        for pk, delta in deltas.items():
+            if delta:
+                by_delta[delta].append(pk)
+        for delta, pks in by_delta.items():
+            model.objects.filter(pk__in=pks).update(**{field: F(field) + delta})
+    rollups.record(rollup_deltas)
+    user_ids = {user_id for user_id, _ in [*changed, *removed]}
+    question_ids = {question_id for _, question_id in [*changed, *removed]}
+
+    def invalidate_caches():
+        Vote.forget_choices(user_ids)
+        for question_id in question_ids:
+            tallies.invalidate(question_id)
+            live.broadcaster.notify(question_id)
+
+    transaction.on_commit(invalidate_caches)